@@ -0,0 +1,82 @@
+"""
+Callback Query Answers for Telegram Games Bot
+=============================================
+
+Every tap on an inline button is a callback query, and Telegram shows a
+spinner on the button until the bot answers it. Handlers used to start with
+`await query.answer()`, so each tap paid a full Bot API round trip before
+its own work began, and a tap that ended in an alert answered twice.
+
+`CallbackRouter` now answers every query it dispatches exactly once, in the
+background. The answer request starts at the handler's first await, so the
+answer travels together with the handler's edit instead of before it, and
+the router waits for it only once the handler is done. Handlers never call
+`query.answer()`; to show an alert they call `alert(query, text)` before
+their first await, which folds the alert into that single answer.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from telegram import CallbackQuery
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# query id -> answer of the callback queries being handled
+_PENDING: Dict[str, 'CallbackAnswer'] = {}
+# Alerts answered outside the router, kept until sent so they are not garbage-collected
+_DETACHED: Set[asyncio.Task] = set()
+
+
+class CallbackAnswer:
+    """The single answer of a callback query, sent while its handler runs"""
+
+    def __init__(self, query: CallbackQuery):
+        self.query = query
+        self.text: Optional[str] = None
+        self.show_alert = False
+        self.sent = False
+        # Runs once the handler first awaits, taking whatever alert was set by then
+        self.task = asyncio.ensure_future(self._send())
+
+    def alert(self, text: str) -> None:
+        """Show text in an alert box with the answer"""
+        if self.sent:
+            logger.warning(f"Alert {text!r} came after the answer of callback query {self.query.id}")
+            return
+        self.text, self.show_alert = text, True
+
+    async def _send(self) -> None:
+        self.sent = True
+        try:
+            await self.query.answer(self.text, show_alert=self.show_alert)
+        except TelegramError as e:
+            # An unanswered query only keeps its spinner for a while; the handler's work stands
+            logger.warning(f"Answering callback query {self.query.id} failed: {e}")
+
+
+def begin(query: CallbackQuery) -> CallbackAnswer:
+    """Start the answer of a query that is about to be handled"""
+    answer = _PENDING[query.id] = CallbackAnswer(query)
+    return answer
+
+
+async def finish(answer: CallbackAnswer) -> None:
+    """Wait for the answer of a handled query"""
+    _PENDING.pop(answer.query.id, None)
+    await answer.task
+
+
+def alert(query: CallbackQuery, text: str) -> None:
+    """Fold an alert into the answer of a query being handled (or answer it with the alert)"""
+    answer = _PENDING.get(query.id)
+    if answer is not None:
+        answer.alert(text)
+        return
+    # Sent on its own, with a failure logged like any other answer
+    answer = CallbackAnswer(query)
+    answer.alert(text)
+    _DETACHED.add(answer.task)
+    answer.task.add_done_callback(_DETACHED.discard)
@@ -0,0 +1,162 @@
+"""
+Autobet for Telegram Games Bot
+==============================
+
+Plays the same Keno ticket or Crash bet for many rounds from one command,
+`/autokeno <rounds> <bet> <numbers>` or `/autocrash <rounds> <bet> <target>`,
+optionally ending early with `loss=<credits>` (stop-loss) and
+`profit=<credits>` (take-profit).
+
+All rounds are drawn and settled in one vectorized call against the game
+engine (keno.py, crash.py); the stop rules then pick how many of them were
+played from the running net result. The bot holds every stake up front and
+settles the played rounds with one wallet update, so N rounds cost one
+reservation, one settlement and one summary message instead of N
+conversations. Without NumPy the rounds are played one by one with the same
+rules (rng is then a random.Random rather than a NumPy Generator).
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import crash
+import keno
+import quick_bets
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the vectorized path
+    np = None
+
+KENO_USAGE = ("Autobet: /autokeno <rounds> <bet> <numbers> [loss=<credits>] [profit=<credits>], "
+              "e.g. /autokeno 100 50 3 7 12 loss=1000")
+CRASH_USAGE = ("Autobet: /autocrash <rounds> <bet> <target> [loss=<credits>] [profit=<credits>], "
+               "e.g. /autocrash 100 20 2 profit=500")
+
+# Why a run ended
+ALL_ROUNDS = 'rounds'
+STOP_LOSS = 'loss'
+TAKE_PROFIT = 'profit'
+
+
+class AutobetRules(NamedTuple):
+    """How many rounds to play and when to stop early (None for no limit)"""
+    rounds: int
+    stop_loss: Optional[int] = None
+    take_profit: Optional[int] = None
+
+
+class AutobetResult(NamedTuple):
+    """Outcome of an autobet run"""
+    rounds: int         # rounds played
+    wagered: int
+    won: int
+    wins: int           # rounds that paid more than the bet
+    best: int           # biggest payout of a round
+    stopped: str        # ALL_ROUNDS, STOP_LOSS or TAKE_PROFIT
+    payouts: List[int]  # payout of every played round
+
+    @property
+    def net(self) -> int:
+        return self.won - self.wagered
+
+
+def parse_rules(args: Sequence[str], max_rounds: int) -> Tuple[AutobetRules, List[str]]:
+    """Split `<rounds> ... [loss=<credits>] [profit=<credits>]` into the rules and the bet arguments"""
+    if not args:
+        raise ValueError("Give the number of rounds")
+    try:
+        rounds = int(args[0])
+    except ValueError:
+        raise ValueError(f"'{args[0]}' is not a number of rounds") from None
+    if not 1 <= rounds <= max_rounds:
+        raise ValueError(f"Autobet plays 1 to {max_rounds} rounds")
+
+    limits: Dict[str, int] = {}
+    bet_args = []
+    for text in args[1:]:
+        name, separator, value = text.lower().partition('=')
+        if not separator:
+            bet_args.append(text)
+            continue
+        if name not in (STOP_LOSS, TAKE_PROFIT):
+            raise ValueError(f"Unknown limit '{name}' (use loss= or profit=)")
+        try:
+            limits[name] = int(value)
+        except ValueError:
+            raise ValueError(f"'{value}' is not a valid {name} limit") from None
+        if limits[name] <= 0:
+            raise ValueError(f"The {name} limit must be positive")
+    return AutobetRules(rounds, limits.get(STOP_LOSS), limits.get(TAKE_PROFIT)), bet_args
+
+
+def parse_keno(args: Sequence[str], min_bet: int, max_bet: int, max_rounds: int, total_numbers: int = 20,
+               max_picks: int = 10) -> Tuple[AutobetRules, quick_bets.KenoQuickBet]:
+    """Parse `<rounds> <bet> <numbers...>` plus limits"""
+    rules, bet_args = parse_rules(args, max_rounds)
+    return rules, quick_bets.parse_keno(bet_args, min_bet, max_bet, total_numbers, max_picks)
+
+
+def parse_crash(args: Sequence[str], min_bet: int, max_bet: int, max_rounds: int, min_target: float = 1.1,
+                max_target: float = 10.0) -> Tuple[AutobetRules, quick_bets.CrashQuickBet]:
+    """Parse `<rounds> <bet> <target>` plus limits"""
+    rules, bet_args = parse_rules(args, max_rounds)
+    return rules, quick_bets.parse_crash(bet_args, min_bet, max_bet, min_target, max_target)
+
+
+def summarize(bet_amount: int, winnings, rules: AutobetRules) -> AutobetResult:
+    """Apply the stop rules to the payouts of every drawn round"""
+    if np is not None:
+        winnings = np.asarray(winnings, dtype=np.int64)
+        net = np.cumsum(winnings - bet_amount)
+        stops = np.zeros(len(net), dtype=bool)
+        if rules.stop_loss is not None:
+            stops |= net <= -rules.stop_loss
+        if rules.take_profit is not None:
+            stops |= net >= rules.take_profit
+        played = int(np.argmax(stops)) + 1 if stops.any() else len(net)
+        winnings = winnings[:played]
+        won, wins, best = int(winnings.sum()), int((winnings > bet_amount).sum()), int(winnings.max())
+        final_net = int(net[played - 1])
+        winnings = winnings.tolist()
+    else:
+        played, final_net = len(winnings), 0
+        for index, payout in enumerate(winnings):
+            final_net += payout - bet_amount
+            if ((rules.stop_loss is not None and final_net <= -rules.stop_loss) or
+                    (rules.take_profit is not None and final_net >= rules.take_profit)):
+                played = index + 1
+                break
+        winnings = winnings[:played]
+        won, wins, best = sum(winnings), sum(payout > bet_amount for payout in winnings), max(winnings)
+
+    if rules.stop_loss is not None and final_net <= -rules.stop_loss:
+        stopped = STOP_LOSS
+    elif rules.take_profit is not None and final_net >= rules.take_profit:
+        stopped = TAKE_PROFIT
+    else:
+        stopped = ALL_ROUNDS
+    return AutobetResult(played, played * bet_amount, won, wins, best, stopped, winnings)
+
+
+def play_keno(picks: int, bet_amount: int, rules: AutobetRules, payouts: Dict[int, int], total_numbers: int = 20,
+              drawn_numbers: int = 10, rng=None) -> AutobetResult:
+    """Draw and settle every round of a Keno autobet"""
+    if np is not None:
+        draws = keno.draw_masks(rules.rounds, total_numbers, drawn_numbers, rng)
+        winnings = keno.settle_batch(picks, draws, bet_amount, payouts, total_numbers)
+    else:
+        draws = [keno.draw_mask(total_numbers, drawn_numbers, rng) for _ in range(rules.rounds)]
+        winnings = [keno.payout(bet_amount, keno.count_matches(picks, draw), payouts) for draw in draws]
+    return summarize(bet_amount, winnings, rules)
+
+
+def play_crash(bet_amount: int, target_multiplier: float, rules: AutobetRules,
+               distribution: crash.CrashDistribution = crash.DEFAULT_DISTRIBUTION, rng=None) -> AutobetResult:
+    """Draw and settle every round of a Crash autobet"""
+    if np is not None:
+        points = crash.crash_multipliers(rules.rounds, rng, distribution)
+        winnings = crash.settle_batch(bet_amount, target_multiplier, points)
+    else:
+        winnings = [crash.payout(bet_amount, target_multiplier, distribution.sample(rng))
+                    for _ in range(rules.rounds)]
+    return summarize(bet_amount, winnings, rules)
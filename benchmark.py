@@ -0,0 +1,1020 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for Telegram Games Bot
+=================================
+
+Micro-benchmarks for the bot's hot paths.
+
+Run all of them with `python benchmark.py`, or only some by name:
+`python benchmark.py ledger`.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+def bench_ledger():
+    """Settlements per second with and without ledger group commits"""
+    from user_store import UserStateStore
+    from wallet import WalletLedger
+    
+    print("💾 Wallet ledger: settlements per second")
+    
+    def run(batching: bool, settlements: int, players: int = 8):
+        with tempfile.TemporaryDirectory() as tmp:
+            ledger = WalletLedger(os.path.join(tmp, 'wallet.db'), flush_interval_ms=5, batching=batching)
+            store = UserStateStore(starting_balance=1_000_000, ledger=ledger)
+            per_player = settlements // players
+            
+            def player(user_id):
+                for _ in range(per_player):
+                    store.update_balance(user_id, -10, 'keno_bet')
+                    store.update_balance(user_id, 20, 'keno_payout')
+            
+            threads = [threading.Thread(target=player, args=(user_id,)) for user_id in range(players)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            ledger.flush()
+            elapsed = time.perf_counter() - start
+            ledger.close()
+            return per_player * players / elapsed, ledger.commits
+    
+    rate, commits = run(batching=False, settlements=800)
+    print(f"   Without batching: {rate:>10,.0f} settlements/s ({commits} commits)")
+    rate, commits = run(batching=True, settlements=80_000)
+    print(f"   With batching:    {rate:>10,.0f} settlements/s ({commits} commits)")
+
+
+def bench_reservations():
+    """Reserve-and-settle throughput with players spread across shards"""
+    from user_store import UserStateStore
+    
+    print("🔒 Bet reservations: settlements per second")
+    
+    for players in (1, 8, 64):
+        store = UserStateStore(starting_balance=1_000_000)
+        per_player = 200_000 // players
+        
+        def player(user_id):
+            for _ in range(per_player):
+                reservation = store.reserve(user_id, 10)
+                store.settle(user_id, reservation, 20, 'keno')
+        
+        threads = [threading.Thread(target=player, args=(user_id,)) for user_id in range(players)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"   {players:>3} players: {per_player * players / elapsed:>10,.0f} settlements/s")
+
+
+def bench_keno_keyboard():
+    """Cached Keno grid markup versus rebuilding it on every tap"""
+    import random
+    import timeit
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    import callbacks
+    from keno import numbers_to_mask
+    from keyboards import keno_grid_markup
+    
+    print("⌨️ Keno keyboard: cost per number tap")
+    
+    def build_uncached(selected_numbers):
+        # The per-tap path used before the markup cache
+        keyboard = []
+        for row in range(4):
+            button_row = []
+            for col in range(5):
+                number = row * 5 + col + 1
+                display_text = f"✅{number}" if number in selected_numbers else str(number)
+                button_row.append(InlineKeyboardButton(display_text, callback_data=callbacks.encode(callbacks.KENO_SELECT, number)))
+            keyboard.append(button_row)
+        keyboard.append([
+            InlineKeyboardButton("🎲 PLAY", callback_data=callbacks.encode(callbacks.KENO_PLAY)),
+            InlineKeyboardButton("🔄 Clear All", callback_data=callbacks.encode(callbacks.KENO_CLEAR)),
+            InlineKeyboardButton("❌ Cancel", callback_data=callbacks.encode(callbacks.MAIN_MENU))
+        ])
+        return InlineKeyboardMarkup(keyboard)
+    
+    rng = random.Random(1)
+    selections = [rng.sample(range(1, 21), rng.randint(0, 10)) for _ in range(256)]
+    
+    # The markups must be identical before timing them
+    for selected in selections:
+        if build_uncached(selected) != keno_grid_markup(numbers_to_mask(selected)):
+            raise AssertionError("cached markup differs from the rebuilt one")
+    
+    taps = 20_000
+    uncached = timeit.timeit(lambda: [build_uncached(s) for s in selections], number=taps // 256) / taps
+    cached = timeit.timeit(lambda: [keno_grid_markup(numbers_to_mask(s)) for s in selections], number=taps // 256) / taps
+    print(f"   Rebuilt:  {uncached * 1e6:>8.2f} µs/tap")
+    print(f"   Cached:   {cached * 1e6:>8.2f} µs/tap ({uncached / cached:.0f}x faster)")
+
+
+def bench_keno_settlement():
+    """Keno rounds settled per second: list scans, bitmasks and NumPy batches"""
+    import random
+    from config import KENO_PAYOUTS
+    import keno
+    
+    print("🔢 Keno settlement: rounds per second")
+    
+    rng = random.Random(1)
+    rounds = 100_000
+    tickets = [rng.sample(range(1, 21), rng.randint(1, 10)) for _ in range(rounds)]
+    draws = [rng.sample(range(1, 21), 10) for _ in range(rounds)]
+    
+    start = time.perf_counter()
+    for ticket, draw in zip(tickets, draws):
+        KENO_PAYOUTS.get(len([num for num in ticket if num in draw]), 0) * 10
+    list_rate = rounds / (time.perf_counter() - start)
+    print(f"   List scans:  {list_rate:>12,.0f} rounds/s")
+    
+    ticket_masks = [keno.numbers_to_mask(ticket) for ticket in tickets]
+    draw_masks = [keno.numbers_to_mask(draw) for draw in draws]
+    start = time.perf_counter()
+    for ticket, draw in zip(ticket_masks, draw_masks):
+        keno.payout(10, keno.count_matches(ticket, draw), KENO_PAYOUTS)
+    mask_rate = rounds / (time.perf_counter() - start)
+    print(f"   Bitmasks:    {mask_rate:>12,.0f} rounds/s")
+    
+    if keno.np is None:
+        print("   NumPy batch: skipped (NumPy not installed)")
+        return
+    
+    np = keno.np
+    ticket_array = np.array(ticket_masks, dtype=np.uint32)
+    draw_array = np.array(draw_masks, dtype=np.uint32)
+    table = keno.payout_vector(KENO_PAYOUTS)
+    start = time.perf_counter()
+    for _ in range(10):
+        keno.settle_batch(ticket_array, draw_array, 10, KENO_PAYOUTS, table=table)
+    batch_rate = 10 * rounds / (time.perf_counter() - start)
+    print(f"   NumPy batch: {batch_rate:>12,.0f} rounds/s")
+
+
+def bench_crash_points():
+    """Crash points per second: bucket cascade, inverse CDF and batch draws"""
+    import random
+    import crash
+    
+    print("🚀 Crash points: draws per second")
+    
+    def cascade():
+        # The two-call bucket cascade used before the inverse-CDF engine
+        rand = random.random()
+        if rand < 0.33:
+            return round(random.uniform(1.0, 2.0), 2)
+        elif rand < 0.65:
+            return round(random.uniform(2.0, 4.0), 2)
+        elif rand < 0.85:
+            return round(random.uniform(4.0, 7.0), 2)
+        elif rand < 0.95:
+            return round(random.uniform(7.0, 15.0), 2)
+        return round(random.uniform(15.0, 50.0), 2)
+    
+    draws = 200_000
+    for label, draw in (
+        ("Cascade", cascade),
+        ("Inverse CDF", crash.DEFAULT_DISTRIBUTION.sample),
+        ("House edge", crash.HouseEdgeDistribution(0.01).sample),
+    ):
+        start = time.perf_counter()
+        for _ in range(draws):
+            draw()
+        print(f"   {label + ':':<14}{draws / (time.perf_counter() - start):>14,.0f} points/s")
+    
+    if crash.np is None:
+        print("   Batch:        skipped (NumPy not installed)")
+        return
+    
+    buffer = crash.CrashPointBuffer(crash.DEFAULT_DISTRIBUTION)
+    start = time.perf_counter()
+    for _ in range(draws):
+        buffer.next()
+    print(f"   {'Buffered:':<14}{draws / (time.perf_counter() - start):>14,.0f} points/s")
+    
+    start = time.perf_counter()
+    crash.DEFAULT_DISTRIBUTION.sample_batch(10 * draws)
+    print(f"   {'Batch:':<14}{10 * draws / (time.perf_counter() - start):>14,.0f} points/s")
+
+
+def bench_webhook():
+    """Updates per second and delivery latency: webhook versus long polling"""
+    import asyncio
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, message_update, post_updates
+    from telegram_games_bot import GameBot, build_application
+    from webserver import BotHTTPServer, webhook_route
+    
+    import logging
+    import warnings
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    print("🌐 Update ingestion: webhook versus long polling (fake Bot API)")
+    
+    secret = 'benchmark-secret'
+    
+    async def run(mode: str, latency: float, updates: int, sparse: int):
+        api = FakeBotAPI(latency=latency)
+        application = build_application(GameBot(), token=FAKE_TOKEN, request=api, get_updates_request=api)
+        await application.initialize()
+        await application.start()
+        server = None
+        if mode == 'webhook':
+            server = BotHTTPServer('127.0.0.1', 0)
+            server.add_route('POST', '/telegram', webhook_route(application, secret))
+            await server.start()
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=10)
+        
+        async def deliver(batch):
+            if server is not None:
+                await post_updates(server.port, '/telegram', batch, secret)
+            else:
+                for update in batch:
+                    api.push_update(update)
+        
+        # Every /balance update is answered with exactly one sendMessage
+        update_id = 1
+        burst = [message_update(update_id + i, 1000 + i % 200, "/balance") for i in range(updates)]
+        update_id += updates
+        start = time.perf_counter()
+        await deliver(burst)
+        await api.wait_for_calls('sendMessage', updates)
+        rate = updates / (time.perf_counter() - start)
+        
+        delays = []
+        for i in range(sparse):
+            start = time.perf_counter()
+            await deliver([message_update(update_id + i, 1, "/balance")])
+            await api.wait_for_calls('sendMessage', updates + i + 1)
+            delays.append(time.perf_counter() - start)
+        
+        if server is not None:
+            await server.stop()
+        if application.updater.running:
+            await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        return rate, sum(delays) / len(delays)
+    
+    for latency in (0.0, 0.02):
+        print(f"   Bot API round trip {latency * 1000:.0f} ms:")
+        for mode in ('polling', 'webhook'):
+            updates = 2000 if latency == 0 else 200
+            rate, delay = asyncio.run(run(mode, latency, updates, sparse=20))
+            print(f"      {mode.capitalize() + ':':<9}{rate:>9,.0f} updates/s, {delay * 1000:>6.1f} ms until handled")
+
+
+def bench_metrics():
+    """Cost of handler instrumentation per update"""
+    import asyncio
+    import logging
+    import warnings
+    from telegram import Update
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, message_update
+    from metrics import Metrics
+    from telegram_games_bot import GameBot, build_application
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    print("📈 Metrics: cost per /balance update")
+    
+    async def run(metrics, updates: int = 5000):
+        application = build_application(GameBot(metrics=metrics), token=FAKE_TOKEN, request=FakeBotAPI())
+        await application.initialize()
+        batch = [Update.de_json(message_update(i, 1000 + i % 50, "/balance"), application.bot) for i in range(updates)]
+        start = time.perf_counter()
+        for update in batch:
+            await application.process_update(update)
+        elapsed = time.perf_counter() - start
+        rendered = metrics.render() if metrics is not None else ''
+        await application.shutdown()
+        return elapsed / updates, rendered
+    
+    plain, _ = asyncio.run(run(None))
+    instrumented, rendered = asyncio.run(run(Metrics()))
+    print(f"   Metrics off: {plain * 1e6:>8.1f} µs/update")
+    print(f"   Metrics on:  {instrumented * 1e6:>8.1f} µs/update (+{(instrumented - plain) * 1e6:.1f} µs)")
+    print(f"   Scrape size: {len(rendered):>8,} bytes")
+
+
+def bench_outbox():
+    """Message edits per Keno round with and without the coalescing outbox"""
+    import asyncio
+    import logging
+    import warnings
+    from telegram import Update
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+    from metrics import Metrics
+    from outbox import EditScheduler
+    from telegram_games_bot import GameBot, build_application
+    logging.getLogger('telegram').setLevel(logging.CRITICAL)
+    logging.getLogger('telegram_games_bot').setLevel(logging.CRITICAL)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    print("📤 Outbox: editMessageText calls per Keno round (5 taps 80 ms apart, then PLAY)")
+    print("   Fake Bot API allows about one message per second per chat, bursts of 3")
+    
+    players, rounds, tap_interval = 20, 3, 0.08
+    
+    async def run(outbox):
+        api = FakeBotAPI(latency=0.01, flood_rate=1.0, flood_burst=3)
+        metrics = Metrics()
+        application = build_application(GameBot(metrics=metrics, outbox=outbox), token=FAKE_TOKEN, request=api)
+        await application.initialize()
+        await application.start()
+        
+        async def player(user_id):
+            update_id = user_id * 1000
+            for message_id in range(1, rounds + 1):
+                for text in ("/keno", "50"):
+                    update_id += 1
+                    await application.process_update(Update.de_json(message_update(update_id, user_id, text), application.bot))
+                    await asyncio.sleep(1.0)  # Reading the reply and typing
+                for data in [f"keno_select_{n}" for n in (3, 7, 11, 14, 19)] + ["keno_play"]:
+                    update_id += 1
+                    await application.process_update(
+                        Update.de_json(callback_update(update_id, user_id, data, message_id), application.bot))
+                    await asyncio.sleep(tap_interval)
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(player(1000 + i) for i in range(players)))
+        if outbox is not None:
+            await outbox.flush()
+        elapsed = time.perf_counter() - start
+        await application.stop()
+        await application.shutdown()
+        return api, sum(metrics.settlements.values.values()), elapsed
+    
+    for label, outbox in (("Direct edits", None), ("Outbox", EditScheduler(window=0.05))):
+        api, completed, elapsed = asyncio.run(run(outbox))
+        calls = api.calls['editMessageText']
+        print(f"   {label + ':':<14}{completed:>3}/{players * rounds} rounds completed, {calls / completed:>5.2f} calls/round, "
+              f"{api.rate_limited / completed:>5.2f} × 429/round ({elapsed:.1f}s)")
+        if outbox is not None:
+            print(f"   {'':<14}{outbox.requested / completed:>5.2f} edits requested/round, "
+                  f"{outbox.coalesced / completed:.2f} coalesced/round")
+
+
+def bench_fingerprints():
+    """Edit calls and "message is not modified" errors with and without fingerprints"""
+    import asyncio
+    import logging
+    import warnings
+    from telegram import Update
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+    from telegram_games_bot import GameBot, build_application
+    logging.getLogger('telegram').setLevel(logging.CRITICAL)
+    logging.getLogger('telegram_games_bot').setLevel(logging.CRITICAL)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    print("🧾 Fingerprints: Bot API edit calls for repeated menu taps")
+    
+    # A session where several taps re-render what is already on screen
+    taps = ["check_balance", "check_balance", "main_menu", "main_menu", "show_help", "show_help", "main_menu"]
+    players = 100
+    
+    async def run(use_fingerprints: bool):
+        api = FakeBotAPI()
+        bot = GameBot()
+        if not use_fingerprints:
+            bot.fingerprints = None
+        application = build_application(bot, token=FAKE_TOKEN, request=api)
+        await application.initialize()
+        update_id = 0
+        for user_id in range(1, players + 1):
+            update_id += 1
+            await application.process_update(Update.de_json(message_update(update_id, user_id, "/keno"), application.bot))
+            update_id += 1
+            await application.process_update(Update.de_json(message_update(update_id, user_id, "50"), application.bot))
+            # The fake API numbers sent messages from 1001: the grid is this player's second reply
+            grid_id = 1000 + 2 * user_id
+            for data in ["keno_clear", "keno_select_5", "keno_clear", "keno_clear", "main_menu"] + taps:
+                update_id += 1
+                await application.process_update(
+                    Update.de_json(callback_update(update_id, user_id, data, grid_id), application.bot))
+        await application.shutdown()
+        edits = api.calls['editMessageText'] + api.calls['editMessageReplyMarkup']
+        return edits, api.calls['editMessageReplyMarkup'], api.not_modified, bot.fingerprints
+    
+    taps_per_player = 5 + len(taps)
+    for label, enabled in (("Without cache", False), ("With cache", True)):
+        edits, markup_only, not_modified, cache = asyncio.run(run(enabled))
+        print(f"   {label + ':':<15}{edits / players:>5.2f} edit calls/player "
+              f"({markup_only / players:.2f} markup-only), {not_modified / players:.2f} not-modified errors/player")
+    print(f"   {'':<15}{cache.unchanged / players:.2f} of {taps_per_player} taps skipped per player")
+
+
+def bench_crash_rounds():
+    """Shared Crash round cost per bettor: joining, ticking and settling"""
+    import asyncio
+    import crash
+    from crash_rounds import CrashRoundScheduler
+    from user_store import UserStateStore
+    
+    print("🛫 Shared Crash rounds: one round, many bettors")
+    
+    class FixedPoints:
+        def next(self):
+            return 2.0
+    
+    async def run(bettors):
+        store = UserStateStore(1000, 64)
+        rounds = CrashRoundScheduler(store, FixedPoints(), betting_window=3600.0)
+        reservations = [store.reserve(user_id, 100) for user_id in range(bettors)]
+        targets = [crash.CASHOUT_TARGETS[user_id % len(crash.CASHOUT_TARGETS)] for user_id in range(bettors)]
+        
+        start = time.perf_counter()
+        for user_id in range(bettors):
+            rounds.place_bet(user_id, user_id, 1, 100, targets[user_id], reservations[user_id])
+        join = time.perf_counter() - start
+        crash_round = rounds.next_round
+        
+        ticks, last_edit = 100, {}
+        start = time.perf_counter()
+        for tick in range(ticks):
+            rounds._due(crash_round, tick * rounds.tick_interval, last_edit)
+        tick_cost = (time.perf_counter() - start) / ticks
+        
+        crash_round.crash_point = 2.0
+        start = time.perf_counter()
+        rounds.settle_round(crash_round)
+        batch = time.perf_counter() - start
+        
+        # Per-player settlement, as with one task per bettor
+        reservations = [store.reserve(user_id, 100) for user_id in range(bettors)]
+        start = time.perf_counter()
+        for user_id in range(bettors):
+            store.settle(user_id, reservations[user_id], crash.payout(100, targets[user_id], 2.0), 'crash')
+        single = time.perf_counter() - start
+        await rounds.close()
+        return join, tick_cost, batch, single
+    
+    for bettors in (1_000, 10_000, 100_000):
+        join, tick_cost, batch, single = asyncio.run(run(bettors))
+        print(f"   {bettors:>7,} bettors: join {join / bettors * 1e6:5.2f} µs/bet, tick {tick_cost * 1e6:6.1f} µs, "
+              f"settle {batch * 1e3:7.1f} ms (one by one {single * 1e3:7.1f} ms)")
+
+
+def bench_keno_draws():
+    """Scheduled Keno draws: queueing and settling many tickets per draw"""
+    import random
+    import keno
+    from config import KENO_PAYOUTS
+    from keno_draws import KenoDrawScheduler
+    from user_store import UserStateStore
+    
+    print("🎟️ Keno draws: tickets settled by one draw")
+    
+    rng = random.Random(7)
+    for tickets in (10_000, 100_000):
+        store = UserStateStore(1000, 64)
+        draws = KenoDrawScheduler(KENO_PAYOUTS, store=store)
+        picks = [keno.numbers_to_mask(rng.sample(range(1, 21), rng.randint(1, 10))) for _ in range(tickets)]
+        reservations = [store.reserve(user_id, 10) for user_id in range(tickets)]
+        
+        start = time.perf_counter()
+        for user_id in range(tickets):
+            draws.queue_ticket(user_id, user_id, 1, picks[user_id], 10, reservations[user_id])
+        queue = time.perf_counter() - start
+        
+        drawn_mask = keno.draw_mask()
+        start = time.perf_counter()
+        draws.settle_draw(drawn_mask)
+        batch = time.perf_counter() - start
+        
+        # Ticket by ticket, as each PLAY did before draws
+        reservations = [store.reserve(user_id, 10) for user_id in range(tickets)]
+        start = time.perf_counter()
+        for user_id in range(tickets):
+            winnings = keno.payout(10, keno.count_matches(picks[user_id], drawn_mask), KENO_PAYOUTS)
+            store.settle(user_id, reservations[user_id], winnings, 'keno')
+        single = time.perf_counter() - start
+        
+        print(f"   {tickets:>7,} tickets: queue {queue / tickets * 1e6:5.2f} µs/ticket, "
+              f"draw {batch * 1e3:6.1f} ms (one by one {single * 1e3:6.1f} ms)")
+
+
+def bench_callback_routing():
+    """Per-update cost of routing callback queries to their handler"""
+    import asyncio
+    import logging
+    import warnings
+    import callbacks
+    from telegram import Update
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+    from telegram_games_bot import GameBot, build_application
+    logging.getLogger('telegram').setLevel(logging.CRITICAL)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    print("🔀 Callback routing: from callback data to the handler to call")
+    
+    def legacy_route(data):
+        # The if/elif chain and split("_") parsing used before the codec
+        if data.startswith("keno_select_"):
+            return 'select', int(data.split("_")[2])
+        elif data == "keno_clear":
+            return 'clear', None
+        elif data == "keno_play":
+            return 'play', None
+        elif data.startswith("crash_mult_"):
+            return 'target', float(data.split("_")[2])
+        elif data == "crash_play":
+            return 'launch', None
+        elif data == "main_menu":
+            return 'menu', None
+        return None
+    
+    router = callbacks.CallbackRouter({
+        action: None for action in (callbacks.KENO_SELECT, callbacks.KENO_CLEAR, callbacks.KENO_PLAY,
+                                    callbacks.CRASH_TARGET, callbacks.CRASH_PLAY, callbacks.MAIN_MENU)
+    })
+    
+    def codec_route(data):
+        payload = router._match(data)
+        return router.routes[payload.action], payload.arg
+    
+    taps = 200_000
+    legacy = ["keno_select_7", "keno_select_14", "crash_mult_2.5", "main_menu"]
+    compact = [callbacks.encode(callbacks.KENO_SELECT, 7), callbacks.encode(callbacks.KENO_SELECT, 14),
+               callbacks.encode(callbacks.CRASH_TARGET, 2.5), callbacks.encode(callbacks.MAIN_MENU)]
+    for label, route, payloads in (("if/elif+split", legacy_route, legacy), ("Codec", codec_route, compact)):
+        start = time.perf_counter()
+        for i in range(taps):
+            route(payloads[i & 3])
+        size = sum(len(data) for data in payloads) / len(payloads)
+        print(f"   {label + ':':<15}{(time.perf_counter() - start) / taps * 1e9:6.0f} ns/tap, {size:4.1f} bytes/payload")
+    
+    # Handler resolution as the application does it, for a player picking Keno numbers
+    async def resolve():
+        application = build_application(GameBot(), token=FAKE_TOKEN, request=FakeBotAPI())
+        await application.initialize()
+        for update_id, text in ((1, "/keno"), (2, "50")):
+            await application.process_update(Update.de_json(message_update(update_id, 7, text), application.bot))
+        updates = [Update.de_json(callback_update(3, 7, data), application.bot) for data in compact[:2] + compact[3:]]
+        handlers = application.handlers[0]
+        rounds = 50_000
+        start = time.perf_counter()
+        for i in range(rounds):
+            update = updates[i % 3]
+            for handler in handlers:
+                if handler.check_update(update) not in (None, False):
+                    break
+        elapsed = time.perf_counter() - start
+        await application.shutdown()
+        return elapsed / rounds
+    
+    print(f"   {'In a game:':<15}{asyncio.run(resolve()) * 1e6:6.2f} µs/update to find the handler")
+
+
+def bench_screens():
+    """Allocations and time per menu screen: rebuilt per call versus precomputed"""
+    import timeit
+    import tracemalloc
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    import screens
+    
+    print("🖼️ Screens: memory and time per rendered menu screen")
+    
+    def rebuilt(kind, balance):
+        # The per-call path used before the screens were precomputed
+        if kind == 'help':
+            text = """
+🎮 **Casino Games Bot Help** 🎮
+
+**🔢 Keno Game:**
+• Pick 1-10 numbers from 1-20
+• Bot draws 10 random numbers
+• Win based on how many of your numbers match
+• Higher matches = bigger payouts!
+        """
+            return text, InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Back to Menu", callback_data="main_menu")]])
+        games = [
+            InlineKeyboardButton("🔢 Play Keno", callback_data="start_keno"),
+            InlineKeyboardButton("🚀 Play Crash", callback_data="start_crash")
+        ]
+        if kind == 'balance':
+            text = f"💰 **Your Current Balance**\n\n{balance} credits"
+            return text, InlineKeyboardMarkup([games, [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]])
+        text = f"""
+🎮 **Casino Games Bot** 🎮
+
+💰 Your balance: **{balance} credits**
+
+Choose a game or check your stats:
+        """
+        return text, InlineKeyboardMarkup([games, [
+            InlineKeyboardButton("💰 Check Balance", callback_data="check_balance"),
+            InlineKeyboardButton("ℹ️ Help", callback_data="show_help")
+        ]])
+    
+    def precomputed(kind, balance):
+        if kind == 'help':
+            return screens.HELP_SCREEN
+        if kind == 'balance':
+            return screens.balance_screen(balance)
+        return screens.main_menu_screen(balance)
+    
+    calls = [(kind, 1000 + index) for index in range(300) for kind in ('menu', 'balance', 'help')]
+    
+    def allocations(render):
+        # Blocks and bytes still held by the rendered screens (what every message keeps alive)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        rendered = [render(kind, balance) for kind, balance in calls]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        del rendered
+        return (sum(stat.count_diff for stat in stats) / len(calls),
+                sum(stat.size_diff for stat in stats) / len(calls))
+    
+    results = {}
+    for label, render in (("Rebuilt:", rebuilt), ("Precomputed:", precomputed)):
+        blocks, size = allocations(render)
+        seconds = timeit.timeit(lambda: [render(kind, balance) for kind, balance in calls], number=50) / (50 * len(calls))
+        results[label] = seconds
+        print(f"   {label:<14}{blocks:>6.1f} blocks, {size:>6.0f} bytes, {seconds * 1e6:>6.2f} µs per screen")
+    print(f"   {'':<14}{results['Rebuilt:'] / results['Precomputed:']:.0f}x faster")
+
+
+def _fake_worker(worker):
+    """Worker application on the fake Bot API (run in the processes of bench_workers)"""
+    import logging
+    import warnings
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI
+    from telegram_games_bot import GameBot, build_application
+    logging.getLogger('telegram').setLevel(logging.CRITICAL)
+    logging.getLogger('httpx').setLevel(logging.CRITICAL)
+    warnings.filterwarnings('ignore', module='telegram')
+    return build_application(GameBot(), token=FAKE_TOKEN, request=FakeBotAPI())
+
+
+def bench_workers():
+    """Routing cost at the front and update throughput with one or more worker processes"""
+    import logging
+    from cluster import HashRing, UserRouter, WorkerPool, update_user_id
+    from fake_bot_api import callback_update, message_update
+    logging.getLogger('cluster').setLevel(logging.WARNING)
+    
+    print("👷 Worker processes: consistent-hash routing by user")
+    
+    users = 100_000
+    ring = HashRing(range(3))
+    before = [ring.owner(user_id) for user_id in range(users)]
+    ring.add(3)
+    moved = sum(owner != ring.owner(user_id) for user_id, owner in enumerate(before))
+    shares = [sum(ring.owner(user_id) == worker for user_id in range(users)) / users for worker in range(4)]
+    print(f"   Adding a 4th worker moves {moved / users:.1%} of users; shares "
+          + ", ".join(f"{share:.1%}" for share in shares))
+    
+    router = UserRouter(ring)
+    updates = [callback_update(i, 1000 + i % 5000, "1p", 7) for i in range(50_000)]
+    start = time.perf_counter()
+    for data in updates:
+        router.route(update_user_id(data))
+    print(f"   Front routing:   {(time.perf_counter() - start) / len(updates) * 1e6:6.2f} µs/update")
+    
+    # /start and /balance from many users, each answered with one sendMessage
+    total = 4000
+    burst = [message_update(i, 1000 + i % 500, "/start" if i % 2 else "/balance") for i in range(total)]
+    print(f"   End to end ({os.cpu_count()} CPU cores here, {total} updates, shutdown included):")
+    for workers in (1, 2, 4):
+        pool = WorkerPool(_fake_worker, workers)
+        pool.start()
+        pool.wait_ready(timeout=120)
+        start = time.perf_counter()
+        for data in burst:
+            pool.dispatch(data)
+        pool.close()
+        elapsed = time.perf_counter() - start
+        print(f"      {workers} worker{'s' if workers > 1 else ' '}: {total / elapsed:>9,.0f} updates/s")
+
+
+def bench_persistence():
+    """Conversation persistence: cold start with a million conversations and cost per change"""
+    import logging
+    import pickle
+    from persistence import ConversationLog
+    from user_store import UserStateStore
+    from wallet import WalletLedger
+    logging.getLogger('persistence').setLevel(logging.WARNING)
+    
+    print("💾 Persistence: a million conversations in progress")
+    
+    conversations = 1_000_000
+    changed = 1000  # conversations changed in one persistence cycle
+    with tempfile.TemporaryDirectory() as tmp:
+        log = ConversationLog(os.path.join(tmp, 'keno.conv'))
+        log.load()
+        for user_id in range(conversations):
+            log.append((user_id, user_id), user_id % 2)
+        log.close()
+        
+        start = time.perf_counter()
+        loaded = log.load()
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for user_id in range(changed):
+            log.append((user_id, user_id), None)
+        log.flush()
+        write_time = time.perf_counter() - start
+        log.close()
+        size = os.path.getsize(log.path)
+        
+        # Pickling the whole state, as PicklePersistence does on every cycle
+        pickled_path = os.path.join(tmp, 'state.pickle')
+        start = time.perf_counter()
+        with open(pickled_path, 'wb') as file:
+            pickle.dump({'conversations': {'keno': loaded}}, file)
+        pickle_write = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(pickled_path, 'rb') as file:
+            pickle.load(file)
+        pickle_load = time.perf_counter() - start
+        pickle_size = os.path.getsize(pickled_path)
+        
+        print(f"   {'Append log:':<13}load {load_time * 1000:6.0f} ms, write {changed} changes "
+              f"{write_time * 1000:7.2f} ms, {size / 1e6:5.1f} MB on disk")
+        print(f"   {'Pickle:':<13}load {pickle_load * 1000:6.0f} ms, write {changed} changes "
+              f"{pickle_write * 1000:7.2f} ms, {pickle_size / 1e6:5.1f} MB on disk")
+        
+        # Game sessions are saved with the wallet on every change
+        ledger = WalletLedger(os.path.join(tmp, 'wallet.db'))
+        for sessions in (False, True):
+            store = UserStateStore(1000, ledger=ledger, sessions=sessions)
+            updates = 20_000
+            start = time.perf_counter()
+            for i in range(updates):
+                store.update_game(i % 500, game='keno', selected_mask=i, bet_amount=50)
+            elapsed = time.perf_counter() - start
+            print(f"   {'Sessions ' + ('on:' if sessions else 'off:'):<13}{elapsed / updates * 1e6:6.2f} µs per session change")
+        ledger.close()
+
+
+def bench_sessions():
+    """Memory of abandoned game sessions: kept forever versus expired and evicted"""
+    import tracemalloc
+    from user_store import UserStateStore
+    from wallet import WalletLedger
+    
+    print("🧹 Sessions: 200,000 users who start a game and never finish it")
+    
+    users = 200_000
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = WalletLedger(os.path.join(tmp, 'wallet.db'))
+        for label, options in (('Kept:', {}),
+                               ('TTL 900s:', {'session_ttl': 900.0}),
+                               ('TTL + 16 MB:', {'session_ttl': 900.0, 'memory_budget': 16 * 2 ** 20})):
+            now = [0.0]
+            store = UserStateStore(1000, ledger=ledger, clock=lambda: now[0], **options)
+            tracemalloc.start()
+            start = time.perf_counter()
+            for user_id in range(users):
+                # One new player every 10 ms of simulated time
+                now[0] += 0.01
+                store.start_game(user_id, game='keno', selected_mask=0, bet_amount=50)
+                store.update_game(user_id, reservation=store.reserve(user_id, 50))
+            elapsed = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            stats = store.stats()
+            print(f"   {label:<13}{len(store):>7,} users in memory, {memory / 2 ** 20:6.1f} MB, "
+                  f"{elapsed / users * 1e6:5.1f} µs per new game, "
+                  f"{stats['evicted_idle']:,} idle + {stats['evicted_memory']:,} LRU evictions")
+        ledger.close()
+
+
+def bench_concurrency():
+    """Updates per second with a slow Bot API: one update at a time versus users in parallel"""
+    import asyncio
+    import logging
+    import warnings
+    from loadtest import percentiles, run_load
+    logging.getLogger().setLevel(logging.ERROR)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    print("🔀 Concurrent updates: 64 players, 10 ms per Bot API call")
+    
+    for limit in (1, 8, 32, 128):
+        result = asyncio.run(run_load(users=64, games=2, api_latency=0.01, concurrent_updates=limit))
+        p99 = percentiles(result.end_to_end_latency)[99]
+        print(f"   {'Concurrency ' + str(limit) + ':':<17}{result.rate:>7,.0f} updates/s, "
+              f"p99 end-to-end {p99 * 1000:7.1f} ms")
+
+
+def bench_quick_bets():
+    """Updates, Bot API calls and time per game: step-by-step conversation versus one quick-bet command"""
+    import asyncio
+    import logging
+    import warnings
+    from loadtest import run_load
+    logging.getLogger().setLevel(logging.ERROR)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    print("⚡ Quick bets: 64 players x 4 games, 10 ms per Bot API call")
+    
+    games = 64 * 4
+    for label, quick in (("Conversation:", False), ("Quick bets:", True)):
+        result = asyncio.run(run_load(users=64, games=4, api_latency=0.01, quick=quick))
+        print(f"   {label:<15}{(result.updates - 64) / games:5.1f} updates, {result.api_calls / games:5.1f} API calls "
+              f"per game, {result.elapsed / games * 1000:6.2f} ms per game")
+
+
+def bench_autobet():
+    """100 Keno rounds as Play Again conversations versus one /autokeno command"""
+    import asyncio
+    import logging
+    import warnings
+    import callbacks
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+    from loadtest import UNPACED_RATE, UpdateTimer
+    from telegram_games_bot import build_application, build_bot
+    from webserver import run_application
+    logging.getLogger().setLevel(logging.ERROR)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    rounds = 100
+    print(f"🔁 Autobet: {rounds} Keno rounds of 10 credits on 3 numbers, 10 ms per Bot API call")
+    
+    async def run(tmp, commands):
+        bot = build_bot(outbox_global_rate=UNPACED_RATE, outbox_chat_rate=UNPACED_RATE,
+                        ledger_path=os.path.join(tmp, 'wallet.db'))
+        api = FakeBotAPI(latency=0.01)
+        application = build_application(bot, token=FAKE_TOKEN, request=api, get_updates_request=api)
+        timer = UpdateTimer()
+        timer.attach(application)
+        stop_event = asyncio.Event()
+        running = asyncio.ensure_future(run_application(application, stop_event=stop_event))
+        try:
+            while not (application.updater and application.updater.running):
+                await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            for update_id, data in enumerate(commands(), 1):
+                data['update_id'] = update_id
+                waiter = timer.expect(update_id)
+                api.push_update(data)
+                await waiter
+            elapsed = time.perf_counter() - start
+            bot.store.ledger.flush()
+            return elapsed, sum(api.calls.values()) - api.calls['getUpdates'], bot.store.ledger.commits
+        finally:
+            stop_event.set()
+            await running
+            bot.store.ledger.close()
+    
+    def conversation():
+        # The bankroll allows every round: bets of 10 out of 1000 credits
+        for _ in range(rounds):
+            yield message_update(0, 1, "/keno")
+            yield message_update(0, 1, "10")
+            for number in (3, 7, 12):
+                yield callback_update(0, 1, callbacks.encode(callbacks.KENO_SELECT, number))
+            yield callback_update(0, 1, callbacks.encode(callbacks.KENO_PLAY))
+    
+    def autobet():
+        yield message_update(0, 1, f"/autokeno {rounds} 10 3 7 12")
+    
+    for label, commands in (("Conversations:", conversation), ("Autobet:", autobet)):
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed, api_calls, commits = asyncio.run(run(tmp, commands))
+        print(f"   {label:<16}{elapsed * 1000:8.1f} ms, {api_calls:4d} Bot API calls, {commits:3d} ledger commits")
+
+
+def bench_callback_answers():
+    """Latency of a button tap: answer then edit, versus the answer sent alongside the edit"""
+    import asyncio
+    import logging
+    import warnings
+    from telegram import Update
+    from telegram.ext import Application, CallbackQueryHandler
+    from callbacks import CallbackRouter
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update
+    logging.getLogger().setLevel(logging.ERROR)
+    warnings.filterwarnings('ignore', module='telegram')
+    
+    taps = 100
+    print(f"👆 Callback answers: ms per tap, {taps} taps, 10 ms per Bot API call")
+    
+    async def serial(update, context):
+        # What every handler did before the router answered queries
+        await update.callback_query.answer()
+        await update.callback_query.edit_message_text(f"Tap {update.update_id}")
+    
+    async def pipelined(update, context):
+        await update.callback_query.edit_message_text(f"Tap {update.update_id}")
+    
+    async def run(handler):
+        application = Application.builder().token(FAKE_TOKEN).request(FakeBotAPI(latency=0.01)).build()
+        application.add_handler(handler)
+        await application.initialize()
+        start = time.perf_counter()
+        for update_id in range(taps):
+            await application.process_update(Update.de_json(callback_update(update_id, 1, "1s5"), application.bot))
+        elapsed = time.perf_counter() - start
+        await application.shutdown()
+        return elapsed / taps
+    
+    serial_time = asyncio.run(run(CallbackQueryHandler(serial)))
+    pipelined_time = asyncio.run(run(CallbackRouter({}, default=pipelined)))
+    print(f"   Answer, then edit: {serial_time * 1000:6.1f} ms")
+    print(f"   Answer with edit:  {pipelined_time * 1000:6.1f} ms ({(serial_time - pipelined_time) * 1000:.1f} ms saved)")
+
+
+def bench_transport():
+    """Bot API throughput per pool size, and keep-alive versus a new connection per call"""
+    import asyncio
+    import logging
+    from telegram import Bot
+    from fake_bot_api import FAKE_TOKEN, FakeBotAPI, serve
+    from transport import PooledRequest
+    logging.getLogger().setLevel(logging.ERROR)
+    
+    callers, sends = 64, 640
+    print(f"🔌 Bot API transport: {sends} sends from {callers} concurrent callers, local stub, 20 ms per call")
+    
+    async def run(**request_kwargs):
+        server = await serve(FakeBotAPI(latency=0.02))
+        request = PooledRequest(pool_timeout=None, **request_kwargs)
+        bot = Bot(FAKE_TOKEN, base_url=f'http://127.0.0.1:{server.port}/bot', request=request)
+        queue = asyncio.Queue()
+        for chat_id in range(sends):
+            queue.put_nowait(chat_id)
+        
+        async def caller():
+            while not queue.empty():
+                await bot.send_message(queue.get_nowait(), "Hi")
+        
+        try:
+            async with bot:
+                calls, pool_wait = request.calls, request.pool_wait
+                start = time.perf_counter()
+                await asyncio.gather(*(caller() for _ in range(callers)))
+                elapsed = time.perf_counter() - start
+        finally:
+            await server.stop()
+        return sends / elapsed, (request.pool_wait - pool_wait) / (request.calls - calls), request.connections
+    
+    for size in (1, 8, 32, 64, 128):
+        throughput, wait, connections = asyncio.run(run(connection_pool_size=size))
+        print(f"   Pool of {size:3}: {throughput:6.0f} sends/s, {wait * 1000:6.1f} ms mean pool wait, "
+              f"{connections} connections opened")
+    throughput, wait, connections = asyncio.run(run(connection_pool_size=64, keepalive_connections=0))
+    print(f"   No keep-alive: {throughput:6.0f} sends/s, {connections} connections opened")
+
+
+BENCHMARKS = {
+    'ledger': bench_ledger,
+    'reservations': bench_reservations,
+    'keno_keyboard': bench_keno_keyboard,
+    'keno_settlement': bench_keno_settlement,
+    'crash_points': bench_crash_points,
+    'webhook': bench_webhook,
+    'metrics': bench_metrics,
+    'outbox': bench_outbox,
+    'fingerprints': bench_fingerprints,
+    'crash_rounds': bench_crash_rounds,
+    'keno_draws': bench_keno_draws,
+    'callback_routing': bench_callback_routing,
+    'screens': bench_screens,
+    'workers': bench_workers,
+    'persistence': bench_persistence,
+    'sessions': bench_sessions,
+    'concurrency': bench_concurrency,
+    'quick_bets': bench_quick_bets,
+    'autobet': bench_autobet,
+    'callback_answers': bench_callback_answers,
+    'transport': bench_transport,
+}
+
+
+def main():
+    """Run the selected benchmarks"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"❌ Unknown benchmark(s): {', '.join(unknown)}")
+        print(f"Available: {', '.join(BENCHMARKS)}")
+        return False
+    
+    print("⏱️ Telegram Games Bot Benchmarks")
+    print("=" * 40)
+    for name in names:
+        print()
+        BENCHMARKS[name]()
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,138 @@
+"""
+Callback Data Codec for Telegram Games Bot
+==========================================
+
+Compact callback data for inline buttons and the routing that dispatches it.
+
+A payload is a version character, an action character and, for actions that
+take one, an argument character: tapping Keno number 5 sends `1s5` instead of
+`keno_select_5`. Every valid payload is known up front (Keno numbers and
+Crash targets are small fixed sets), so the codec is two precompiled tables
+and decoding is a single dict lookup with no string parsing. The payloads of
+earlier versions, including the original `keno_select_5` style, stay in the
+table so buttons on old messages keep working.
+
+`CallbackRouter` is one `CallbackQueryHandler` for a set of actions. It
+decodes the payload once when matching, hands it to the callback as
+`context.match` (`.action` and `.arg`), and calls the callback of that action
+directly. It also answers every query once, alongside the callback's own
+requests (see `answers.py`).
+"""
+
+import string
+from typing import Callable, Dict, NamedTuple, Optional, Union
+
+from telegram.ext import CallbackQueryHandler
+
+import answers
+from crash import CASHOUT_TARGETS
+
+# Bumped when the payload layout changes; older versions stay decodable
+VERSION = '1'
+
+# Actions (one character each)
+MAIN_MENU = 'm'
+CHECK_BALANCE = 'b'
+SHOW_HELP = 'h'
+START_KENO = 'k'
+START_CRASH = 'c'
+KENO_SELECT = 's'    # arg: number
+KENO_CLEAR = 'x'
+KENO_PLAY = 'p'
+CRASH_TARGET = 't'   # arg: cash-out multiplier
+CRASH_PLAY = 'l'
+
+# One character per argument value
+_ARG_ALPHABET = string.digits + string.ascii_letters
+
+Arg = Union[int, float, None]
+
+
+class Callback(NamedTuple):
+    """A decoded payload (always truthy, so it can serve as a handler match)"""
+    action: str
+    arg: Arg = None
+
+
+def _argument_codes() -> Dict[str, Dict[Arg, str]]:
+    return {
+        # A number is its own character (any grid up to 61 numbers)
+        KENO_SELECT: {number: _ARG_ALPHABET[number] for number in range(1, len(_ARG_ALPHABET))},
+        # A target is its position among the offered targets
+        CRASH_TARGET: {target: _ARG_ALPHABET[index] for index, target in enumerate(CASHOUT_TARGETS)},
+    }
+
+
+def _compile():
+    encode_table: Dict[tuple, str] = {}
+    decode_table: Dict[str, Callback] = {}
+    arguments = _argument_codes()
+    for action in (MAIN_MENU, CHECK_BALANCE, SHOW_HELP, START_KENO, START_CRASH, KENO_SELECT,
+                   KENO_CLEAR, KENO_PLAY, CRASH_TARGET, CRASH_PLAY):
+        if action in arguments:
+            for value, code in arguments[action].items():
+                data = VERSION + action + code
+                encode_table[(action, value)] = data
+                decode_table[data] = Callback(action, value)
+        else:
+            data = VERSION + action
+            encode_table[(action, None)] = data
+            decode_table[data] = Callback(action)
+
+    # Payloads sent before the codec existed
+    for legacy, action in (('main_menu', MAIN_MENU), ('check_balance', CHECK_BALANCE),
+                           ('show_help', SHOW_HELP), ('start_keno', START_KENO),
+                           ('start_crash', START_CRASH), ('keno_clear', KENO_CLEAR),
+                           ('keno_play', KENO_PLAY), ('crash_play', CRASH_PLAY)):
+        decode_table[legacy] = Callback(action)
+    for number in arguments[KENO_SELECT]:
+        decode_table[f'keno_select_{number}'] = Callback(KENO_SELECT, number)
+    for target in arguments[CRASH_TARGET]:
+        decode_table[f'crash_mult_{target}'] = Callback(CRASH_TARGET, target)
+    return encode_table, decode_table
+
+
+_ENCODE, _DECODE = _compile()
+
+
+def encode(action: str, arg: Arg = None) -> str:
+    """Callback data for an action (and its argument)"""
+    try:
+        return _ENCODE[(action, arg)]
+    except KeyError:
+        raise ValueError(f"No callback payload for action {action!r} with argument {arg!r}") from None
+
+
+def decode(data: object) -> Optional[Callback]:
+    """Decode callback data, None if it is not a known payload"""
+    return _DECODE.get(data) if isinstance(data, str) else None
+
+
+class CallbackRouter(CallbackQueryHandler):
+    """Callback query handler that dispatches decoded payloads by action
+
+    With a default callback the router also takes every other callback
+    query (known or not), so it can stand in for a catch-all handler. The
+    router answers every query, so callbacks must not answer it themselves.
+    """
+
+    def __init__(self, routes: Dict[str, Callable], default: Optional[Callable] = None, block: bool = True):
+        super().__init__(self._dispatch, pattern=self._match, block=block)
+        self.routes = dict(routes)
+        self.default = default
+
+    def _match(self, data: object) -> Optional[Callback]:
+        payload = _DECODE.get(data) if isinstance(data, str) else None
+        if payload is not None and payload.action in self.routes:
+            return payload
+        if self.default is not None:
+            return Callback('')
+        return None
+
+    async def _dispatch(self, update, context):
+        callback = self.routes.get(context.match.action, self.default)
+        answer = answers.begin(update.callback_query)
+        try:
+            return await callback(update, context)
+        finally:
+            await answers.finish(answer)
@@ -0,0 +1,332 @@
+"""
+Worker Processes for Telegram Games Bot
+=======================================
+
+Runs the game handlers in several processes, so the bot is not limited to
+one CPU core.
+
+A front process receives the updates (webhook or long polling) and hands
+each one to the worker process that owns its user. Owners are picked by
+consistent hashing (`HashRing`), so all updates of a user reach the same
+worker, in order, and that worker holds the user's conversations and game
+sessions. Workers share the wallet ledger, so a user who moves to another
+worker keeps their balance.
+
+Adding a worker moves only about 1/N of the users to it, and not at once:
+`UserRouter` keeps a user with the worker that served them last until they
+have been idle for `handoff_idle` seconds, so games in progress finish
+where they started. A user's old worker may still hold their state after
+the move; each worker saves sessions under its own ledger owner and the
+new worker takes the session over when it reads it, so the old worker
+expiring its copy never deletes the session the user is now playing.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram import Bot, Update
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+from webserver import BotHTTPServer, health_check, stop_on_signals, update_route
+
+logger = logging.getLogger(__name__)
+
+# Seconds a getUpdates call of the front may wait for updates
+POLL_TIMEOUT = 10
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hash ring of worker ids, with virtual nodes for an even spread"""
+
+    def __init__(self, workers=(), replicas: int = 160):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: List[int] = []
+        self._workers: set = set()
+        for worker in workers:
+            self.add(worker)
+
+    def __len__(self) -> int:
+        return len(self._workers)
+
+    def __contains__(self, worker: int) -> bool:
+        return worker in self._workers
+
+    def add(self, worker: int) -> None:
+        """Put a worker on the ring; it takes over about 1/N of the users"""
+        if worker in self._workers:
+            raise ValueError(f"Worker {worker} is already on the ring")
+        self._workers.add(worker)
+        for replica in range(self.replicas):
+            point = _hash(f"worker-{worker}-{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, worker)
+
+    def remove(self, worker: int) -> None:
+        """Take a worker off the ring; its users spread over the others"""
+        self._workers.remove(worker)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != worker]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def owner(self, user_id: int) -> int:
+        """Worker that owns user_id"""
+        if not self._points:
+            raise LookupError("The ring has no workers")
+        index = bisect.bisect(self._points, _hash(str(user_id)))
+        return self._owners[index % len(self._owners)]
+
+
+def update_user_id(data: Dict[str, Any]) -> int:
+    """User an update comes from (its chat, or the update id, when it has no user)"""
+    for value in data.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('user') or value.get('chat')
+            if sender:
+                return sender['id']
+    return data.get('update_id', 0)
+
+
+class UserRouter:
+    """Picks the worker of each user: the ring owner, unless the user is still active elsewhere"""
+
+    def __init__(self, ring: HashRing, handoff_idle: float = 900.0, clock=time.monotonic):
+        self.ring = ring
+        self.handoff_idle = handoff_idle
+        self._clock = clock
+        # user id -> (worker, last seen), least recently seen first
+        self._recent: 'OrderedDict[int, Tuple[int, float]]' = OrderedDict()
+
+        # Counters
+        self.routed = 0     # updates routed
+        self.held = 0       # updates kept away from the ring owner while the user was active
+
+    def route(self, user_id: int) -> int:
+        """Worker for the next update of user_id"""
+        now = self._clock()
+        recent = self._recent
+        # Users idle long enough may move to their ring owner
+        while recent:
+            oldest = next(iter(recent))
+            if now - recent[oldest][1] < self.handoff_idle:
+                break
+            del recent[oldest]
+
+        last = recent.pop(user_id, None)
+        owner = self.ring.owner(user_id)
+        worker = last[0] if last is not None and last[0] in self.ring else owner
+        if worker != owner:
+            self.held += 1
+        recent[user_id] = (worker, now)
+        self.routed += 1
+        return worker
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+
+class WorkerPool:
+    """Worker processes that each run the application built by `build` on the updates of their users
+
+    `build` is called with the worker id in the worker process, so it must
+    be a module-level function (it is pickled into each worker).
+    """
+
+    def __init__(self, build: Callable[[int], Application], workers: int = 2, handoff_idle: float = 900.0,
+                 replicas: int = 160, start_method: str = 'spawn'):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        self.build = build
+        self.ring = HashRing(replicas=replicas)
+        self.router = UserRouter(self.ring, handoff_idle)
+        self._initial = workers
+        self._context = multiprocessing.get_context(start_method)
+        self._ready = self._context.Queue()
+        self._queues: Dict[int, Any] = {}
+        self._processes: Dict[int, Any] = {}
+        self._started = 0  # workers known to be up
+
+        # Counters
+        self.dispatched = 0  # updates handed to workers
+
+    @property
+    def workers(self) -> int:
+        """Workers started so far"""
+        return len(self._processes)
+
+    def start(self) -> None:
+        """Start the initial workers"""
+        for _ in range(self._initial):
+            self.add_worker()
+
+    def add_worker(self) -> int:
+        """Start one more worker and put it on the ring; returns its id"""
+        worker = len(self._processes)  # ids are never reused
+        updates = self._context.Queue()
+        process = self._context.Process(target=run_worker, args=(self.build, worker, updates, self._ready),
+                                        name=f"bot-worker-{worker}", daemon=True)
+        process.start()
+        self._queues[worker] = updates
+        self._processes[worker] = process
+        # Updates can be queued right away; the worker takes them once it is up
+        self.ring.add(worker)
+        logger.info(f"Started worker {worker} (pid {process.pid}), {len(self.ring)} on the ring")
+        return worker
+
+    def wait_ready(self, timeout: Optional[float] = None) -> None:
+        """Block until every worker started so far is processing updates"""
+        while self._started < len(self._processes):
+            self._ready.get(timeout=timeout)
+            self._started += 1
+
+    def dispatch(self, data: Dict[str, Any]) -> int:
+        """Hand an update (decoded JSON) to the worker of its user; returns the worker id"""
+        worker = self.router.route(update_user_id(data))
+        self._queues[worker].put(data)
+        self.dispatched += 1
+        return worker
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Let every worker finish its queued updates, then stop it"""
+        for updates in self._queues.values():
+            updates.put(None)
+        for worker, process in self._processes.items():
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {worker} did not stop in {timeout:.0f}s, terminating it")
+                process.terminate()
+        self._queues.clear()
+        self._processes.clear()
+
+
+def run_worker(build: Callable[[int], Application], worker: int, updates, ready=None) -> None:
+    """Entry point of a worker process"""
+    # Ctrl+C reaches the whole process group; workers stop when the front tells them to
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve(build(worker), updates, ready))
+
+
+async def _serve(application: Application, updates, ready) -> None:
+    """Run application on the updates sent by the front until it sends None"""
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+
+    def receive() -> None:
+        # Blocking reads stay off the event loop
+        while True:
+            data = updates.get()
+            if data is None:
+                loop.call_soon_threadsafe(stopped.set_result, None)
+                return
+            loop.call_soon_threadsafe(queue_update, data)
+
+    def queue_update(data: Dict[str, Any]) -> None:
+        try:
+            application.update_queue.put_nowait(Update.de_json(data, application.bot))
+        except (TypeError, KeyError, ValueError):
+            logger.warning("Ignoring malformed update")
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await application.start()
+        threading.Thread(target=receive, name="worker-updates", daemon=True).start()
+        if ready is not None:
+            ready.put(True)
+        await stopped
+    finally:
+        # Stopping processes every update still queued
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+async def run_front(pool: WorkerPool, bot: Bot, port: Optional[int] = None, webhook_url: Optional[str] = None,
+                    webhook_path: str = '/telegram', secret_token: Optional[str] = None,
+                    stop_event: Optional[asyncio.Event] = None) -> None:
+    """Receive updates by webhook or long polling and hand them to the pool's workers
+
+    SIGUSR1 adds a worker. The HTTP server is started when a port is given
+    and answers health checks on `/` and `/health`.
+    """
+    stop_event = stop_event or asyncio.Event()
+    stop_on_signals(stop_event)
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, pool.add_worker)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        pass  # No SIGUSR1 on this platform
+
+    if webhook_url and not port:
+        raise ValueError("Webhook mode needs a port for the HTTP server")
+
+    server = None
+    pool.start()
+    try:
+        async with bot:
+            if port:
+                server = BotHTTPServer(port=port)
+                server.add_route('GET', '/', health_check)
+                server.add_route('GET', '/health', health_check)
+                if webhook_url:
+                    server.add_route('POST', webhook_path, update_route(pool.dispatch, secret_token))
+                await server.start()
+                print(f"🌐 HTTP server running on port {server.port}" + (" (webhook mode)" if webhook_url else ""))
+
+            print(f"👷 Handing updates to {pool.workers} worker processes")
+            if webhook_url:
+                await bot.set_webhook(url=webhook_url.rstrip('/') + webhook_path, secret_token=secret_token,
+                                      allowed_updates=Update.ALL_TYPES)
+                await stop_event.wait()
+            else:
+                await bot.delete_webhook()
+                await _poll(pool, bot, stop_event)
+    finally:
+        if server is not None:
+            await server.stop()
+        await loop.run_in_executor(None, pool.close)
+
+
+async def _poll(pool: WorkerPool, bot: Bot, stop_event: asyncio.Event) -> None:
+    """Long-poll for updates until stop_event is set"""
+    offset = None
+    stopping = asyncio.ensure_future(stop_event.wait())
+    try:
+        while not stop_event.is_set():
+            poll = asyncio.ensure_future(bot.get_updates(offset=offset, timeout=POLL_TIMEOUT,
+                                                         allowed_updates=Update.ALL_TYPES))
+            await asyncio.wait((poll, stopping), return_when=asyncio.FIRST_COMPLETED)
+            if not poll.done():
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except TelegramError as e:
+                logger.warning(f"Fetching updates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                pool.dispatch(update.to_dict())
+                offset = update.update_id + 1
+    finally:
+        stopping.cancel()
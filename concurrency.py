@@ -0,0 +1,80 @@
+"""
+Concurrent Updates for Telegram Games Bot
+=========================================
+
+Handles the updates of different users at the same time while the updates
+of each user still run one after another, in the order they arrived.
+
+With plain `concurrent_updates` the application runs updates side by side
+with no regard for who sent them, so two quick taps of one player could
+overtake each other (a Keno toggle landing after PLAY). `UserOrderedApplication`
+chains each update behind the previous update of the same user before it
+takes one of `max_concurrent` slots, so a slow Bot API round trip for one
+player no longer holds up everyone else, and one player's taps never race.
+Updates without a user are ordered by chat.
+"""
+
+import asyncio
+from typing import Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+# Updates taken off the update queue at once, running or waiting for their turn
+MAX_PENDING_UPDATES = 10_000
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    """Key whose updates must run in order: the user, else the chat (None for neither)"""
+    if isinstance(update, Update):
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return ('chat', update.effective_chat.id)
+    return None
+
+
+class UserOrderedApplication(Application):
+    """Application that runs up to max_concurrent updates at once, one at a time per user
+
+    Build it with `Application.builder().application_class(UserOrderedApplication,
+    {'max_concurrent': n}).concurrent_updates(MAX_PENDING_UPDATES)`, or with
+    `build_application`, which does that for `concurrent_updates` above 1.
+    """
+
+    def __init__(self, *, max_concurrent: int = 32, **kwargs):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        super().__init__(**kwargs)
+        self.max_concurrent = max_concurrent
+        self._slots = asyncio.BoundedSemaphore(max_concurrent)
+        # key -> done future of its latest update
+        self._tails: Dict[Optional[Hashable], asyncio.Future] = {}
+
+        # Counters
+        self.in_flight = 0      # updates in the handlers right now
+        self.max_in_flight = 0  # highest in_flight so far
+        self.chained = 0        # updates that waited for an earlier update of their user
+
+    async def process_update(self, update: object) -> None:
+        # Queue behind the user's previous update before the first await, so
+        # the order of arrival is the order of handling
+        key = update_key(update)
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if previous is not None:
+                self.chained += 1
+                await asyncio.shield(previous)
+            async with self._slots:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    await super().process_update(update)
+                finally:
+                    self.in_flight -= 1
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
@@ -43,10 +43,144 @@ KENO_PAYOUTS = {
     10: 10
 }
 
+# Highest return to player allowed for any pick count (e.g. 0.97 for a 3% house
+# edge). validate_config computes the exact RTP of KENO_PAYOUTS and rejects the
+# table if it pays more. None disables the check; the default table returns
+# well above 100% for 4+ picks, so set a target once the table is rebalanced.
+KENO_TARGET_RTP = None
+
+# Draw-based Keno: tickets wait for a draw every KENO_DRAW_INTERVAL seconds,
+# and each draw settles all of them at once. Draws run on the JobQueue
+# (pip install "python-telegram-bot[job-queue]"). When disabled every PLAY
+# draws its own numbers.
+KENO_SCHEDULED_DRAWS = False
+KENO_DRAW_INTERVAL = 60.0
+
 # Crash game settings
 CRASH_MIN_MULTIPLIER = 1.1
 CRASH_MAX_MULTIPLIER = 10.0
 
+# Crash point distribution: 'piecewise' (the original weighted buckets) or
+# 'house_edge', where crash = (1 - CRASH_HOUSE_EDGE) / (1 - U) rounded down
+# to 0.01x, so every cash-out target returns exactly 1 - CRASH_HOUSE_EDGE
+CRASH_DISTRIBUTION = 'piecewise'
+CRASH_HOUSE_EDGE = 0.01
+CRASH_POINT_CAP = 1000.0  # Highest crash point for 'house_edge' (None for no cap)
+
+# Shared Crash rounds: everyone who launches during the betting window flies
+# in the same round with one crash point. When disabled every launch plays
+# its own instant round.
+CRASH_SHARED_ROUNDS = True
+CRASH_BETTING_WINDOW = 10.0       # Seconds a round takes bets after its first bet
+CRASH_GROWTH_RATE = 0.1           # Multiplier = exp(rate * seconds in the air)
+CRASH_TICK_INTERVAL = 1.0         # Seconds between live multiplier updates
+CRASH_EDIT_INTERVAL = 2.0         # Fewest seconds between updates in one chat
+CRASH_EDITS_PER_TICK = 20         # Most messages refreshed per update
+
+# Autobet (/autokeno, /autocrash): most rounds one command may play. All of
+# their stakes are held up front and settled in one wallet update.
+AUTOBET_MAX_ROUNDS = 1000
+
+# === STATE STORE SETTINGS ===
+
+# Number of shards (each with its own lock) for per-user balances and game sessions
+USER_STORE_SHARDS = 64
+
+# Memory for per-user state (MB); the least recently active users are dropped
+# beyond it and read back from the wallet when they return
+USER_STORE_MEMORY_MB = 256
+
+# Games left without a move this long (seconds) are abandoned: their bet goes
+# back to the wallet, the conversation ends (on the JobQueue) and the idle
+# user is dropped from memory. Keep it at most WORKER_HANDOFF_IDLE.
+SESSION_TTL = 900.0
+
+# === UPDATE PROCESSING SETTINGS ===
+
+# Updates of different users handled at the same time (1 handles one update
+# at a time). A user's own updates always run one after another, in order.
+CONCURRENT_UPDATES = 32
+
+# === BOT API TRANSPORT SETTINGS ===
+
+# Connections for sending and editing messages, shared by the handlers, the
+# outbound queue and the Crash ticker; keep it above CONCURRENT_UPDATES. A
+# call that finds every connection busy waits up to API_POOL_TIMEOUT seconds.
+API_POOL_SIZE = 64
+API_POOL_TIMEOUT = 5.0
+API_KEEPALIVE_EXPIRY = 30.0        # Seconds an idle connection stays open for reuse
+API_HTTP_VERSION = '1.1'           # '2' needs pip install "python-telegram-bot[http2]"
+API_CONNECT_TIMEOUT = 5.0
+API_READ_TIMEOUT = 5.0
+API_WRITE_TIMEOUT = 5.0
+
+# Long polling has a pool of its own, so a getUpdates call waiting for
+# updates never holds a connection the handlers need
+GET_UPDATES_POOL_SIZE = 1
+
+# === WALLET SETTINGS ===
+
+# SQLite database holding balances and the bet/payout ledger
+LEDGER_PATH = os.getenv('LEDGER_PATH', 'wallet.db')
+
+# Ledger entries are group-committed at most this often (milliseconds)
+LEDGER_FLUSH_INTERVAL_MS = 5
+
+# === PERSISTENCE SETTINGS ===
+
+# Keep Keno and Crash games in progress across restarts: conversation states
+# are appended to compact logs in STATE_DIR and game sessions are saved in
+# the wallet database
+STATE_PERSISTENCE = True
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+
+# Seconds between writes of changed conversation states
+STATE_UPDATE_INTERVAL = 1.0
+
+# === SERVER SETTINGS ===
+
+# Public base URL of this service (e.g. https://your-bot.onrender.com). When set
+# and PORT is set, Telegram pushes updates to WEBHOOK_URL + WEBHOOK_PATH instead
+# of the bot long-polling for them.
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = '/telegram'
+
+# Secret Telegram echoes in every webhook request; a random one is generated
+# on each start when unset
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+
+# Serve Prometheus metrics on PORT at /metrics. When disabled (or PORT is
+# unset) handlers are registered without instrumentation.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() != 'false'
+
+# === WORKER PROCESS SETTINGS ===
+
+# Run the game handlers in this many processes (one per CPU core). With more
+# than one, this process only receives updates and hands each user's updates
+# to the same worker (see cluster.py); kill -USR1 adds a worker. Shared Crash
+# rounds, scheduled Keno draws and metrics are then per worker, and each
+# worker gets an equal share of OUTBOX_GLOBAL_RATE.
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))
+
+# A user keeps the worker that served them last until idle this long (seconds),
+# so adding a worker never moves a game in progress
+WORKER_HANDOFF_IDLE = 900.0
+
+# === OUTBOUND EDIT SETTINGS ===
+
+# Queue message edits and send only the latest one per message, paced to
+# stay under Telegram's flood limits
+OUTBOX_ENABLED = True
+OUTBOX_CHAT_RATE = 1.0             # Edits per second per chat
+OUTBOX_CHAT_BURST = 3              # Edits a chat may send back to back
+OUTBOX_GLOBAL_RATE = 30.0          # Edits per second across all chats
+OUTBOX_COALESCE_WINDOW_MS = 50     # How long an edit waits for a newer one
+
+# Remember the last text and markup of this many bot messages, so edits that
+# change nothing are skipped and markup-only changes use editMessageReplyMarkup
+# (0 disables)
+EDIT_FINGERPRINT_CACHE_SIZE = 10_000
+
 # === LOGGING SETTINGS ===
 
 # Enable/disable logging
@@ -76,6 +210,58 @@ def validate_config():
     if STARTING_BALANCE < MIN_BET:
         raise ValueError("STARTING_BALANCE must be at least MIN_BET")
     
+    if USER_STORE_SHARDS < 1:
+        raise ValueError("USER_STORE_SHARDS must be at least 1")
+    
+    if CONCURRENT_UPDATES < 1:
+        raise ValueError("CONCURRENT_UPDATES must be at least 1")
+    
+    if API_POOL_SIZE < 1 or GET_UPDATES_POOL_SIZE < 1:
+        raise ValueError("API_POOL_SIZE and GET_UPDATES_POOL_SIZE must be at least 1")
+    
+    if API_HTTP_VERSION not in ('1.1', '2'):
+        raise ValueError("API_HTTP_VERSION must be '1.1' or '2'")
+    
+    if USER_STORE_MEMORY_MB <= 0 or SESSION_TTL <= 0:
+        raise ValueError("USER_STORE_MEMORY_MB and SESSION_TTL must be positive")
+    
+    if LEDGER_FLUSH_INTERVAL_MS <= 0:
+        raise ValueError("LEDGER_FLUSH_INTERVAL_MS must be positive")
+    
+    if CRASH_DISTRIBUTION not in ('piecewise', 'house_edge'):
+        raise ValueError("CRASH_DISTRIBUTION must be 'piecewise' or 'house_edge'")
+    
+    if not 0 <= CRASH_HOUSE_EDGE < 1:
+        raise ValueError("CRASH_HOUSE_EDGE must be between 0 and 1")
+    
+    if OUTBOX_CHAT_RATE <= 0 or OUTBOX_GLOBAL_RATE <= 0 or OUTBOX_CHAT_BURST < 1:
+        raise ValueError("OUTBOX rates must be positive and OUTBOX_CHAT_BURST at least 1")
+    
+    if KENO_DRAW_INTERVAL <= 0:
+        raise ValueError("KENO_DRAW_INTERVAL must be positive")
+    
+    if CRASH_BETTING_WINDOW < 0 or CRASH_GROWTH_RATE <= 0 or CRASH_TICK_INTERVAL <= 0:
+        raise ValueError("CRASH_BETTING_WINDOW cannot be negative; CRASH_GROWTH_RATE and CRASH_TICK_INTERVAL must be positive")
+    
+    if AUTOBET_MAX_ROUNDS < 1:
+        raise ValueError("AUTOBET_MAX_ROUNDS must be at least 1")
+    
+    if EDIT_FINGERPRINT_CACHE_SIZE < 0:
+        raise ValueError("EDIT_FINGERPRINT_CACHE_SIZE cannot be negative")
+    
+    if STATE_UPDATE_INTERVAL <= 0:
+        raise ValueError("STATE_UPDATE_INTERVAL must be positive")
+    
+    if WORKER_PROCESSES < 1 or WORKER_HANDOFF_IDLE <= 0:
+        raise ValueError("WORKER_PROCESSES must be at least 1 and WORKER_HANDOFF_IDLE positive")
+    
+    if WEBHOOK_URL and not os.getenv('PORT'):
+        raise ValueError("WEBHOOK_URL needs PORT to be set for the webhook server")
+    
+    # Exact Keno odds (memoized, so the bot reuses them for the payout screen)
+    from keno_odds import check_payouts
+    check_payouts(KENO_PAYOUTS, KENO_TARGET_RTP, KENO_TOTAL_NUMBERS, KENO_DRAWN_NUMBERS, KENO_MAX_PICKS)
+    
     print("✅ Configuration validated successfully!")
     return True
 
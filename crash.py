@@ -0,0 +1,210 @@
+"""
+Crash Engine for Telegram Games Bot
+===================================
+
+Crash point distributions and payout rules shared by the bot and the simulator.
+
+Every distribution is sampled through its closed-form inverse CDF, so a crash
+point costs one uniform draw, and N points cost one vectorized call with
+NumPy (optional). Two families are available:
+
+* `piecewise` - weighted buckets with a uniform point inside each bucket
+  (the original Crash odds).
+* `house_edge` - the standard `(1 - edge) / (1 - U)` family rounded down to
+  0.01x. P(crash >= x) = (1 - edge) / x for every x >= 1, so any cash-out
+  target returns exactly 1 - edge per credit bet.
+"""
+
+import bisect
+import math
+import random
+from typing import List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the batch path
+    np = None
+
+# (cumulative probability, low, high) for each crash point bucket
+CRASH_BUCKETS = (
+    (0.33, 1.0, 2.0),    # 33% chance of crash between 1.0-2.0x
+    (0.65, 2.0, 4.0),    # 32% chance of crash between 2.0-4.0x
+    (0.85, 4.0, 7.0),    # 20% chance of crash between 4.0-7.0x
+    (0.95, 7.0, 15.0),   # 10% chance of crash between 7.0-15.0x
+    (1.0, 15.0, 50.0),   # 5% chance of crash above 15.0x (rare!)
+)
+
+# Cash-out targets offered in the Crash keyboard
+CASHOUT_TARGETS = (1.1, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 7.5, 10.0)
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("NumPy is required for batch Crash rounds (pip install numpy)")
+
+
+class CrashDistribution:
+    """A crash point distribution defined by its inverse CDF"""
+
+    name = ''
+
+    def inverse_cdf(self, u: float) -> float:
+        """Crash point for a uniform draw u in [0, 1)"""
+        raise NotImplementedError
+
+    def inverse_cdf_batch(self, u):
+        """Crash points for an array of uniform draws"""
+        raise NotImplementedError
+
+    def survival(self, multiplier: float) -> float:
+        """Probability that the crash point is at least multiplier"""
+        raise NotImplementedError
+
+    def rtp(self, target_multiplier: float) -> float:
+        """Expected return per credit when cashing out at target_multiplier"""
+        return target_multiplier * self.survival(target_multiplier)
+
+    def sample(self, rng: Optional[random.Random] = None) -> float:
+        """Draw one crash point"""
+        return self.inverse_cdf((rng or random).random())
+
+    def sample_batch(self, rounds: int, rng=None):
+        """Draw many crash points in one vectorized call"""
+        _require_numpy()
+        rng = rng if rng is not None else np.random.default_rng()
+        return self.inverse_cdf_batch(rng.random(rounds))
+
+
+class PiecewiseUniformDistribution(CrashDistribution):
+    """Weighted buckets with a uniform crash point inside each bucket"""
+
+    name = 'piecewise'
+
+    def __init__(self, buckets=CRASH_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._cumulative = [bucket[0] for bucket in self.buckets]
+        self._starts = [0.0] + self._cumulative[:-1]
+
+    def inverse_cdf(self, u: float) -> float:
+        index = min(bisect.bisect_right(self._cumulative, u), len(self.buckets) - 1)
+        cumulative, low, high = self.buckets[index]
+        start = self._starts[index]
+        return round(low + (u - start) / (cumulative - start) * (high - low), 2)
+
+    def inverse_cdf_batch(self, u):
+        _require_numpy()
+        cumulative = np.array(self._cumulative)
+        starts = np.array(self._starts)
+        lows = np.array([bucket[1] for bucket in self.buckets])
+        highs = np.array([bucket[2] for bucket in self.buckets])
+
+        index = np.minimum(np.searchsorted(cumulative, u, side='right'), len(self.buckets) - 1)
+        fraction = (u - starts[index]) / (cumulative[index] - starts[index])
+        return np.round(lows[index] + fraction * (highs[index] - lows[index]), 2)
+
+    def survival(self, multiplier: float) -> float:
+        probability = 0.0
+        for (cumulative, low, high), start in zip(self.buckets, self._starts):
+            weight = cumulative - start
+            if multiplier <= low:
+                probability += weight
+            elif multiplier < high:
+                probability += weight * (high - multiplier) / (high - low)
+        return probability
+
+
+class HouseEdgeDistribution(CrashDistribution):
+    """Crash point (1 - edge) / (1 - U) rounded down to 0.01x, at least 1.00x"""
+
+    name = 'house_edge'
+
+    def __init__(self, house_edge: float = 0.01, max_multiplier: Optional[float] = None):
+        if not 0 <= house_edge < 1:
+            raise ValueError("house_edge must be in [0, 1)")
+        self.house_edge = house_edge
+        self.max_multiplier = max_multiplier
+
+    def inverse_cdf(self, u: float) -> float:
+        point = max(math.floor(100 * (1 - self.house_edge) / (1 - u)) / 100, 1.0)
+        return min(point, self.max_multiplier) if self.max_multiplier else point
+
+    def inverse_cdf_batch(self, u):
+        _require_numpy()
+        points = np.maximum(np.floor(100 * (1 - self.house_edge) / (1 - u)) / 100, 1.0)
+        return np.minimum(points, self.max_multiplier) if self.max_multiplier else points
+
+    def survival(self, multiplier: float) -> float:
+        if multiplier <= 1.0:
+            return 1.0
+        if self.max_multiplier and multiplier > self.max_multiplier:
+            return 0.0
+        return min((1 - self.house_edge) / multiplier, 1.0)
+
+
+DISTRIBUTIONS = {
+    PiecewiseUniformDistribution.name: PiecewiseUniformDistribution,
+    HouseEdgeDistribution.name: HouseEdgeDistribution,
+}
+
+
+def make_distribution(name: str = 'piecewise', house_edge: float = 0.01,
+                      max_multiplier: Optional[float] = None) -> CrashDistribution:
+    """Build a crash distribution from config settings"""
+    if name == PiecewiseUniformDistribution.name:
+        return PiecewiseUniformDistribution()
+    if name == HouseEdgeDistribution.name:
+        return HouseEdgeDistribution(house_edge, max_multiplier)
+    raise ValueError(f"Unknown crash distribution '{name}' (choose from {', '.join(DISTRIBUTIONS)})")
+
+
+DEFAULT_DISTRIBUTION = PiecewiseUniformDistribution()
+
+
+class CrashPointBuffer:
+    """Crash points pre-drawn in bulk and handed out one round at a time"""
+
+    def __init__(self, distribution: CrashDistribution, batch_size: int = 4096, rng=None):
+        self.distribution = distribution
+        self.batch_size = batch_size
+        self._rng = rng
+        self._points: List[float] = []
+
+    def next(self) -> float:
+        """Get the crash point for the next round"""
+        if not self._points:
+            if np is None:
+                return self.distribution.sample(self._rng)
+            if self._rng is None:
+                self._rng = np.random.default_rng()
+            # Reversed so pop() hands points out in draw order
+            self._points = self.distribution.sample_batch(self.batch_size, self._rng)[::-1].tolist()
+        return self._points.pop()
+
+
+def generate_crash_multiplier(rng: Optional[random.Random] = None,
+                              distribution: CrashDistribution = DEFAULT_DISTRIBUTION) -> float:
+    """Generate a crash point with weighted probabilities"""
+    return distribution.sample(rng)
+
+
+def payout(bet_amount: int, target_multiplier: float, crash_point: float) -> int:
+    """Winnings for a round (0 when the crash comes before the target)"""
+    if target_multiplier <= crash_point:
+        return int(bet_amount * target_multiplier)
+    return 0
+
+
+# === BATCH SAMPLING AND SETTLEMENT (NumPy) ===
+
+def crash_multipliers(rounds: int, rng=None, distribution: CrashDistribution = DEFAULT_DISTRIBUTION):
+    """Draw many crash points at once"""
+    return distribution.sample_batch(rounds, rng)
+
+
+def settle_batch(bet_amounts, target_multipliers, crash_points):
+    """Winnings of many rounds at once (same rules as `payout`)"""
+    _require_numpy()
+    bet_amounts = np.asarray(bet_amounts, dtype=np.int64)
+    target_multipliers = np.asarray(target_multipliers, dtype=np.float64)
+    winnings = (bet_amounts * target_multipliers).astype(np.int64)
+    return np.where(target_multipliers <= crash_points, winnings, 0)
@@ -0,0 +1,228 @@
+"""
+Shared Crash Rounds for Telegram Games Bot
+==========================================
+
+Crash rounds that every player bets on together: one crash point per round
+and one live multiplier that all participants watch climb.
+
+A round collects bets during a betting window that opens with its first
+bet. It then launches, and the multiplier grows as `exp(growth_rate * t)`
+until it reaches the round's crash point. A single asyncio task runs every
+round, so the cost of a round does not depend on one task per player:
+
+* bets are appended to flat per-round columns (user, reservation, bet,
+  target, chat, message);
+* every tick refreshes only a bounded number of messages, taken round-robin
+  and at most once per `edit_interval` per chat, so a round with thousands
+  of bettors stays within Telegram's flood limits;
+* at the crash, every target is settled in one vectorized pass
+  (`crash.settle_batch`) followed by one bulk wallet update
+  (`UserStateStore.settle_many`).
+
+Bets placed while a round is in the air go to the next round. How rounds
+are shown is up to the `on_tick` and `on_settle` hooks.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import crash
+
+logger = logging.getLogger(__name__)
+
+# Round phases
+BETTING = 'betting'
+RUNNING = 'running'
+SETTLED = 'settled'
+
+
+class CrashRound:
+    """One shared round and its bets, stored column by column"""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.phase = BETTING
+        self.starts_at: Optional[float] = None  # set by the first bet
+        self.crash_point: Optional[float] = None
+        self.user_ids: List[int] = []
+        self.reservations: List[int] = []
+        self.bets: List[int] = []
+        self.targets: List[float] = []
+        self.chat_ids: List[int] = []
+        self.message_ids: List[int] = []
+        self.cursor = 0  # next bettor whose message a tick refreshes
+        self._joined: Dict[int, int] = {}  # user id -> index
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._joined
+
+
+class CrashRoundScheduler:
+    """Runs shared Crash rounds back to back from a single asyncio task"""
+
+    def __init__(self, store=None, crash_points=None, betting_window: float = 10.0, tick_interval: float = 1.0,
+                 growth_rate: float = 0.1, edit_interval: float = 2.0, edits_per_tick: int = 20,
+                 clock=time.monotonic):
+        if growth_rate <= 0:
+            raise ValueError("growth_rate must be positive")
+
+        # Both are filled in by the bot when left out
+        self.store = store                    # user_store.UserStateStore
+        self.crash_points = crash_points      # anything with next(), e.g. crash.CrashPointBuffer
+        self.betting_window = betting_window
+        self.tick_interval = tick_interval
+        self.growth_rate = growth_rate
+        self.edit_interval = edit_interval
+        self.edits_per_tick = edits_per_tick
+        self._clock = clock
+        # Bot used by the hooks to edit messages
+        self.bot = None
+        # Called with (round, multiplier, indices of the bettors whose message is due)
+        self.on_tick: Optional[Callable[[CrashRound, float, List[int]], Awaitable[None]]] = None
+        # Called with (round, winnings, new balances) once the round is settled
+        self.on_settle: Optional[Callable[[CrashRound, Sequence[int], List[Optional[int]]], Awaitable[None]]] = None
+
+        self.current: Optional[CrashRound] = None  # round in the air
+        self.next_round = CrashRound(1)            # round taking bets
+        self._bet_placed: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Counters
+        self.rounds = 0     # rounds settled
+        self.bets = 0       # bets placed
+        self.ticks = 0      # ticker steps
+        self.edits = 0      # message refreshes handed to on_tick
+
+    def multiplier_at(self, elapsed: float) -> float:
+        """Multiplier shown elapsed seconds after launch"""
+        return math.floor(math.exp(self.growth_rate * elapsed) * 100) / 100
+
+    def flight_time(self, crash_point: float) -> float:
+        """Seconds from launch until the multiplier reaches crash_point"""
+        return math.log(crash_point) / self.growth_rate
+
+    def place_bet(self, user_id: int, chat_id: int, message_id: int, bet_amount: int,
+                  target_multiplier: float, reservation: int) -> Optional[CrashRound]:
+        """Join the round taking bets with a held reservation
+
+        The round now owns the reservation and settles or releases it.
+        Returns the round, or None if the user already has a bet in it.
+        """
+        crash_round = self.next_round
+        if user_id in crash_round:
+            return None
+
+        crash_round._joined[user_id] = len(crash_round.user_ids)
+        crash_round.user_ids.append(user_id)
+        crash_round.reservations.append(reservation)
+        crash_round.bets.append(bet_amount)
+        crash_round.targets.append(target_multiplier)
+        crash_round.chat_ids.append(chat_id)
+        crash_round.message_ids.append(message_id)
+        if crash_round.starts_at is None:
+            crash_round.starts_at = self._clock() + self.betting_window
+        self.bets += 1
+
+        if self._worker is None or self._worker.done():
+            self._bet_placed = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        self._bet_placed.set()
+        return crash_round
+
+    def settle_round(self, crash_round: CrashRound):
+        """Settle every bet of a crashed round in one pass; returns (winnings, new balances)"""
+        if crash.np is not None:
+            winnings = crash.settle_batch(crash_round.bets, crash_round.targets, crash_round.crash_point).tolist()
+        else:
+            winnings = [crash.payout(bet, target, crash_round.crash_point)
+                        for bet, target in zip(crash_round.bets, crash_round.targets)]
+        balances = self.store.settle_many(crash_round.user_ids, crash_round.reservations, winnings, 'crash')
+        crash_round.phase = SETTLED
+        self.rounds += 1
+        return winnings, balances
+
+    async def close(self) -> None:
+        """Stop the rounds and give back every bet that was not settled"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        refunded = 0
+        for crash_round in (self.current, self.next_round):
+            if crash_round is None or crash_round.phase == SETTLED:
+                continue
+            for user_id, reservation in zip(crash_round.user_ids, crash_round.reservations):
+                refunded += self.store.release(user_id, reservation)
+        if refunded:
+            logger.warning(f"Refunded {refunded} Crash bets of unfinished rounds on shutdown")
+
+    def _due(self, crash_round: CrashRound, now: float, last_edit: Dict[int, float]) -> List[int]:
+        """Bettors whose message the next tick refreshes, round-robin within the edit budget"""
+        due: List[int] = []
+        count = len(crash_round)
+        for _ in range(count):
+            if len(due) >= self.edits_per_tick:
+                break
+            index = crash_round.cursor
+            crash_round.cursor = (index + 1) % count
+            chat_id = crash_round.chat_ids[index]
+            if now - last_edit.get(chat_id, -math.inf) >= self.edit_interval:
+                last_edit[chat_id] = now
+                due.append(index)
+        return due
+
+    async def _hook(self, hook, *args) -> None:
+        if hook is None:
+            return
+        try:
+            await hook(*args)
+        except Exception:
+            # A display problem must never stop the rounds
+            logger.exception("Crash round hook failed")
+
+    async def _run(self) -> None:
+        while True:
+            crash_round = self.next_round
+            if not len(crash_round):
+                self._bet_placed.clear()
+                await self._bet_placed.wait()
+                continue
+
+            wait = crash_round.starts_at - self._clock()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            # Launch: later bets go to the next round
+            self.current = crash_round
+            self.next_round = CrashRound(crash_round.number + 1)
+            crash_round.phase = RUNNING
+            crash_round.crash_point = self.crash_points.next()
+            launched = self._clock()
+            crash_at = launched + self.flight_time(crash_round.crash_point)
+            last_edit: Dict[int, float] = {}
+
+            while True:
+                now = self._clock()
+                if now >= crash_at:
+                    break
+                multiplier = min(self.multiplier_at(now - launched), crash_round.crash_point)
+                due = self._due(crash_round, now, last_edit)
+                self.ticks += 1
+                self.edits += len(due)
+                if due:
+                    await self._hook(self.on_tick, crash_round, multiplier, due)
+                await asyncio.sleep(max(0.0, min(self.tick_interval, crash_at - self._clock())))
+
+            winnings, balances = self.settle_round(crash_round)
+            await self._hook(self.on_settle, crash_round, winnings, balances)
+            self.current = None
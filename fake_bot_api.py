@@ -0,0 +1,314 @@
+"""
+Fake Telegram Bot API for Telegram Games Bot
+============================================
+
+An in-process stand-in for the Telegram Bot API, used by tests and
+benchmarks so the real `Application` wiring can run without a network.
+
+`FakeBotAPI` plugs into `Application.builder().request(...)`. It answers the
+methods the bot uses with plausible results, serves queued updates through
+`getUpdates` (long polling included), counts every call and can add a fixed
+latency per call to mimic the round trip to Telegram. Like Telegram, it
+rejects edits that would not change a message with "message is not
+modified", and with `flood_rate` set it enforces a per-chat flood limit on
+sent and edited messages, answering excess calls with 429 errors. A
+callback query can be answered once; `alerts` keeps the alert texts shown.
+`serve` puts the same fake behind a local HTTP server, for measuring the
+bot's real HTTP transport. `post_updates` plays the other direction:
+Telegram delivering updates to a webhook.
+"""
+
+import asyncio
+import collections
+import json
+import math
+import time
+import urllib.parse
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+from outbox import TokenBucket
+from webserver import BotHTTPServer
+
+FAKE_TOKEN = '123456:FAKE-TOKEN-FOR-OFFLINE-USE'
+FAKE_BOT_ID = 123456
+
+# Methods that count towards the per-chat flood limit
+FLOOD_LIMITED_METHODS = frozenset(('sendMessage', 'editMessageText', 'editMessageReplyMarkup'))
+# Methods served over HTTP by `serve` on top of the implemented ones
+SERVED_PLAIN_METHODS = ('deleteWebhook', 'setWebhook', 'setMyCommands')
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {'id': user_id, 'is_bot': False, 'first_name': f"Player{user_id}"}
+
+
+def _chat(chat_id: int) -> Dict[str, Any]:
+    return {'id': chat_id, 'type': 'private'}
+
+
+def message_update(update_id: int, user_id: int, text: str, message_id: int = 1) -> Dict[str, Any]:
+    """A text message (or /command) sent by user_id in their private chat"""
+    message = {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': _chat(user_id),
+        'from': _user(user_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> Dict[str, Any]:
+    """A tap by user_id on an inline button of a bot message"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': _chat(user_id),
+                'from': {'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'FakeBot'},
+                'text': '...',
+            },
+        },
+    }
+
+
+class APIError(Exception):
+    """Error answer of the fake Bot API"""
+
+    def __init__(self, error_code: int, description: str, parameters: Optional[Dict[str, Any]] = None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.parameters = parameters
+
+
+class FakeBotAPI(BaseRequest):
+    """In-process Bot API stand-in with call counters and optional latency"""
+
+    def __init__(self, latency: float = 0.0, flood_rate: Optional[float] = None, flood_burst: int = 3):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_burst = flood_burst
+        self.calls: collections.Counter = collections.Counter()
+        self.rate_limited = 0
+        self.not_modified = 0
+        self._flood_buckets: Dict[int, TokenBucket] = {}
+        # (chat id, message id) -> (text, markup) currently shown
+        self._screens: Dict[Tuple[int, int], Tuple[str, str]] = {}
+        self._answered: set = set()
+        self.alerts: List[str] = []
+        self._updates: collections.deque = collections.deque()
+        self._updates_changed: Optional[asyncio.Event] = None
+        self._calls_changed: Optional[asyncio.Event] = None
+        self._next_message_id = 1000
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _event(self, name: str) -> asyncio.Event:
+        event = getattr(self, name)
+        if event is None:
+            event = asyncio.Event()
+            setattr(self, name, event)
+        return event
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        """Queue an update for getUpdates"""
+        self._updates.append(update)
+        self._event('_updates_changed').set()
+
+    async def wait_for_calls(self, method: str, count: int, timeout: float = 30.0) -> None:
+        """Wait until method has been called at least count times"""
+        deadline = time.monotonic() + timeout
+        while self.calls[method] < count:
+            event = self._event('_calls_changed')
+            event.clear()
+            await asyncio.wait_for(event.wait(), max(deadline - time.monotonic(), 0))
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        return await self.call(url.rsplit('/', 1)[-1], request_data.parameters if request_data else {})
+
+    async def call(self, endpoint: str, params: Dict[str, Any]) -> Tuple[int, bytes]:
+        """Answer one Bot API call with its status and JSON body"""
+        # Half the round trip to reach Telegram, half for the response to return
+        if self.latency:
+            await asyncio.sleep(self.latency / 2)
+        try:
+            self._check_flood(endpoint, params)
+            handler = getattr(self, f'_api_{endpoint}', None)
+            status, body = 200, {'ok': True, 'result': await handler(params) if handler else True}
+        except APIError as e:
+            status, body = e.error_code, {'ok': False, 'error_code': e.error_code, 'description': e.description}
+            if e.parameters:
+                body['parameters'] = e.parameters
+        if self.latency:
+            await asyncio.sleep(self.latency / 2)
+
+        self.calls[endpoint] += 1
+        self._event('_calls_changed').set()
+        return status, json.dumps(body).encode()
+
+    def _check_flood(self, endpoint: str, params: Dict[str, Any]) -> None:
+        """Raise a 429 if the chat has sent too much lately"""
+        if self.flood_rate is None or endpoint not in FLOOD_LIMITED_METHODS:
+            return
+        now = time.monotonic()
+        chat_id = int(params.get('chat_id', 0))
+        bucket = self._flood_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._flood_buckets[chat_id] = TokenBucket(self.flood_rate, self.flood_burst, now)
+        wait = bucket.wait_time(now)
+        if wait > 0:
+            self.rate_limited += 1
+            retry_after = math.ceil(wait)
+            raise APIError(429, f"Too Many Requests: retry after {retry_after}", {'retry_after': retry_after})
+        bucket.take(now)
+
+    # === API METHODS ===
+
+    async def _api_getMe(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_games_bot',
+                'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+    async def _api_getUpdates(self, params: Dict[str, Any]):
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        timeout = float(params.get('timeout', 0))
+
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            event = self._event('_updates_changed')
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return [self._updates[index] for index in range(min(limit, len(self._updates)))]
+
+    def _message(self, params: Dict[str, Any], message_id: Optional[int] = None) -> Dict[str, Any]:
+        if message_id is None:
+            self._next_message_id += 1
+            message_id = self._next_message_id
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': _chat(int(params.get('chat_id', 0))),
+            'from': {'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'FakeBot'},
+            'text': params.get('text', ''),
+        }
+
+    def _show(self, params: Dict[str, Any], message: Dict[str, Any], text: str) -> None:
+        """Record what a message now shows; an identical edit is refused"""
+        key = (message['chat']['id'], message['message_id'])
+        screen = (text.strip(), json.dumps(params.get('reply_markup'), sort_keys=True))
+        if self._screens.get(key) == screen:
+            self.not_modified += 1
+            raise APIError(400, "Bad Request: message is not modified: specified new message content and reply "
+                                "markup are exactly the same as a current content and reply markup of the message")
+        self._screens[key] = screen
+
+    async def _api_sendMessage(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        message = self._message(params)
+        self._show(params, message, message['text'])
+        return message
+
+    async def _api_editMessageText(self, params: Dict[str, Any]):
+        if 'inline_message_id' in params:
+            return True
+        message = self._message(params, int(params['message_id']))
+        self._show(params, message, message['text'])
+        return message
+
+    async def _api_editMessageReplyMarkup(self, params: Dict[str, Any]):
+        if 'inline_message_id' in params:
+            return True
+        message = self._message(params, int(params['message_id']))
+        text = self._screens.get((message['chat']['id'], message['message_id']), ('',))[0]
+        self._show(params, message, text)
+        message['text'] = text
+        return message
+
+    async def _api_answerCallbackQuery(self, params: Dict[str, Any]) -> bool:
+        query_id = params['callback_query_id']
+        if query_id in self._answered:
+            raise APIError(400, "Bad Request: query is too old and response timeout expired or query id is invalid")
+        self._answered.add(query_id)
+        if params.get('show_alert'):
+            self.alerts.append(params.get('text', ''))
+        return True
+
+
+def _form_value(value: str) -> Any:
+    # Non-string parameters arrive JSON-encoded in the form (see RequestData.json_parameters)
+    if value[:1] in ('{', '[') or value in ('true', 'false'):
+        return json.loads(value)
+    return value
+
+
+async def serve(api: FakeBotAPI, host: str = '127.0.0.1', port: int = 0) -> BotHTTPServer:
+    """Serve api over HTTP for Bots with base_url `http://{host}:{server.port}/bot`"""
+    server = BotHTTPServer(host, port)
+    # Methods without an _api_ implementation just return True
+    endpoints = [name[len('_api_'):] for name in dir(api) if name.startswith('_api_')] + list(SERVED_PLAIN_METHODS)
+
+    def route(endpoint: str):
+        async def handle(headers: Dict[str, str], body: bytes):
+            params = {name: _form_value(value) for name, value in urllib.parse.parse_qsl(body.decode())}
+            status, response = await api.call(endpoint, params)
+            return status, 'application/json', response
+        return handle
+
+    for endpoint in endpoints:
+        server.add_route('POST', f'/bot{FAKE_TOKEN}/{endpoint}', route(endpoint))
+    await server.start()
+    return server
+
+
+async def post_updates(port: int, path: str, updates: List[Dict[str, Any]], secret_token: Optional[str] = None,
+                       connections: int = 8, host: str = '127.0.0.1') -> List[int]:
+    """POST updates to a webhook like Telegram does, over keep-alive connections
+
+    Each connection sends one update at a time and waits for the response
+    before the next. Returns the response status of every update.
+    """
+    statuses = [0] * len(updates)
+    secret_header = f"X-Telegram-Bot-Api-Secret-Token: {secret_token}\r\n" if secret_token else ""
+
+    async def deliver(indexes: range) -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for index in indexes:
+                body = json.dumps(updates[index]).encode()
+                writer.write(
+                    f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                    f"{secret_header}Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+                )
+                await writer.drain()
+                head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+                statuses[index] = int(head.split(' ', 2)[1])
+                for line in head.split('\r\n')[1:]:
+                    name, _, value = line.partition(':')
+                    if name.strip().lower() == 'content-length' and int(value):
+                        await reader.readexactly(int(value))
+        finally:
+            writer.close()
+
+    connections = max(min(connections, len(updates)), 1)
+    await asyncio.gather(*(deliver(range(start, len(updates), connections)) for start in range(connections)))
+    return statuses
@@ -0,0 +1,70 @@
+"""
+Message Fingerprints for Telegram Games Bot
+===========================================
+
+Remembers what was last rendered on each bot message so that edits which
+would not change anything are never sent. Telegram answers those with
+"message is not modified", which costs a round trip and an exception.
+
+A fingerprint is the hash of the text and the hash of the inline markup.
+Comparing them tells whether an edit can be skipped, needs only
+`editMessageReplyMarkup`, or needs a full `editMessageText`.
+"""
+
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+# What an edit changes compared to the rendered message
+UNCHANGED = 'unchanged'
+MARKUP_ONLY = 'markup_only'
+FULL = 'full'
+
+Fingerprint = Tuple[int, int]
+
+
+def fingerprint(text: str, reply_markup: Optional[Hashable] = None) -> Fingerprint:
+    """Fingerprint of a rendered message (Telegram ignores surrounding whitespace)"""
+    return hash(text.strip()), hash(reply_markup)
+
+
+class FingerprintCache:
+    """LRU map of (chat id, message id) to the fingerprint last rendered there"""
+
+    def __init__(self, max_messages: int = 10_000):
+        self.max_messages = max_messages
+        self._entries: 'OrderedDict[Tuple[int, int], Fingerprint]' = OrderedDict()
+
+        # Counters
+        self.unchanged = 0      # edits skipped because nothing changed
+        self.markup_only = 0    # edits reduced to editMessageReplyMarkup
+        self.full = 0           # edits sent with text
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def remember(self, chat_id: int, message_id: int, text: str, reply_markup: Optional[Hashable] = None) -> None:
+        """Record what a message shows, e.g. right after sending it"""
+        key = (chat_id, message_id)
+        self._entries[key] = fingerprint(text, reply_markup)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_messages:
+            self._entries.popitem(last=False)
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        """Drop a message whose content is no longer known (e.g. a failed edit)"""
+        self._entries.pop((chat_id, message_id), None)
+
+    def update(self, chat_id: int, message_id: int, text: str, reply_markup: Optional[Hashable] = None) -> str:
+        """Record a new rendering and return what changed: UNCHANGED, MARKUP_ONLY or FULL"""
+        new = fingerprint(text, reply_markup)
+        old = self._entries.get((chat_id, message_id))
+        self.remember(chat_id, message_id, text, reply_markup)
+
+        if old == new:
+            self.unchanged += 1
+            return UNCHANGED
+        if old is not None and old[0] == new[0]:
+            self.markup_only += 1
+            return MARKUP_ONLY
+        self.full += 1
+        return FULL
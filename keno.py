@@ -0,0 +1,122 @@
+"""
+Keno Engine for Telegram Games Bot
+==================================
+
+Keno picks and draws are integer bitmasks: bit n-1 is set when number n is
+in the set. Toggling a number is one XOR and counting matches is the
+popcount of `picks & draw`.
+
+The batch functions settle many rounds at once with NumPy (optional
+dependency) for simulation and bulk settlement. They use the same payout
+table as a single round, so both paths always agree.
+"""
+
+import random
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the batch path
+    np = None
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:  # Python < 3.10
+    def popcount(mask: int) -> int:
+        """Count the set bits of mask"""
+        return bin(mask).count('1')
+
+
+def numbers_to_mask(numbers) -> int:
+    """Convert numbers (1-based) to a bitmask"""
+    mask = 0
+    for number in numbers:
+        mask |= 1 << (number - 1)
+    return mask
+
+
+def mask_to_numbers(mask: int) -> List[int]:
+    """Convert a bitmask to its sorted numbers (1-based)"""
+    numbers = []
+    number = 1
+    while mask:
+        if mask & 1:
+            numbers.append(number)
+        mask >>= 1
+        number += 1
+    return numbers
+
+
+def toggle_number(mask: int, number: int) -> int:
+    """Select or deselect a number"""
+    return mask ^ (1 << (number - 1))
+
+
+def is_selected(mask: int, number: int) -> bool:
+    """Check whether a number is in the mask"""
+    return bool(mask >> (number - 1) & 1)
+
+
+def count_matches(picks: int, draw: int) -> int:
+    """Count picked numbers that were drawn"""
+    return popcount(picks & draw)
+
+
+def draw_mask(total_numbers: int = 20, drawn_numbers: int = 10, rng: Optional[random.Random] = None) -> int:
+    """Draw numbers without replacement and return them as a bitmask"""
+    rng = rng or random
+    return numbers_to_mask(rng.sample(range(1, total_numbers + 1), drawn_numbers))
+
+
+def payout(bet_amount: int, matches: int, payouts: Dict[int, int]) -> int:
+    """Winnings for a round (0 when the bet is lost)"""
+    return bet_amount * payouts.get(matches, 0)
+
+
+# === BATCH SETTLEMENT (NumPy) ===
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("NumPy is required for batch Keno settlement (pip install numpy)")
+
+
+def payout_vector(payouts: Dict[int, int], total_numbers: int = 20):
+    """Payout multipliers indexed by match count"""
+    _require_numpy()
+    return np.array([payouts.get(matches, 0) for matches in range(total_numbers + 1)], dtype=np.int64)
+
+
+if np is not None:
+    _POPCOUNT_8 = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def popcount_batch(masks):
+    """Popcount of every mask in a uint32 array"""
+    _require_numpy()
+    masks = np.ascontiguousarray(masks, dtype=np.uint32)
+    if hasattr(np, 'bitwise_count'):  # NumPy >= 2.0
+        return np.bitwise_count(masks).astype(np.int64)
+    return _POPCOUNT_8[masks.view(np.uint8)].reshape(masks.shape + (4,)).sum(axis=-1, dtype=np.int64)
+
+
+def draw_masks(rounds: int, total_numbers: int = 20, drawn_numbers: int = 10, rng=None):
+    """Draw many rounds at once and return their bitmasks as a uint32 array"""
+    _require_numpy()
+    rng = rng if rng is not None else np.random.default_rng()
+    # The first drawn_numbers positions of a random permutation of every row
+    order = np.argpartition(rng.random((rounds, total_numbers), dtype=np.float32), drawn_numbers - 1, axis=1)
+    bits = np.left_shift(np.uint32(1), order[:, :drawn_numbers].astype(np.uint32))
+    return np.bitwise_or.reduce(bits, axis=1).astype(np.uint32)
+
+
+def count_matches_batch(picks, draws):
+    """Match counts of many tickets against their draws (broadcasts)"""
+    _require_numpy()
+    return popcount_batch(np.bitwise_and(np.asarray(picks, dtype=np.uint32), np.asarray(draws, dtype=np.uint32)))
+
+
+def settle_batch(picks, draws, bet_amounts, payouts: Dict[int, int], total_numbers: int = 20,
+                 table: Optional["np.ndarray"] = None):
+    """Winnings of many rounds at once (same rules as `payout`)"""
+    table = payout_vector(payouts, total_numbers) if table is None else table
+    return np.asarray(bet_amounts, dtype=np.int64) * table[count_matches_batch(picks, draws)]
@@ -0,0 +1,172 @@
+"""
+Scheduled Keno Draws for Telegram Games Bot
+===========================================
+
+Draw-based Keno: tickets are queued until the next scheduled draw, and one
+draw settles every queued ticket.
+
+Tickets are kept as flat columns (user, reservation, picks bitmask, bet,
+chat, message). A draw turns them into arrays and settles all of them in
+one vectorized pass (`keno.settle_batch`: AND with the draw mask, popcount,
+look up the payout table), followed by one bulk wallet update
+(`UserStateStore.settle_many`). Without NumPy the same rules run ticket by
+ticket.
+
+Draws run on the application's JobQueue (`python-telegram-bot[job-queue]`).
+When it is not installed, a plain asyncio task started with the
+application takes its place.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import keno
+
+logger = logging.getLogger(__name__)
+
+
+class KenoDraw:
+    """One scheduled draw and the tickets queued for it, stored column by column"""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.drawn_mask: Optional[int] = None  # set by the draw
+        self.user_ids: List[int] = []
+        self.reservations: List[int] = []
+        self.picks: List[int] = []
+        self.bets: List[int] = []
+        self.chat_ids: List[int] = []
+        self.message_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+
+class KenoDrawScheduler:
+    """Queues Keno tickets and settles them at scheduled draws"""
+
+    def __init__(self, payouts: Dict[int, int], total_numbers: int = 20, drawn_numbers: int = 10,
+                 interval: float = 60.0, store=None, rng=None, clock=time.monotonic):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+
+        self.payouts = payouts
+        self.total_numbers = total_numbers
+        self.drawn_numbers = drawn_numbers
+        self.interval = interval
+        # Filled in by the bot when left out
+        self.store = store  # user_store.UserStateStore
+        self._rng = rng
+        self._clock = clock
+        self._table = keno.payout_vector(payouts, total_numbers) if keno.np is not None else None
+        # Bot used by the hook to edit messages
+        self.bot = None
+        # Called with (draw, match counts, winnings, new balances) once a draw is settled
+        self.on_settle: Optional[Callable[[KenoDraw, Sequence[int], Sequence[int], List[Optional[int]]],
+                                          Awaitable[None]]] = None
+
+        self.next_draw = KenoDraw(1)
+        self.next_draw_at: Optional[float] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Counters
+        self.draws = 0      # draws with at least one ticket
+        self.tickets = 0    # tickets queued
+
+    def queue_ticket(self, user_id: int, chat_id: int, message_id: int, picks: int, bet_amount: int,
+                     reservation: int) -> KenoDraw:
+        """Queue a ticket for the next draw with a held reservation
+
+        The draw now owns the reservation and settles or releases it.
+        """
+        ticket_draw = self.next_draw
+        ticket_draw.user_ids.append(user_id)
+        ticket_draw.reservations.append(reservation)
+        ticket_draw.picks.append(picks)
+        ticket_draw.bets.append(bet_amount)
+        ticket_draw.chat_ids.append(chat_id)
+        ticket_draw.message_ids.append(message_id)
+        self.tickets += 1
+        return ticket_draw
+
+    def seconds_to_draw(self) -> Optional[float]:
+        """Seconds until the next draw, None before draws are scheduled"""
+        if self.next_draw_at is None:
+            return None
+        return max(0.0, self.next_draw_at - self._clock())
+
+    def settle_draw(self, drawn_mask: Optional[int] = None):
+        """Draw and settle every queued ticket in one pass
+
+        Returns (draw, match counts, winnings, new balances).
+        """
+        settled, self.next_draw = self.next_draw, KenoDraw(self.next_draw.number + 1)
+        if drawn_mask is None:
+            drawn_mask = keno.draw_mask(self.total_numbers, self.drawn_numbers, self._rng)
+        settled.drawn_mask = drawn_mask
+
+        count = len(settled)
+        if keno.np is not None:
+            np = keno.np
+            picks = np.fromiter(settled.picks, dtype=np.uint32, count=count)
+            bets = np.fromiter(settled.bets, dtype=np.int64, count=count)
+            matches = keno.count_matches_batch(picks, drawn_mask)
+            winnings = (bets * self._table[matches]).tolist()
+            matches = matches.tolist()
+        else:
+            matches = [keno.count_matches(picks, drawn_mask) for picks in settled.picks]
+            winnings = [keno.payout(bet, hits, self.payouts) for bet, hits in zip(settled.bets, matches)]
+
+        balances = self.store.settle_many(settled.user_ids, settled.reservations, winnings, 'keno')
+        if count:
+            self.draws += 1
+        return settled, matches, winnings, balances
+
+    async def run_draw(self) -> None:
+        """Settle the next draw and show its results"""
+        self.next_draw_at = self._clock() + self.interval
+        if not len(self.next_draw):
+            return
+        result = self.settle_draw()
+        if self.on_settle is not None:
+            try:
+                await self.on_settle(*result)
+            except Exception:
+                # A display problem must never stop the draws
+                logger.exception("Keno draw hook failed")
+
+    def schedule(self, application) -> None:
+        """Run a draw every interval on the application's JobQueue"""
+        self.next_draw_at = self._clock() + self.interval
+        if application.job_queue is not None:
+            application.job_queue.run_repeating(self._draw_job, interval=self.interval, first=self.interval,
+                                                name='keno_draw')
+        else:
+            logger.info("No JobQueue, running Keno draws from an asyncio task")
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _draw_job(self, context) -> None:
+        await self.run_draw()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(max(0.0, self.next_draw_at - self._clock()))
+            await self.run_draw()
+
+    async def close(self) -> None:
+        """Stop the fallback task and give back the tickets of the draw that did not happen"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        pending = self.next_draw
+        refunded = sum(self.store.release(user_id, reservation)
+                       for user_id, reservation in zip(pending.user_ids, pending.reservations))
+        if refunded:
+            logger.warning(f"Refunded {refunded} Keno tickets of the next draw on shutdown")
@@ -0,0 +1,122 @@
+"""
+Keno Odds for Telegram Games Bot
+================================
+
+Exact Keno probabilities and return to player (RTP).
+
+A Keno draw takes `drawn` numbers out of `total` without replacement, so the
+number of matches on a ticket with `picks` numbers is hypergeometric:
+
+    P(k matches) = C(picks, k) * C(total - picks, drawn - k) / C(total, drawn)
+
+Everything is computed with exact fractions and memoized, so the tables are
+built once per configuration and every later lookup is a cache hit.
+"""
+
+from fractions import Fraction
+from functools import lru_cache
+from math import comb
+from typing import Dict, Optional, Tuple
+
+PayoutItems = Tuple[Tuple[int, int], ...]
+
+
+def payout_items(payouts: Dict[int, int]) -> PayoutItems:
+    """Hashable form of a payout table, used as a cache key"""
+    return tuple(sorted(payouts.items()))
+
+
+@lru_cache(maxsize=None)
+def match_probabilities(picks: int, total: int = 20, drawn: int = 10) -> Tuple[Fraction, ...]:
+    """Exact probability of 0..picks matches for a ticket with `picks` numbers"""
+    if not 0 < picks <= total or not 0 < drawn <= total:
+        raise ValueError("picks and drawn must be between 1 and total")
+
+    draws = comb(total, drawn)
+    return tuple(
+        Fraction(comb(picks, matches) * comb(total - picks, drawn - matches), draws)
+        for matches in range(picks + 1)
+    )
+
+
+@lru_cache(maxsize=None)
+def odds_table(total: int = 20, drawn: int = 10, max_picks: int = 10) -> Dict[int, Tuple[Fraction, ...]]:
+    """Match probabilities for every pick count from 1 to max_picks"""
+    return {picks: match_probabilities(picks, total, drawn) for picks in range(1, max_picks + 1)}
+
+
+@lru_cache(maxsize=None)
+def _rtp(picks: int, payouts: PayoutItems, total: int, drawn: int) -> Fraction:
+    multipliers = dict(payouts)
+    return sum(
+        (probability * multipliers.get(matches, 0)
+         for matches, probability in enumerate(match_probabilities(picks, total, drawn))),
+        Fraction(0)
+    )
+
+
+def rtp(picks: int, payouts: Dict[int, int], total: int = 20, drawn: int = 10) -> Fraction:
+    """Exact expected return per credit bet for a ticket with `picks` numbers"""
+    return _rtp(picks, payout_items(payouts), total, drawn)
+
+
+def rtp_table(payouts: Dict[int, int], total: int = 20, drawn: int = 10, max_picks: int = 10) -> Dict[int, Fraction]:
+    """Exact RTP for every pick count from 1 to max_picks"""
+    return {picks: rtp(picks, payouts, total, drawn) for picks in range(1, max_picks + 1)}
+
+
+def check_payouts(payouts: Dict[int, int], target_rtp: Optional[float], total: int = 20,
+                  drawn: int = 10, max_picks: int = 10) -> None:
+    """Raise ValueError if any pick count returns more than target_rtp"""
+    if target_rtp is None:
+        return
+    for picks, value in rtp_table(payouts, total, drawn, max_picks).items():
+        if value > Fraction(target_rtp):
+            raise ValueError(
+                f"KENO_PAYOUTS return {float(value):.2%} with {picks} picks, "
+                f"above the target RTP of {target_rtp:.2%}"
+            )
+
+
+def _describe_multiplier(multiplier: int) -> str:
+    if multiplier == 0:
+        return "Lose bet"
+    if multiplier == 1:
+        return "Break even (1x)"
+    return f"{multiplier}x bet"
+
+
+@lru_cache(maxsize=None)
+def _payout_table_text(payouts: PayoutItems, total: int, drawn: int, max_picks: int) -> str:
+    multipliers = dict(payouts)
+
+    # Group runs of match counts that pay the same, e.g. "0-1 matches: Lose bet"
+    lines = []
+    first = 0
+    for matches in range(1, max_picks + 2):
+        if matches <= max_picks and multipliers.get(matches, 0) == multipliers.get(first, 0):
+            continue
+        last = matches - 1
+        if first == last:
+            label = f"{first} match" if first == 1 else f"{first} matches"
+        elif last == max_picks and first > 0:
+            label = f"{first}+ matches"
+        else:
+            label = f"{first}-{last} matches"
+        lines.append(f"• {label}: {_describe_multiplier(multipliers.get(first, 0))}")
+        first = matches
+
+    returns = [
+        f"{picks} → {float(_rtp(picks, payouts, total, drawn)):.1%}"
+        for picks in range(1, max_picks + 1)
+    ]
+    lines.append("")
+    lines.append("**📈 Return by Numbers Picked:**")
+    for start in range(0, len(returns), 5):
+        lines.append(" | ".join(returns[start:start + 5]))
+    return "\n".join(lines)
+
+
+def payout_table_text(payouts: Dict[int, int], total: int = 20, drawn: int = 10, max_picks: int = 10) -> str:
+    """Payout table with the exact return for every pick count, rendered once per table"""
+    return _payout_table_text(payout_items(payouts), total, drawn, max_picks)
@@ -0,0 +1,76 @@
+"""
+Inline Keyboards for Telegram Games Bot
+=======================================
+
+Keno number grid and Crash target markups, cached by selection.
+
+A selection is a 20-bit mask where bit n-1 is set when number n is picked.
+Telegram objects are immutable, so every button is built once at import time
+and shared by all markups, and a whole markup is built at most once per
+distinct selection. Tapping a number then costs a cache lookup.
+"""
+
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import CRASH_PLAY, CRASH_TARGET, KENO_CLEAR, KENO_PLAY, KENO_SELECT, MAIN_MENU, encode
+from crash import CASHOUT_TARGETS
+
+KENO_GRID_ROWS = 4
+KENO_GRID_COLUMNS = 5
+KENO_GRID_NUMBERS = KENO_GRID_ROWS * KENO_GRID_COLUMNS
+
+# Distinct selections kept in the markup cache
+KENO_MARKUP_CACHE_SIZE = 4096
+
+_KENO_UNSELECTED = tuple(
+    InlineKeyboardButton(str(number), callback_data=encode(KENO_SELECT, number))
+    for number in range(1, KENO_GRID_NUMBERS + 1)
+)
+_KENO_SELECTED = tuple(
+    InlineKeyboardButton(f"✅{number}", callback_data=encode(KENO_SELECT, number))
+    for number in range(1, KENO_GRID_NUMBERS + 1)
+)
+_KENO_CONTROL_ROW = (
+    InlineKeyboardButton("🎲 PLAY", callback_data=encode(KENO_PLAY)),
+    InlineKeyboardButton("🔄 Clear All", callback_data=encode(KENO_CLEAR)),
+    InlineKeyboardButton("❌ Cancel", callback_data=encode(MAIN_MENU))
+)
+
+
+@lru_cache(maxsize=KENO_MARKUP_CACHE_SIZE)
+def keno_grid_markup(mask: int) -> InlineKeyboardMarkup:
+    """Get the Keno number grid plus control row for a selection bitmask"""
+    keyboard = []
+    for row in range(KENO_GRID_ROWS):
+        first = row * KENO_GRID_COLUMNS
+        keyboard.append(tuple(
+            _KENO_SELECTED[index] if mask >> index & 1 else _KENO_UNSELECTED[index]
+            for index in range(first, first + KENO_GRID_COLUMNS)
+        ))
+    keyboard.append(_KENO_CONTROL_ROW)
+    return InlineKeyboardMarkup(tuple(keyboard))
+
+
+# Crash cash-out targets, four per row
+CRASH_TARGET_COLUMNS = 4
+
+_CRASH_CONTROL_ROW = (
+    InlineKeyboardButton("🚀 LAUNCH", callback_data=encode(CRASH_PLAY)),
+    InlineKeyboardButton("❌ Cancel", callback_data=encode(MAIN_MENU))
+)
+
+
+@lru_cache(maxsize=None)
+def crash_target_markup(selected: float = 0.0) -> InlineKeyboardMarkup:
+    """Get the Crash cash-out target buttons plus control row, with selected ticked"""
+    buttons = [
+        InlineKeyboardButton(f"✅{target:.1f}x" if target == selected else f"{target:.1f}x",
+                             callback_data=encode(CRASH_TARGET, target))
+        for target in CASHOUT_TARGETS
+    ]
+    keyboard = [tuple(buttons[first:first + CRASH_TARGET_COLUMNS])
+                for first in range(0, len(buttons), CRASH_TARGET_COLUMNS)]
+    keyboard.append(_CRASH_CONTROL_ROW)
+    return InlineKeyboardMarkup(tuple(keyboard))
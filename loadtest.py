@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Offline Load Test for Telegram Games Bot
+========================================
+
+Synthetic users play full Keno and Crash games against the bot wired the
+way `main()` wires it (wallet ledger, conversation persistence, outbound
+edit queue, metrics and long polling), with `fake_bot_api.FakeBotAPI`
+standing in for Telegram, so the whole run stays on this machine.
+
+Every user is a coroutine that sends one update, waits until the bot has
+handled it and sends the next, so many users play at once while each
+user's moves stay in order. Handler latency is the time from the first to
+the last handler group of an update; end-to-end latency also counts the
+time the update waited to be fetched. Shared Crash rounds run on a short
+schedule and the run waits for the last of them to land, so every Crash bet
+is settled; the run fails when fewer rounds settle than were bet on. With
+--quick every game is a single quick-bet command (`/keno 50 3 7 12`,
+`/crash 100 2.5`) instead of the step-by-step conversation. The ledger and
+conversation logs go to a temporary directory.
+
+By default Telegram's flood limits are lifted from the outbound queue, so
+the run measures the bot rather than the pacing; --paced keeps the
+configured rates. With --max-p99 and --min-rate the exit status is 1 when
+the run misses them, so the load test can gate performance regressions.
+
+Usage:
+    python loadtest.py --users 200 --games 4
+    python loadtest.py --users 500 --max-p99 5 --min-rate 1000
+    python loadtest.py --users 50 --api-latency 0.02 --paced
+    python loadtest.py --users 200 --quick
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import Dict, List, NamedTuple, Optional
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.warnings import PTBUserWarning
+
+import callbacks
+import crash
+from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+from metrics import Metrics
+from telegram_games_bot import (
+    CONCURRENT_UPDATES, KENO_MAX_PICKS, KENO_TOTAL_NUMBERS, MIN_BET, build_application, build_bot, build_persistence
+)
+from webserver import run_application
+
+# Outbound rate (per chat and overall) when Telegram's flood limits are lifted
+UNPACED_RATE = 1_000_000.0
+# Shared Crash rounds run on a short schedule, so every bet settles within the run
+LOAD_CRASH_BETTING_WINDOW = 0.05  # seconds
+LOAD_CRASH_GROWTH_RATE = 20.0     # the 1000x cap is reached 0.35 s after launch
+# Longest wait for the last Crash rounds to land after the players are done
+SETTLE_TIMEOUT = 30.0
+
+
+class LoadResult(NamedTuple):
+    """Outcome of a load test run"""
+    updates: int
+    elapsed: float
+    handler_latency: List[float]     # seconds per update
+    end_to_end_latency: List[float]  # seconds per update
+    played: Dict[str, int]           # rounds bet on per game
+    settled: Dict[str, int]          # rounds settled per game
+    errors: int                      # exceptions raised by handlers
+    api_calls: int                   # Bot API requests other than getUpdates
+
+    @property
+    def rate(self) -> float:
+        return self.updates / self.elapsed if self.elapsed else 0.0
+
+
+class UpdateTimer:
+    """Times every update through the handler groups and wakes whoever waits for it"""
+
+    def __init__(self):
+        self.handler_latency: List[float] = []
+        self._started: Dict[int, float] = {}
+        self._waiters: Dict[int, asyncio.Future] = {}
+
+    def attach(self, application: Application) -> None:
+        """Register the timing handlers around every other group"""
+        application.add_handler(TypeHandler(Update, self._start), group=-100)
+        application.add_handler(TypeHandler(Update, self._finish), group=100)
+
+    def expect(self, update_id: int) -> asyncio.Future:
+        """Future set to the time update_id has been handled"""
+        waiter = self._waiters[update_id] = asyncio.get_running_loop().create_future()
+        return waiter
+
+    async def _start(self, update: Update, context) -> None:
+        self._started[update.update_id] = time.perf_counter()
+
+    async def _finish(self, update: Update, context) -> None:
+        now = time.perf_counter()
+        self.handler_latency.append(now - self._started.pop(update.update_id, now))
+        waiter = self._waiters.pop(update.update_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(now)
+
+
+async def run_load(users: int = 200, games: int = 4, think: float = 0.0, api_latency: float = 0.0,
+                   paced: bool = False, seed: int = 0, concurrent_updates: int = CONCURRENT_UPDATES,
+                   quick: bool = False) -> LoadResult:
+    """Let users each play games alternating Keno and Crash rounds (as quick bets with quick), and measure the bot"""
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics = Metrics()
+        rate = {} if paced else {'outbox_global_rate': UNPACED_RATE, 'outbox_chat_rate': UNPACED_RATE}
+        bot = build_bot(metrics, ledger_path=os.path.join(tmp, 'wallet.db'),
+                        crash_betting_window=LOAD_CRASH_BETTING_WINDOW, crash_growth_rate=LOAD_CRASH_GROWTH_RATE,
+                        **rate)
+        api = FakeBotAPI(latency=api_latency)
+        application = build_application(bot, token=FAKE_TOKEN, request=api, get_updates_request=api,
+                                        persistence=build_persistence(os.path.join(tmp, 'state')),
+                                        concurrent_updates=concurrent_updates)
+        timer = UpdateTimer()
+        timer.attach(application)
+
+        update_ids = itertools.count(1)
+        end_to_end: List[float] = []
+        played = {'keno': 0, 'crash': 0}
+
+        async def send(data) -> None:
+            waiter = timer.expect(data['update_id'])
+            sent = time.perf_counter()
+            api.push_update(data)
+            end_to_end.append(await waiter - sent)
+            if think:
+                await asyncio.sleep(think)
+
+        def can_bet(user_id: int, bet: int) -> bool:
+            # Players who went broke stop betting rather than have their bets refused
+            return bot.store.get_available_balance(user_id) >= bet
+
+        async def play_keno(user_id: int, rng: random.Random) -> None:
+            bet = rng.randrange(MIN_BET, 5 * MIN_BET + 1)
+            numbers = rng.sample(range(1, KENO_TOTAL_NUMBERS + 1), rng.randint(1, KENO_MAX_PICKS))
+            if not can_bet(user_id, bet):
+                return
+            played['keno'] += 1
+            if quick:
+                await send(message_update(next(update_ids), user_id, f"/keno {bet} {' '.join(map(str, numbers))}"))
+                return
+            await send(message_update(next(update_ids), user_id, "/keno"))
+            await send(message_update(next(update_ids), user_id, str(bet)))
+            for number in numbers:
+                await send(callback_update(next(update_ids), user_id, callbacks.encode(callbacks.KENO_SELECT, number),
+                                           user_id))
+            await send(callback_update(next(update_ids), user_id, callbacks.encode(callbacks.KENO_PLAY), user_id))
+
+        async def play_crash(user_id: int, rng: random.Random) -> None:
+            bet = rng.randrange(MIN_BET, 5 * MIN_BET + 1)
+            target = rng.choice(crash.CASHOUT_TARGETS)
+            # One bet per round: wait for the round taking bets to launch
+            while bot.crash_rounds is not None and user_id in bot.crash_rounds.next_round:
+                await asyncio.sleep(LOAD_CRASH_BETTING_WINDOW / 5)
+            if not can_bet(user_id, bet):
+                return
+            played['crash'] += 1
+            if quick:
+                await send(message_update(next(update_ids), user_id, f"/crash {bet} {target}"))
+                return
+            await send(message_update(next(update_ids), user_id, "/crash"))
+            await send(message_update(next(update_ids), user_id, str(bet)))
+            await send(callback_update(next(update_ids), user_id, callbacks.encode(callbacks.CRASH_TARGET, target),
+                                       user_id))
+            await send(callback_update(next(update_ids), user_id, callbacks.encode(callbacks.CRASH_PLAY), user_id))
+
+        async def player(user_id: int) -> None:
+            rng = random.Random(seed * 1_000_003 + user_id)
+            await send(message_update(next(update_ids), user_id, "/start"))
+            for game in range(games):
+                if (user_id + game) % 2:
+                    await play_crash(user_id, rng)
+                else:
+                    await play_keno(user_id, rng)
+
+        stop_event = asyncio.Event()
+        running = asyncio.ensure_future(run_application(application, stop_event=stop_event))
+        try:
+            # Wait for polling to start
+            while not (application.updater and application.updater.running):
+                if running.done():
+                    running.result()
+                await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            await asyncio.gather(*(player(user_id) for user_id in range(1, users + 1)))
+            elapsed = time.perf_counter() - start
+            await wait_for_rounds(bot)
+        finally:
+            stop_event.set()
+            await running
+            bot.store.ledger.close()
+
+        settled: Dict[str, int] = {}
+        for (game, outcome), count in metrics.settlements.values.items():
+            if outcome != 'refund':
+                settled[game] = settled.get(game, 0) + int(count)
+        return LoadResult(len(timer.handler_latency), elapsed, timer.handler_latency, end_to_end, played, settled,
+                          int(sum(metrics.handler_errors.values.values())),
+                          sum(api.calls.values()) - api.calls['getUpdates'])
+
+
+async def wait_for_rounds(bot, timeout: float = SETTLE_TIMEOUT) -> None:
+    """Wait until the shared Crash rounds have settled every bet placed"""
+    rounds = bot.crash_rounds
+    deadline = time.monotonic() + timeout
+    while rounds is not None and (rounds.current is not None or len(rounds.next_round)):
+        if time.monotonic() > deadline:
+            return  # The unsettled bets make the run fail
+        await asyncio.sleep(0.01)
+
+
+def percentiles(samples: List[float]) -> Dict[int, float]:
+    """p50, p95 and p99 of samples"""
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {50: value, 95: value, 99: value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {50: cuts[49], 95: cuts[94], 99: cuts[98]}
+
+
+def print_report(result: LoadResult) -> None:
+    """Print throughput and latency percentiles"""
+    print(f"📨 {result.updates:,} updates in {result.elapsed:.2f}s: {result.rate:,.0f} updates/s")
+    for label, samples in (("Handler", result.handler_latency), ("End-to-end", result.end_to_end_latency)):
+        cuts = percentiles(samples)
+        print(f"   {label + ' latency:':<21}p50 {cuts[50] * 1000:7.2f} ms   p95 {cuts[95] * 1000:7.2f} ms   "
+              f"p99 {cuts[99] * 1000:7.2f} ms")
+    games = ", ".join(f"{game} {result.settled.get(game, 0):,} of {count:,}"
+                      for game, count in sorted(result.played.items())) or "none"
+    print(f"   Rounds settled: {games} | Bot API calls: {result.api_calls:,} | handler errors: {result.errors}")
+
+
+def main(argv: Optional[List[str]] = None) -> bool:
+    """Run the load test from the command line"""
+    parser = argparse.ArgumentParser(description="Offline load test of the bot with synthetic players")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--games', type=int, default=4, help="games per user, alternating Keno and Crash")
+    parser.add_argument('--think', type=float, default=0.0, help="seconds a user waits between moves")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="seconds per fake Bot API call")
+    parser.add_argument('--paced', action='store_true', help="keep the configured outbound rate limits")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENT_UPDATES,
+                        help="updates of different users handled at once")
+    parser.add_argument('--quick', action='store_true', help="play every game as one quick-bet command")
+    parser.add_argument('--max-p99', type=float, default=None, help="fail above this p99 handler latency (ms)")
+    parser.add_argument('--min-rate', type=float, default=None, help="fail below this many updates per second")
+    args = parser.parse_args(argv)
+
+    # Keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings('ignore', category=PTBUserWarning)
+
+    print("🏋️ Telegram Games Bot Load Test")
+    print("=" * 40)
+    print(f"Users: {args.users:,} | Games per user: {args.games} | Think time: {args.think}s | "
+          f"API latency: {args.api_latency}s | Concurrency: {args.concurrency} | "
+          f"{'Paced' if args.paced else 'Unpaced'}{' | Quick bets' if args.quick else ''}")
+    result = asyncio.run(run_load(args.users, args.games, args.think, args.api_latency, args.paced, args.seed,
+                                  args.concurrency, args.quick))
+    print_report(result)
+
+    passed = result.errors == 0
+    p99 = percentiles(result.handler_latency)[99] * 1000
+    if args.max_p99 is not None and p99 > args.max_p99:
+        print(f"❌ p99 handler latency {p99:.2f} ms is above {args.max_p99} ms")
+        passed = False
+    if args.min_rate is not None and result.rate < args.min_rate:
+        print(f"❌ {result.rate:,.0f} updates/s is below {args.min_rate:,.0f}")
+        passed = False
+    if result.errors:
+        print(f"❌ Handlers raised {result.errors} exceptions")
+    unsettled = {game: count - result.settled.get(game, 0) for game, count in result.played.items()
+                 if result.settled.get(game, 0) < count}
+    if unsettled:
+        print(f"❌ Rounds bet on but never settled: {unsettled}")
+        passed = False
+    if passed:
+        print("✅ Load test passed")
+    return passed
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
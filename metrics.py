@@ -0,0 +1,366 @@
+"""
+Metrics for Telegram Games Bot
+==============================
+
+Counters, gauges and latency histograms rendered in the Prometheus text
+exposition format and served on `/metrics` by the bot's HTTP server.
+
+Metrics are only collected when a `Metrics` object is passed to the bot.
+Without one, handlers are registered unwrapped and the only remaining cost is
+an `is None` check per settlement. Gauges are computed when scraped, so
+nothing is tracked between scrapes.
+"""
+
+import bisect
+import functools
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ConversationHandler, TypeHandler
+
+from callbacks import CallbackRouter
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Handler latency buckets in seconds (most handlers wait on one Bot API call)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Add amount to the series with these label values"""
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Gauge:
+    """Series computed by a callback at scrape time
+
+    Exported as a gauge, or as a counter when the callback reads a counter
+    kept elsewhere.
+    """
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[LabelValues, float]], kind: str = 'gauge'):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in sorted(self.collect().items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    """Histogram with fixed buckets and optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self.series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record one observation"""
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> Iterable[str]:
+        bucket_labels = self.labels + ('le',)
+        for label_values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(bucket_labels, label_values + (_number(bound),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+def update_type(update: Update) -> str:
+    """Name of the field that carries the update's payload, e.g. 'callback_query'"""
+    for field in Update.ALL_TYPES:
+        if getattr(update, field, None) is not None:
+            return field
+    return 'unknown'
+
+
+class Metrics:
+    """All metrics of the bot plus the hooks that feed them"""
+
+    def __init__(self):
+        self.handler_latency = Histogram(
+            'telegram_games_handler_duration_seconds', "Time spent in each handler", ('handler',))
+        self.handler_errors = Counter(
+            'telegram_games_handler_errors_total', "Exceptions raised by each handler", ('handler',))
+        self.updates = Counter(
+            'telegram_games_updates_total', "Updates received by type", ('type',))
+        self.settlements = Counter(
+            'telegram_games_settlements_total', "Settled rounds by game and outcome", ('game', 'outcome'))
+        self.wagered = Counter(
+            'telegram_games_wagered_credits_total', "Credits bet on settled rounds", ('game',))
+        self.paid = Counter(
+            'telegram_games_paid_credits_total', "Credits paid out on settled rounds", ('game',))
+        self.api_latency = Histogram(
+            'telegram_games_bot_api_duration_seconds', "Bot API calls by connection pool and endpoint",
+            ('pool', 'endpoint'))
+        self.pool_wait = Histogram(
+            'telegram_games_bot_api_pool_wait_seconds', "Time Bot API calls waited for a free connection",
+            ('pool',))
+        self._metrics: List = [self.updates, self.handler_latency, self.handler_errors,
+                               self.settlements, self.wagered, self.paid, self.api_latency, self.pool_wait]
+        self._conversations: List[Tuple[str, ConversationHandler, Dict[object, str]]] = []
+        self.gauge('telegram_games_conversations', "Open conversations by state",
+                   ('conversation', 'state'), self._collect_conversations)
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str],
+              collect: Callable[[], Dict[LabelValues, float]], kind: str = 'gauge') -> Gauge:
+        """Register a gauge computed by collect() on every scrape"""
+        gauge = Gauge(name, help_text, labels, collect, kind)
+        self._metrics.append(gauge)
+        return gauge
+
+    # === HOOKS ===
+
+    def instrument(self, callback: Callable) -> Callable:
+        """Wrap a handler callback to record its latency and errors"""
+        name = getattr(callback, '__name__', repr(callback))
+        observe = self.handler_latency.observe
+
+        @functools.wraps(callback)
+        async def instrumented(update, context):
+            start = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                self.handler_errors.inc(name)
+                raise
+            finally:
+                observe(time.perf_counter() - start, name)
+
+        return instrumented
+
+    def _instrument_handler(self, handler) -> None:
+        if isinstance(handler, CallbackRouter):
+            # Each route is timed under its own name rather than the router's
+            handler.routes = {action: self.instrument(callback) for action, callback in handler.routes.items()}
+            if handler.default is not None:
+                handler.default = self.instrument(handler.default)
+        elif isinstance(handler, ConversationHandler):
+            for nested in handler.entry_points + handler.fallbacks:
+                self._instrument_handler(nested)
+            for handlers in handler.states.values():
+                for nested in handlers:
+                    self._instrument_handler(nested)
+        elif hasattr(handler, 'callback'):
+            handler.callback = self.instrument(handler.callback)
+
+    def instrument_application(self, application: Application) -> None:
+        """Instrument every registered handler and count incoming updates
+
+        Call this after all handlers are added; handlers nested in
+        conversations are instrumented too.
+        """
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                self._instrument_handler(handler)
+
+        async def count_update(update: Update, context) -> None:
+            self.updates.inc(update_type(update))
+
+        # Group -1 runs before the game handlers without stopping them
+        application.add_handler(TypeHandler(Update, count_update), group=-1)
+
+    def track_conversation(self, name: str, handler: ConversationHandler, state_names: Dict[object, str]) -> None:
+        """Export how many conversations of handler are in each state"""
+        self._conversations.append((name, handler, state_names))
+
+    def _collect_conversations(self) -> Dict[LabelValues, float]:
+        counts = {}
+        for name, handler, state_names in self._conversations:
+            for state_name in state_names.values():
+                counts[(name, state_name)] = 0
+            # ConversationHandler has no public view of its conversations
+            for state in getattr(handler, '_conversations', {}).values():
+                key = (name, state_names.get(state, 'pending'))
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def track_user_store(self, store) -> None:
+        """Export the size and counters of a user_store.UserStateStore"""
+        self.gauge('telegram_games_users', "Users with state in memory", (), lambda: {(): len(store)})
+
+        def lookups() -> Dict[LabelValues, float]:
+            stats = store.stats()
+            return {('hit',): stats['hits'], ('miss',): stats['misses']}
+
+        def evictions() -> Dict[LabelValues, float]:
+            stats = store.stats()
+            return {('idle',): stats['evicted_idle'], ('memory',): stats['evicted_memory']}
+
+        self.gauge('telegram_games_user_lookups_total', "User state lookups by result", ('result',), lookups,
+                   kind='counter')
+        self.gauge('telegram_games_user_evictions_total', "Users dropped from memory by reason", ('reason',),
+                   evictions, kind='counter')
+        self.gauge('telegram_games_sessions_expired_total', "Game sessions abandoned after the session TTL", (),
+                   lambda: {(): store.stats()['expired']}, kind='counter')
+        self.gauge('telegram_games_user_evictions_deferred_total',
+                   "Idle users kept because their last wallet write was not committed yet", (),
+                   lambda: {(): store.stats()['uncommitted']}, kind='counter')
+
+    def track_ledger(self, ledger) -> None:
+        """Export the commits of a wallet.WalletLedger"""
+        self.gauge('telegram_games_wallet_commits_total', "Wallet ledger group commits by result", ('result',),
+                   lambda: {('committed',): ledger.commits, ('failed',): ledger.write_errors}, kind='counter')
+
+    def track_outbox(self, outbox) -> None:
+        """Export the counters of an outbox.EditScheduler"""
+        self.gauge('telegram_games_outbox_edits_total', "Message edits by result", ('result',), lambda: {
+            ('requested',): outbox.requested,
+            ('coalesced',): outbox.coalesced,
+            ('api_calls',): outbox.calls,
+            ('rate_limited',): outbox.rate_limited,
+            ('failed',): outbox.failed,
+        }, kind='counter')
+        self.gauge('telegram_games_outbox_pending', "Edits waiting to be sent", (), lambda: {(): outbox.pending})
+
+    def track_fingerprints(self, cache) -> None:
+        """Export the counters of a fingerprints.FingerprintCache"""
+        self.gauge('telegram_games_edit_fingerprints_total', "Message edits by what they change", ('result',),
+                   lambda: {
+                       ('unchanged',): cache.unchanged,
+                       ('markup_only',): cache.markup_only,
+                       ('full',): cache.full,
+                   }, kind='counter')
+
+    def track_crash_rounds(self, rounds) -> None:
+        """Export the state of a crash_rounds.CrashRoundScheduler"""
+        self.gauge('telegram_games_crash_round_bettors', "Bettors in the shared Crash rounds by phase", ('phase',),
+                   lambda: {
+                       ('betting',): len(rounds.next_round),
+                       ('running',): len(rounds.current) if rounds.current is not None else 0,
+                   })
+        self.gauge('telegram_games_crash_rounds_total', "Shared Crash rounds settled", (), lambda: {(): rounds.rounds},
+                   kind='counter')
+
+    def track_keno_draws(self, draws) -> None:
+        """Export the state of a keno_draws.KenoDrawScheduler"""
+        self.gauge('telegram_games_keno_tickets_queued', "Keno tickets waiting for the next draw", (),
+                   lambda: {(): len(draws.next_draw)})
+        self.gauge('telegram_games_keno_draws_total', "Scheduled Keno draws settled", (), lambda: {(): draws.draws},
+                   kind='counter')
+
+    def track_transport(self, *requests) -> None:
+        """Export the connections opened by transport.PooledRequest pools"""
+        self.gauge('telegram_games_bot_api_connections_total', "Bot API connections opened by pool", ('pool',),
+                   lambda: {(request.pool,): request.connections for request in requests}, kind='counter')
+
+    def record_api_call(self, pool: str, endpoint: str, seconds: float) -> None:
+        """Time a Bot API call"""
+        self.api_latency.observe(seconds, pool, endpoint)
+
+    def record_pool_wait(self, pool: str, seconds: float) -> None:
+        """Time a Bot API call's wait for a connection"""
+        self.pool_wait.observe(seconds, pool)
+
+    def record_settlement(self, game: str, bet_amount: int, winnings: int) -> None:
+        """Count a settled round"""
+        if winnings > bet_amount:
+            outcome = 'win'
+        elif winnings == bet_amount:
+            outcome = 'push'
+        else:
+            outcome = 'loss'
+        self.settlements.inc(game, outcome)
+        self.wagered.inc(game, amount=bet_amount)
+        self.paid.inc(game, amount=winnings)
+
+    def record_settlements(self, game: str, bet_amounts: Sequence[int], winnings: Sequence[int],
+                           balances: Optional[Sequence[Optional[int]]] = None) -> None:
+        """Count many settled rounds at once (e.g. all bets of a shared round)
+
+        With the new balances from `UserStateStore.settle_many`, bets whose
+        balance is None were not settled (their bet had already gone back)
+        and count as a 'refund' outcome, without wagers or payouts.
+        """
+        outcomes = {'win': 0, 'push': 0, 'loss': 0, 'refund': 0}
+        wagered = paid = 0
+        for index, (bet_amount, won) in enumerate(zip(bet_amounts, winnings)):
+            if balances is not None and balances[index] is None:
+                outcomes['refund'] += 1
+                continue
+            outcomes['win' if won > bet_amount else 'push' if won == bet_amount else 'loss'] += 1
+            wagered += bet_amount
+            paid += won
+        for outcome, count in outcomes.items():
+            if count:
+                self.settlements.inc(game, outcome, amount=count)
+        self.wagered.inc(game, amount=wagered)
+        self.paid.inc(game, amount=paid)
+
+    # === EXPOSITION ===
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    async def scrape(self, headers: Dict[str, str], body: bytes) -> Tuple[int, str, bytes]:
+        """HTTP route for BotHTTPServer"""
+        return 200, CONTENT_TYPE, self.render().encode()
+
+
+def parse_samples(text: str) -> Dict[str, float]:
+    """Map every sample line of an exposition to its value (for tests and tools)"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            samples[name] = float(value)
+    return samples
+
@@ -0,0 +1,258 @@
+"""
+Outbound Edit Queue for Telegram Games Bot
+==========================================
+
+Schedules outgoing messages and edits so that fast tapping does not run
+into Telegram's flood limits (roughly one message per second per chat and
+30 per second overall, with short bursts allowed).
+
+Both are paced by a token bucket per chat and one global bucket. Edits are
+queued per message and sent by one background task: an edit that arrives
+while an older edit of the same message is still waiting replaces it, so
+only the latest screen is sent. New messages cannot be merged, so
+`send_message` waits for its turn instead. A 429 `RetryAfter` pauses the
+chat for the time Telegram asks for, then the call is made again.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[int, int]
+
+
+class TokenBucket:
+    """Token bucket that a 429 retry-after can pause"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token can be taken"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self, now: float) -> None:
+        """Spend one token"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float) -> None:
+        """Hand out no tokens before until"""
+        self.paused_until = max(self.paused_until, until)
+
+    def idle(self, now: float) -> bool:
+        """True when the bucket is full and not paused (safe to forget)"""
+        self._refill(now)
+        return self.paused_until <= now and self.tokens >= self.capacity
+
+
+class _PendingEdit:
+    __slots__ = ('method', 'kwargs', 'due')
+
+    def __init__(self, method: str, kwargs: Dict[str, Any], due: float):
+        self.method = method
+        self.kwargs = kwargs
+        self.due = due
+
+
+class EditScheduler:
+    """Coalescing, rate-limited queue of message edits (and paced sends)"""
+
+    def __init__(self, bot=None, chat_rate: float = 1.0, chat_burst: int = 3, global_rate: float = 30.0,
+                 global_burst: int = 30, window: float = 0.05, max_idle_chats: int = 10_000, clock=time.monotonic):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.window = window
+        self.max_idle_chats = max_idle_chats
+        self._clock = clock
+        # Called with (chat id, message id) when an edit fails for good
+        self.on_failure: Optional[Callable[[int, int], None]] = None
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._chats: Dict[int, TokenBucket] = {}
+        self._pending: 'OrderedDict[MessageKey, _PendingEdit]' = OrderedDict()
+        self._in_flight: Set[MessageKey] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()
+
+        # Counters
+        self.requested = 0      # edits asked for by handlers
+        self.coalesced = 0      # edits replaced by a newer one before being sent
+        self.calls = 0          # edit requests made
+        self.rate_limited = 0   # requests answered with 429
+        self.failed = 0         # requests that failed for another reason
+        self.messages = 0       # sendMessage requests made
+
+    @property
+    def pending(self) -> int:
+        """Edits waiting to be sent"""
+        return len(self._pending)
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_idle_chats:
+                for idle_chat in [chat for chat, chat_bucket in self._chats.items() if chat_bucket.idle(now)]:
+                    del self._chats[idle_chat]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs: Any) -> None:
+        """Queue an edit; a queued edit of the same message is replaced"""
+        kwargs.update(chat_id=chat_id, message_id=message_id, text=text)
+        self._queue('edit_message_text', kwargs)
+
+    def edit_message_reply_markup(self, chat_id: int, message_id: int, reply_markup=None) -> None:
+        """Queue a markup-only edit; merged into a queued edit of the same message"""
+        key = (chat_id, message_id)
+        edit = self._pending.get(key)
+        if edit is not None:
+            # The queued edit carries the text already on screen, so only its markup changes
+            self.requested += 1
+            self.coalesced += 1
+            edit.kwargs = dict(edit.kwargs, reply_markup=reply_markup)
+            return
+        self._queue('edit_message_reply_markup',
+                    {'chat_id': chat_id, 'message_id': message_id, 'reply_markup': reply_markup})
+
+    def _queue(self, method: str, kwargs: Dict[str, Any]) -> None:
+        self.requested += 1
+        key = (kwargs['chat_id'], kwargs['message_id'])
+
+        edit = self._pending.get(key)
+        if edit is not None:
+            # Keep the original due time so a stream of taps cannot starve the message
+            edit.method = method
+            edit.kwargs = kwargs
+            self.coalesced += 1
+        else:
+            self._pending[key] = _PendingEdit(method, kwargs, self._clock() + self.window)
+
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def send_message(self, chat_id: int, text: str, max_attempts: int = 3, **kwargs: Any):
+        """Send a message once the chat may send again; returns the sent Message"""
+        for attempt in range(1, max_attempts + 1):
+            while True:
+                now = self._clock()
+                wait = max(self._chat_bucket(chat_id, now).wait_time(now), self._global.wait_time(now))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self._chat_bucket(chat_id, now).take(now)
+            self._global.take(now)
+
+            self.messages += 1
+            try:
+                return await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            except RetryAfter as e:
+                self.rate_limited += 1
+                if attempt == max_attempts:
+                    raise
+                now = self._clock()
+                self._chat_bucket(chat_id, now).pause(now + float(e.retry_after))
+
+    async def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait until every queued edit has been sent"""
+        if self._worker is not None and (self._pending or self._in_flight):
+            await asyncio.wait_for(self._idle.wait(), timeout)
+
+    async def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Send what is queued (up to timeout), then stop the worker"""
+        try:
+            await self.flush(timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {len(self._pending)} queued edits on shutdown")
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _run(self) -> None:
+        while True:
+            now = self._clock()
+            best_key, best_at = None, float('inf')
+            global_wait = self._global.wait_time(now)
+            if global_wait > 0 and self._pending:
+                # Nothing can be sent before the global bucket refills, so
+                # skip the scan (it is long when a whole round is queued)
+                best_key, best_at = next(iter(self._pending)), now + global_wait
+            else:
+                for key, edit in self._pending.items():
+                    if key in self._in_flight:
+                        continue
+                    ready_at = max(edit.due, now + self._chat_bucket(key[0], now).wait_time(now))
+                    if ready_at < best_at:
+                        best_key, best_at = key, ready_at
+                        if ready_at <= now:
+                            break  # oldest edit that is ready
+            if best_key is not None:
+                best_at = max(best_at, now + global_wait)
+                if best_at <= now:
+                    self._chat_bucket(best_key[0], now).take(now)
+                    self._global.take(now)
+                    edit = self._pending.pop(best_key)
+                    self._in_flight.add(best_key)
+                    task = asyncio.get_running_loop().create_task(self._send(best_key, edit))
+                    self._sending.add(task)
+                    task.add_done_callback(self._sending.discard)
+                    continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), None if best_key is None else best_at - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, key: MessageKey, edit: _PendingEdit) -> None:
+        self.calls += 1
+        try:
+            await getattr(self.bot, edit.method)(**edit.kwargs)
+        except RetryAfter as e:
+            # Pause the chat as long as Telegram asks and retry the edit,
+            # unless a newer one has been queued meanwhile
+            self.rate_limited += 1
+            now = self._clock()
+            self._chat_bucket(key[0], now).pause(now + float(e.retry_after))
+            if key not in self._pending:
+                self._pending[key] = edit
+                self._pending.move_to_end(key, last=False)
+        except TelegramError as e:
+            if not (isinstance(e, BadRequest) and 'not modified' in str(e).lower()):
+                self.failed += 1
+                logger.warning(f"Edit of message {key} failed: {e}")
+                if self.on_failure is not None:
+                    self.on_failure(*key)
+        finally:
+            self._in_flight.discard(key)
+            if not self._pending and not self._in_flight:
+                self._idle.set()
+            self._wakeup.set()
@@ -0,0 +1,186 @@
+"""
+Conversation Persistence for Telegram Games Bot
+===============================================
+
+Keeps the state of every Keno and Crash conversation across restarts, so a
+deploy does not drop half-finished games (the game sessions themselves are
+kept by the wallet ledger, see `user_store.py`).
+
+Nothing is pickled wholesale. The application hands over only the
+conversations that changed since its last persistence cycle, and each one
+is appended to the log of its conversation as a fixed 18-byte record
+(chat id, user id, state). At start-up a log is read back in one pass,
+the last record of a conversation winning, and a log that holds mostly
+outdated records is rewritten with the live ones only.
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# chat id, user id, state
+_RECORD = struct.Struct('<qqh')
+# State of a record that ends a conversation
+_ENDED = -32768
+# Logs with fewer records are never compacted
+_COMPACT_MIN_RECORDS = 1024
+
+ConversationKey = Tuple[int, int]
+
+
+class ConversationLog:
+    """Append-only log of the states of one conversation handler"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0  # records in the file
+        self._file = None
+
+    def load(self) -> Dict[ConversationKey, int]:
+        """Read the live conversations, compacting the log when most records are outdated"""
+        self.close()
+        conversations: Dict[ConversationKey, int] = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as file:
+                data = file.read()
+            # A record cut short by a crash is dropped
+            data = data[:len(data) - len(data) % _RECORD.size]
+            self.records = len(data) // _RECORD.size
+            # A million new key tuples would set off repeated collections that scan the growing dict
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                conversations = {(chat_id, user_id): state
+                                 for chat_id, user_id, state in _RECORD.iter_unpack(data)}
+            finally:
+                if gc_enabled:
+                    gc.enable()
+            if len(conversations) < self.records:
+                conversations = {key: state for key, state in conversations.items() if state != _ENDED}
+            if self.records >= _COMPACT_MIN_RECORDS and self.records > 2 * len(conversations):
+                self._rewrite(conversations)
+        self._file = open(self.path, 'ab')
+        return conversations
+
+    def append(self, key: ConversationKey, state: Optional[int]) -> None:
+        """Write the new state of a conversation (None when it ended) to the file buffer"""
+        if len(key) != 2:
+            raise ValueError(f"Conversation keys must be (chat id, user id), got {key!r}")
+        self._file.write(_RECORD.pack(key[0], key[1], _ENDED if state is None else state))
+        self.records += 1
+
+    def flush(self, sync: bool = False) -> None:
+        """Hand buffered records to the OS (and to the disk with sync)"""
+        if self._file is not None:
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Flush to disk and close the file"""
+        if self._file is not None:
+            self.flush(sync=True)
+            self._file.close()
+            self._file = None
+
+    def _rewrite(self, conversations: Dict[ConversationKey, int]) -> None:
+        """Replace the log with one record per live conversation"""
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(b''.join(_RECORD.pack(chat_id, user_id, state)
+                                for (chat_id, user_id), state in conversations.items()))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        logger.info(f"Compacted {self.path}: {self.records} records down to {len(conversations)}")
+        self.records = len(conversations)
+
+
+class ConversationPersistence(BasePersistence):
+    """Persistence that stores conversation states only, one log per conversation in directory
+
+    Conversation handlers must be named and persistent, and keyed by chat
+    and user (the default); states must be small integers.
+    """
+
+    def __init__(self, directory: str, update_interval: float = 1.0):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False,
+                                                     callback_data=False),
+                         update_interval=update_interval)
+        self.directory = directory
+        self._logs: Dict[str, ConversationLog] = {}
+        self._flush_scheduled = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _log(self, name: str) -> ConversationLog:
+        log = self._logs.get(name)
+        if log is None:
+            log = self._logs[name] = ConversationLog(os.path.join(self.directory, f'{name}.conv'))
+        return log
+
+    async def get_conversations(self, name: str) -> Dict[ConversationKey, int]:
+        return self._log(name).load()
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        self._log(name).append(key, new_state)
+        # The application sends all changes of a cycle together; write them out once it is done
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_buffers)
+
+    def _flush_buffers(self) -> None:
+        self._flush_scheduled = False
+        for log in self._logs.values():
+            log.flush()
+
+    async def flush(self) -> None:
+        for log in self._logs.values():
+            log.close()
+
+    # Nothing but conversations is stored
+
+    async def get_user_data(self) -> Dict:
+        return {}
+
+    async def get_chat_data(self) -> Dict:
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
@@ -0,0 +1,86 @@
+"""
+Quick Bets for Telegram Games Bot
+=================================
+
+One-message bets such as `/keno 50 3 7 12` (bet, then the picked numbers)
+and `/crash 100 2.5` (bet, then the cash-out target), so a whole round is
+placed and settled by a single command instead of the step-by-step
+conversation.
+
+Each parser checks the whole command in one pass and raises ValueError
+with a message meant for the player.
+"""
+
+from typing import NamedTuple, Sequence
+
+import keno
+
+KENO_USAGE = "Quick bet: /keno <bet> <numbers>, e.g. /keno 50 3 7 12"
+CRASH_USAGE = "Quick bet: /crash <bet> <target>, e.g. /crash 100 2.5"
+# Text of a command followed by arguments, e.g. for a filters.Regex
+COMMAND_WITH_ARGS = r'^/\S+\s+\S'
+
+
+class KenoQuickBet(NamedTuple):
+    """Bet and picks of a one-message Keno ticket"""
+    bet_amount: int
+    selected_mask: int
+
+
+class CrashQuickBet(NamedTuple):
+    """Bet and cash-out target of a one-message Crash bet"""
+    bet_amount: int
+    target_multiplier: float
+
+
+def parse_bet(text: str, min_bet: int, max_bet: int) -> int:
+    """Bet amount from text, within min_bet-max_bet"""
+    try:
+        bet_amount = int(text)
+    except ValueError:
+        raise ValueError(f"'{text}' is not a valid bet") from None
+    if not min_bet <= bet_amount <= max_bet:
+        raise ValueError(f"Bets go from {min_bet} to {max_bet} credits")
+    return bet_amount
+
+
+def parse_keno(args: Sequence[str], min_bet: int, max_bet: int, total_numbers: int = 20,
+               max_picks: int = 10) -> KenoQuickBet:
+    """Parse `<bet> <numbers...>`"""
+    if len(args) < 2:
+        raise ValueError("Give a bet and at least one number")
+    bet_amount = parse_bet(args[0], min_bet, max_bet)
+    if len(args) - 1 > max_picks:
+        raise ValueError(f"Pick at most {max_picks} numbers")
+
+    numbers = set()
+    for text in args[1:]:
+        try:
+            number = int(text)
+        except ValueError:
+            raise ValueError(f"'{text}' is not a number") from None
+        if not 1 <= number <= total_numbers:
+            raise ValueError(f"Numbers go from 1 to {total_numbers}")
+        if number in numbers:
+            raise ValueError(f"{number} is picked twice")
+        numbers.add(number)
+    return KenoQuickBet(bet_amount, keno.numbers_to_mask(numbers))
+
+
+def parse_crash(args: Sequence[str], min_bet: int, max_bet: int, min_target: float = 1.1,
+                max_target: float = 10.0) -> CrashQuickBet:
+    """Parse `<bet> <target>`; the target may end in 'x' and goes in steps of 0.1x"""
+    if len(args) != 2:
+        raise ValueError("Give a bet and a cash-out target")
+    bet_amount = parse_bet(args[0], min_bet, max_bet)
+
+    text = args[1].lower().rstrip('x')
+    try:
+        target = float(text)
+    except ValueError:
+        raise ValueError(f"'{args[1]}' is not a valid target") from None
+    if not min_target <= target <= max_target:
+        raise ValueError(f"Targets go from {min_target:.1f}x to {max_target:.1f}x")
+    if abs(target * 10 - round(target * 10)) > 1e-9:
+        raise ValueError("Targets go in steps of 0.1x")
+    return CrashQuickBet(bet_amount, round(target, 1))
@@ -0,0 +1,170 @@
+"""
+Screens for Telegram Games Bot
+==============================
+
+Text and buttons of the menu screens (welcome, main menu, balance, help) and
+of the Keno number picker, prepared once at import time.
+
+Telegram objects are immutable, so every markup is built once and shared by
+all messages. Each text is written once as a template and split at its
+`{slots}` into literal fragments; rendering a screen only joins the
+fragments with the values of the slots (name, balance, bet, ...). Screens
+without slots, like help, are ready-made.
+"""
+
+import string
+import textwrap
+from typing import NamedTuple, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+from callbacks import CHECK_BALANCE, MAIN_MENU, SHOW_HELP, START_CRASH, START_KENO, encode
+from keno import popcount
+from keyboards import keno_grid_markup
+
+
+class Screen(NamedTuple):
+    """Text and markup of a message"""
+    text: str
+    markup: InlineKeyboardMarkup
+
+
+def _fragments(template: str) -> Tuple[str, ...]:
+    """Split a template at its {slots} into the literal text around them"""
+    return tuple(literal for literal, _, _, _ in string.Formatter().parse(textwrap.dedent(template).strip()))
+
+
+_PLAY_KENO = InlineKeyboardButton("🔢 Play Keno", callback_data=encode(START_KENO))
+_PLAY_CRASH = InlineKeyboardButton("🚀 Play Crash", callback_data=encode(START_CRASH))
+_MAIN_MENU = InlineKeyboardButton("🏠 Main Menu", callback_data=encode(MAIN_MENU))
+
+MAIN_MENU_MARKUP = InlineKeyboardMarkup((
+    (_PLAY_KENO, _PLAY_CRASH),
+    (InlineKeyboardButton("💰 Check Balance", callback_data=encode(CHECK_BALANCE)),
+     InlineKeyboardButton("ℹ️ Help", callback_data=encode(SHOW_HELP))),
+))
+
+BALANCE_MARKUP = InlineKeyboardMarkup((
+    (_PLAY_KENO, _PLAY_CRASH),
+    (_MAIN_MENU,),
+))
+
+HELP_MARKUP = InlineKeyboardMarkup((
+    (InlineKeyboardButton("🏠 Back to Menu", callback_data=encode(MAIN_MENU)),),
+))
+
+# Buttons under a Keno result (shared by instant and scheduled draws)
+KENO_RESULT_MARKUP = InlineKeyboardMarkup((
+    (InlineKeyboardButton("🔢 Play Again", callback_data=encode(START_KENO)),
+     InlineKeyboardButton("🚀 Try Crash", callback_data=encode(START_CRASH))),
+    (_MAIN_MENU,),
+))
+
+# Buttons under a Crash result (shared by instant and shared rounds)
+CRASH_RESULT_MARKUP = InlineKeyboardMarkup((
+    (InlineKeyboardButton("🚀 Play Again", callback_data=encode(START_CRASH)),
+     InlineKeyboardButton("🔢 Try Keno", callback_data=encode(START_KENO))),
+    (_MAIN_MENU,),
+))
+
+_WELCOME_GREETING, _WELCOME_BALANCE, _WELCOME_MENU = _fragments("""
+    🎮 **Welcome to the Casino Games Bot!** 🎮
+
+    Hello {first_name}!
+
+    This bot offers exciting casino-style games with fake money for fun and learning.
+
+    💰 Your current balance: **{balance} credits**
+
+    🎲 **Available Games:**
+    • **Keno** - Pick numbers and see how many match!
+    • **Crash** - Cash out before the multiplier crashes!
+
+    Choose a game below or use these commands:
+    • /balance - Check your balance
+    • /keno - Play Keno
+    • /crash - Play Crash
+    • /help - Show this menu again
+
+    Good luck and have fun! 🍀
+""")
+
+_MENU_BALANCE, _MENU_CHOICES = _fragments("""
+    🎮 **Casino Games Bot** 🎮
+
+    💰 Your balance: **{balance} credits**
+
+    Choose a game or check your stats:
+""")
+
+_BALANCE_HEADER, _BALANCE_UNIT = _fragments("""
+    💰 **Your Current Balance**
+
+    {balance} credits
+""")
+
+_KENO_PICK_BET, _KENO_PICK_SELECTED, _KENO_PICK_HINT = _fragments("""
+    🔢 **KENO - Pick Your Numbers** 🔢
+
+    💰 Bet amount: {bet_amount} credits
+    🎯 Selected: {selected}/10 numbers
+
+    Pick 1-10 numbers from 1-20. Tap numbers below to select/deselect:
+""")
+
+HELP_SCREEN = Screen(textwrap.dedent("""
+    🎮 **Casino Games Bot Help** 🎮
+
+    **🔢 Keno Game:**
+    • Pick 1-10 numbers from 1-20
+    • Bot draws 10 random numbers
+    • Win based on how many of your numbers match
+    • Higher matches = bigger payouts!
+
+    **🚀 Crash Game:**
+    • Set your bet amount
+    • Choose your cash-out multiplier
+    • Bot generates random crash point
+    • Win if you cash out before the crash!
+
+    **💰 Payouts:**
+    • Keno: 0-1 hits = lose, 2 hits = break even, 3+ hits = profit
+    • Crash: Your bet × cashout multiplier
+
+    **Commands:**
+    • /start - Main menu
+    • /balance - Check balance
+    • /keno - Start Keno game
+    • /crash - Start Crash game
+    • /keno 50 3 7 12 - Quick Keno: bet, then your numbers
+    • /crash 100 2.5 - Quick Crash: bet, then your cash-out target
+    • /autokeno 100 50 3 7 12 loss=500 - Play a Keno ticket for up to 100 rounds
+    • /autocrash 100 20 2 profit=500 - Play a Crash bet for up to 100 rounds
+    • /help - Show this help
+
+    Have fun and good luck! 🍀
+""").strip(), HELP_MARKUP)
+
+
+def welcome_screen(first_name: str, balance: int) -> Screen:
+    """Welcome screen of /start"""
+    # The name is the user's own text, so it must not break the Markdown
+    return Screen(f"{_WELCOME_GREETING}{escape_markdown(first_name)}{_WELCOME_BALANCE}{balance}{_WELCOME_MENU}",
+                  MAIN_MENU_MARKUP)
+
+
+def main_menu_screen(balance: int) -> Screen:
+    """Main menu screen"""
+    return Screen(f"{_MENU_BALANCE}{balance}{_MENU_CHOICES}", MAIN_MENU_MARKUP)
+
+
+def balance_screen(balance: int) -> Screen:
+    """Balance screen"""
+    return Screen(f"{_BALANCE_HEADER}{balance}{_BALANCE_UNIT}", BALANCE_MARKUP)
+
+
+def keno_pick_screen(bet_amount: int, selected_mask: int) -> Screen:
+    """Keno number picker for a bet and a selection bitmask"""
+    return Screen(f"{_KENO_PICK_BET}{bet_amount}{_KENO_PICK_SELECTED}{popcount(selected_mask)}{_KENO_PICK_HINT}",
+                  keno_grid_markup(selected_mask))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo RTP Simulator for Telegram Games Bot
+================================================
+
+Plays millions of Keno and Crash rounds with the same payout code the bot
+uses and reports the return to player (RTP), the variance of the return per
+round and a 95% confidence interval for every Keno pick count and every
+Crash cash-out target.
+
+Rounds are drawn in NumPy batches and spread over a process pool. Every
+batch gets its own RNG stream spawned from one seed, so results only depend
+on --seed, not on the number of workers.
+
+Usage:
+    python simulate.py --rounds 10000000
+    python simulate.py --game crash --rounds 100000000 --workers 8 --seed 42
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import crash
+import keno
+
+try:
+    from config import (
+        KENO_PAYOUTS, KENO_TOTAL_NUMBERS, KENO_DRAWN_NUMBERS, KENO_MAX_PICKS,
+        CRASH_DISTRIBUTION, CRASH_HOUSE_EDGE, CRASH_POINT_CAP
+    )
+except ImportError:
+    KENO_PAYOUTS = {0: 0, 1: 0, 2: 1, 3: 2, 4: 3, 5: 5, 6: 10, 7: 10, 8: 10, 9: 10, 10: 10}
+    KENO_TOTAL_NUMBERS = 20
+    KENO_DRAWN_NUMBERS = 10
+    KENO_MAX_PICKS = 10
+    CRASH_DISTRIBUTION = 'piecewise'
+    CRASH_HOUSE_EDGE = 0.01
+    CRASH_POINT_CAP = 1000.0
+
+# Two-sided 95% normal quantile
+Z_95 = 1.959963984540054
+
+# Rounds drawn per batch (bounds worker memory)
+CHUNK_ROUNDS = 200_000
+
+
+class RoundStats:
+    """Mergeable totals of the return per round (winnings / bet)"""
+
+    __slots__ = ('rounds', 'total', 'total_squares')
+
+    def __init__(self, rounds: int = 0, total: float = 0.0, total_squares: float = 0.0):
+        self.rounds = rounds
+        self.total = total
+        self.total_squares = total_squares
+
+    def add(self, other: 'RoundStats') -> None:
+        """Merge another set of totals into this one"""
+        self.rounds += other.rounds
+        self.total += other.total
+        self.total_squares += other.total_squares
+
+    @property
+    def rtp(self) -> float:
+        """Mean return per unit bet"""
+        return self.total / self.rounds
+
+    @property
+    def variance(self) -> float:
+        """Variance of the return per round"""
+        return max(self.total_squares / self.rounds - self.rtp ** 2, 0.0)
+
+    def confidence_interval(self, z: float = Z_95) -> Tuple[float, float]:
+        """Normal-approximation confidence interval of the RTP"""
+        margin = z * math.sqrt(self.variance / self.rounds)
+        return self.rtp - margin, self.rtp + margin
+
+
+def simulate_chunk(game: str, option: float, rounds: int, seed, bet_amount: int,
+                   distribution: Optional[crash.CrashDistribution] = None) -> RoundStats:
+    """Play one batch of rounds with its own RNG stream"""
+    rng = np.random.default_rng(seed)
+
+    if game == 'keno':
+        # Draws are uniform, so any ticket with the same pick count has the same odds
+        picks = keno.numbers_to_mask(range(1, int(option) + 1))
+        draws = keno.draw_masks(rounds, KENO_TOTAL_NUMBERS, KENO_DRAWN_NUMBERS, rng)
+        winnings = keno.settle_batch(picks, draws, bet_amount, KENO_PAYOUTS, KENO_TOTAL_NUMBERS)
+    else:
+        crash_points = (distribution or crash.DEFAULT_DISTRIBUTION).sample_batch(rounds, rng)
+        winnings = crash.settle_batch(bet_amount, option, crash_points)
+
+    returns = winnings / bet_amount
+    return RoundStats(rounds, float(returns.sum()), float(np.dot(returns, returns)))
+
+
+def simulate(game: str, options: List[float], rounds: int, workers: int = 1, seed: Optional[int] = None,
+             bet_amount: int = 100, chunk_rounds: int = CHUNK_ROUNDS,
+             distribution: Optional[crash.CrashDistribution] = None) -> Dict[float, RoundStats]:
+    """Simulate rounds split evenly across options and return stats per option"""
+    rounds_per_option = max(rounds // len(options), 1)
+    tasks = []
+    for option in options:
+        remaining = rounds_per_option
+        while remaining > 0:
+            size = min(chunk_rounds, remaining)
+            tasks.append((option, size))
+            remaining -= size
+
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    args = [(game, option, size, task_seed, bet_amount, distribution) for (option, size), task_seed in zip(tasks, seeds)]
+
+    results = {option: RoundStats() for option in options}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = pool.map(simulate_chunk, *zip(*args), chunksize=max(len(args) // (workers * 4), 1))
+            for (option, _), chunk in zip(tasks, chunks):
+                results[option].add(chunk)
+    else:
+        for (option, _), task_args in zip(tasks, args):
+            results[option].add(simulate_chunk(*task_args))
+    return results
+
+
+def print_report(title: str, label: str, results: Dict[float, RoundStats], format_option) -> None:
+    """Print an RTP table"""
+    overall = RoundStats()
+    print(f"\n{title}")
+    print(f"   {label:>8}  {'RTP':>9}  {'Variance':>10}  95% CI")
+    for option, stats in results.items():
+        overall.add(stats)
+        low, high = stats.confidence_interval()
+        print(f"   {format_option(option):>8}  {stats.rtp:>9.4%}  {stats.variance:>10.4f}  [{low:.4%}, {high:.4%}]")
+    low, high = overall.confidence_interval()
+    print(f"   {'All':>8}  {overall.rtp:>9.4%}  {overall.variance:>10.4f}  [{low:.4%}, {high:.4%}]")
+
+
+def main(argv: Optional[List[str]] = None) -> bool:
+    """Run the simulator from the command line"""
+    parser = argparse.ArgumentParser(description="Monte Carlo RTP simulator for Keno and Crash")
+    parser.add_argument('--game', choices=('keno', 'crash', 'both'), default='both')
+    parser.add_argument('--rounds', type=int, default=10_000_000, help="rounds per game")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--bet', type=int, default=100, help="bet per round (payouts are rounded down)")
+    parser.add_argument('--crash-distribution', choices=tuple(crash.DISTRIBUTIONS), default=CRASH_DISTRIBUTION)
+    parser.add_argument('--house-edge', type=float, default=CRASH_HOUSE_EDGE, help="for the house_edge distribution")
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("❌ NumPy is required for the simulator: pip install numpy")
+        return False
+
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    games = ('keno', 'crash') if args.game == 'both' else (args.game,)
+
+    print("🎰 Telegram Games Bot RTP Simulator")
+    print("=" * 40)
+    print(f"Rounds per game: {args.rounds:,} | Workers: {args.workers} | Bet: {args.bet} | Seed: {seed}")
+
+    for game in games:
+        start = time.perf_counter()
+        if game == 'keno':
+            results = simulate('keno', list(range(1, KENO_MAX_PICKS + 1)), args.rounds, args.workers, seed, args.bet)
+            elapsed = time.perf_counter() - start
+            print_report(f"🔢 KENO ({elapsed:.1f}s)", "Picks", results, str)
+        else:
+            distribution = crash.make_distribution(args.crash_distribution, args.house_edge, CRASH_POINT_CAP)
+            results = simulate('crash', list(crash.CASHOUT_TARGETS), args.rounds, args.workers, seed, args.bet,
+                               distribution=distribution)
+            elapsed = time.perf_counter() - start
+            print_report(f"🚀 CRASH - {distribution.name} ({elapsed:.1f}s)", "Target", results,
+                         lambda target: f"{target:.1f}x")
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
-Single-User Telegram Games Bot
-============================
+Telegram Games Bot
+==================
 
 A fun Telegram bot featuring Keno and Crash games with fake money.
 Created for educational and entertainment purposes.
@@ -10,20 +10,47 @@ Author: Assistant
 Version: 1.0
 """
 
+import asyncio
 import logging
-import random
 import os
+import secrets
+import time
 from typing import Dict, List, Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Message, Update, InlineKeyboardMarkup
+from telegram.error import TelegramError
+from telegram.request import BaseRequest
 from telegram.ext import (
     Application,
     CommandHandler,
-    CallbackQueryHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters
 )
+import answers
+import autobet
+import callbacks
+import crash
+import fingerprints
+import keno
+import quick_bets
+import screens
+from keno_draws import KenoDraw, KenoDrawScheduler
+from keno_odds import payout_table_text
+from keyboards import crash_target_markup
+from callbacks import CallbackRouter
+from concurrency import MAX_PENDING_UPDATES, UserOrderedApplication
+from crash_rounds import CrashRound, CrashRoundScheduler
+from metrics import Metrics
+from outbox import EditScheduler
+from persistence import ConversationPersistence
+from transport import PooledRequest
+from screens import CRASH_RESULT_MARKUP, KENO_RESULT_MARKUP
+from user_store import UserStateStore
+from wallet import WalletLedger
+from webserver import run_application
+from cluster import WorkerPool, run_front
 
 # Try to import config, fall back to defaults if not available
 try:
@@ -35,6 +62,52 @@ except ImportError:
     MIN_BET = 10
     MAX_BET = 500
     KENO_PAYOUTS = {0: 0, 1: 0, 2: 1, 3: 2, 4: 3, 5: 5, 6: 10, 7: 10, 8: 10, 9: 10, 10: 10}
+    KENO_TOTAL_NUMBERS = 20
+    KENO_DRAWN_NUMBERS = 10
+    KENO_MAX_PICKS = 10
+    KENO_SCHEDULED_DRAWS = False
+    KENO_DRAW_INTERVAL = 60.0
+    CRASH_MIN_MULTIPLIER = 1.1
+    CRASH_MAX_MULTIPLIER = 10.0
+    CRASH_DISTRIBUTION = 'piecewise'
+    CRASH_HOUSE_EDGE = 0.01
+    CRASH_POINT_CAP = 1000.0
+    CRASH_SHARED_ROUNDS = True
+    CRASH_BETTING_WINDOW = 10.0
+    CRASH_GROWTH_RATE = 0.1
+    CRASH_TICK_INTERVAL = 1.0
+    CRASH_EDIT_INTERVAL = 2.0
+    CRASH_EDITS_PER_TICK = 20
+    AUTOBET_MAX_ROUNDS = 1000
+    USER_STORE_SHARDS = 64
+    CONCURRENT_UPDATES = 32
+    API_POOL_SIZE = 64
+    API_POOL_TIMEOUT = 5.0
+    API_KEEPALIVE_EXPIRY = 30.0
+    API_HTTP_VERSION = '1.1'
+    API_CONNECT_TIMEOUT = 5.0
+    API_READ_TIMEOUT = 5.0
+    API_WRITE_TIMEOUT = 5.0
+    GET_UPDATES_POOL_SIZE = 1
+    USER_STORE_MEMORY_MB = 256
+    SESSION_TTL = 900.0
+    LEDGER_PATH = os.getenv('LEDGER_PATH', 'wallet.db')
+    LEDGER_FLUSH_INTERVAL_MS = 5
+    STATE_PERSISTENCE = True
+    STATE_DIR = os.getenv('STATE_DIR', 'state')
+    STATE_UPDATE_INTERVAL = 1.0
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    WEBHOOK_PATH = '/telegram'
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() != 'false'
+    WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))
+    WORKER_HANDOFF_IDLE = 900.0
+    OUTBOX_ENABLED = True
+    OUTBOX_CHAT_RATE = 1.0
+    OUTBOX_CHAT_BURST = 3
+    OUTBOX_GLOBAL_RATE = 30.0
+    OUTBOX_COALESCE_WINDOW_MS = 50
+    EDIT_FINGERPRINT_CACHE_SIZE = 10_000
 
 # Configure logging
 logging.basicConfig(
@@ -46,336 +119,364 @@ logger = logging.getLogger(__name__)
 # Game states for conversation handlers
 KENO_PICK_NUMBERS, KENO_SET_BET, CRASH_SET_BET, CRASH_CASHOUT = range(4)
 
+# State labels for the conversation metrics
+KENO_STATE_NAMES = {KENO_SET_BET: 'set_bet', KENO_PICK_NUMBERS: 'pick_numbers'}
+CRASH_STATE_NAMES = {CRASH_SET_BET: 'set_bet', CRASH_CASHOUT: 'cashout'}
+
 class GameBot:
     """Main bot class handling all game logic and user interactions"""
     
-    def __init__(self):
-        # User data storage (in-memory for single user)
-        self.user_balance = STARTING_BALANCE  # Starting balance from config
-        self.current_game_data = {}  # Store current game session data
+    def __init__(self, store: Optional[UserStateStore] = None, ledger: Optional[WalletLedger] = None,
+                 metrics: Optional[Metrics] = None, outbox: Optional[EditScheduler] = None,
+                 fingerprint_cache: Optional[fingerprints.FingerprintCache] = None,
+                 crash_rounds: Optional[CrashRoundScheduler] = None,
+                 keno_draws: Optional[KenoDrawScheduler] = None):
+        # Per-user balances and game sessions, sharded by Telegram user id
+        # (balances are persisted when a wallet ledger is given)
+        self.store = store if store is not None else UserStateStore(STARTING_BALANCE, USER_STORE_SHARDS, ledger=ledger)
+        # Crash points come from the configured distribution, pre-drawn in bulk
+        self.crash_distribution = crash.make_distribution(CRASH_DISTRIBUTION, CRASH_HOUSE_EDGE, CRASH_POINT_CAP)
+        self.crash_points = crash.CrashPointBuffer(self.crash_distribution)
+        # Handler and settlement metrics (None when scraping is off)
+        self.metrics = metrics
+        # Rate-limited, coalescing queue for message edits (None edits directly)
+        self.outbox = outbox
+        # Last rendering of each bot message, to skip edits that change nothing
+        if fingerprint_cache is None and EDIT_FINGERPRINT_CACHE_SIZE:
+            fingerprint_cache = fingerprints.FingerprintCache(EDIT_FINGERPRINT_CACHE_SIZE)
+        self.fingerprints = fingerprint_cache
+        if outbox is not None and fingerprint_cache is not None:
+            outbox.on_failure = fingerprint_cache.forget
+        # Shared Crash rounds (None plays every launch as its own instant round)
+        self.crash_rounds = crash_rounds
+        if crash_rounds is not None:
+            crash_rounds.store = crash_rounds.store if crash_rounds.store is not None else self.store
+            crash_rounds.crash_points = crash_rounds.crash_points or self.crash_points
+            crash_rounds.on_tick = self.show_crash_tick
+            crash_rounds.on_settle = self.show_crash_settlement
+        # Scheduled Keno draws (None draws numbers for every ticket on PLAY)
+        self.keno_draws = keno_draws
+        if keno_draws is not None:
+            keno_draws.store = keno_draws.store if keno_draws.store is not None else self.store
+            keno_draws.on_settle = self.show_keno_draw
         
-    def get_balance(self) -> int:
-        """Get current user balance"""
-        return self.user_balance
+    def get_balance(self, user_id: int) -> int:
+        """Get current balance of a user"""
+        return self.store.get_balance(user_id)
     
-    def update_balance(self, amount: int) -> None:
+    def update_balance(self, user_id: int, amount: int, kind: str = 'adjust') -> None:
         """Update user balance by amount (positive for win, negative for loss)"""
-        self.user_balance += amount
-        if self.user_balance < 0:
-            self.user_balance = 0
+        self.store.update_balance(user_id, amount, kind)
     
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle /start command - show welcome message and main menu"""
-        user = update.effective_user
+    def reserve_bet(self, user_id: int, bet_amount: int) -> bool:
+        """Hold the bet of the current game session until the round is settled"""
+        self.release_bet(user_id)
+        reservation = self.store.reserve(user_id, bet_amount)
+        if reservation is None:
+            return False
+        self.store.update_game(user_id, bet_amount=bet_amount, reservation=reservation)
+        return True
+    
+    def release_bet(self, user_id: int) -> None:
+        """Give back the bet held by the current game session, if any"""
+        reservation = self.store.get_game(user_id).get('reservation')
+        if reservation is not None:
+            self.store.release(user_id, reservation)
+    
+    async def load_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Read the user of an update from the wallet, off the event loop, before the handlers need them"""
+        if update.effective_user is not None:
+            await self.store.load(update.effective_user.id)
+    
+    async def reply(self, update: Update, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+                    parse_mode: Optional[str] = None) -> Optional[Message]:
+        """Send text to the chat of an update and return the sent message"""
+        if self.outbox is not None:
+            # Paced together with the queued edits of the same chat
+            message = await self.outbox.send_message(update.effective_chat.id, text, reply_markup=reply_markup,
+                                                     parse_mode=parse_mode)
+        else:
+            message = await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        if self.fingerprints is not None and message is not None:
+            self.fingerprints.remember(message.chat_id, message.message_id, text, reply_markup)
+        return message
+    
+    def _plan_edit(self, chat_id: int, message_id: int, text: str,
+                   reply_markup: Optional[InlineKeyboardMarkup]) -> Optional[str]:
+        """Skip or queue an edit; returns the change left to send directly, or None"""
+        change = fingerprints.FULL
+        if self.fingerprints is not None:
+            # Skip edits that would leave the message as it is
+            change = self.fingerprints.update(chat_id, message_id, text, reply_markup)
+            if change == fingerprints.UNCHANGED:
+                return None
         
-        welcome_text = f"""
-🎮 **Welcome to the Casino Games Bot!** 🎮
-
-Hello {user.first_name}! 
-
-This bot offers exciting casino-style games with fake money for fun and learning.
-
-💰 Your current balance: **{self.get_balance()} credits**
-
-🎲 **Available Games:**
-• **Keno** - Pick numbers and see how many match!
-• **Crash** - Cash out before the multiplier crashes!
-
-Choose a game below or use these commands:
-• /balance - Check your balance
-• /keno - Play Keno
-• /crash - Play Crash
-• /help - Show this menu again
-
-Good luck and have fun! 🍀
-        """
+        if self.outbox is not None:
+            # Queued: a newer edit of the same message replaces this one until it is sent
+            if change == fingerprints.MARKUP_ONLY:
+                self.outbox.edit_message_reply_markup(chat_id, message_id, reply_markup)
+            else:
+                self.outbox.edit_message_text(chat_id, message_id, text,
+                                              reply_markup=reply_markup, parse_mode='Markdown')
+            return None
+        return change
+    
+    async def edit_message(self, query, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        """Show text and markup on the message of a callback query"""
+        message = query.message
+        change = fingerprints.FULL
+        if message is not None:
+            change = self._plan_edit(message.chat_id, message.message_id, text, reply_markup)
+            if change is None:
+                return
         
-        keyboard = [
-            [
-                InlineKeyboardButton("🔢 Play Keno", callback_data="start_keno"),
-                InlineKeyboardButton("🚀 Play Crash", callback_data="start_crash")
-            ],
-            [
-                InlineKeyboardButton("💰 Check Balance", callback_data="check_balance"),
-                InlineKeyboardButton("ℹ️ Help", callback_data="show_help")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        try:
+            if change == fingerprints.MARKUP_ONLY:
+                await query.edit_message_reply_markup(reply_markup)
+            else:
+                await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        except TelegramError:
+            # The message may not show what was recorded
+            if self.fingerprints is not None and message is not None:
+                self.fingerprints.forget(message.chat_id, message.message_id)
+            raise
+    
+    async def edit_chat_message(self, bot, chat_id: int, message_id: int, text: str,
+                                reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        """Show text and markup on a message sent earlier (outside of a callback query)"""
+        change = self._plan_edit(chat_id, message_id, text, reply_markup)
+        if change is None:
+            return
         
-        await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+        try:
+            if change == fingerprints.MARKUP_ONLY:
+                await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+            else:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id,
+                                            reply_markup=reply_markup, parse_mode='Markdown')
+        except TelegramError:
+            if self.fingerprints is not None:
+                self.fingerprints.forget(chat_id, message_id)
+            raise
+    
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /start command - show welcome message and main menu"""
+        user = update.effective_user
+        screen = screens.welcome_screen(user.first_name, self.get_balance(user.id))
+        await self.reply(update, screen.text, screen.markup, parse_mode='Markdown')
     
     async def balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /balance command"""
-        balance_text = f"💰 **Your Current Balance**\n\n{self.get_balance()} credits"
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🔢 Play Keno", callback_data="start_keno"),
-                InlineKeyboardButton("🚀 Play Crash", callback_data="start_crash")
-            ],
-            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(balance_text, reply_markup=reply_markup, parse_mode='Markdown')
+        screen = screens.balance_screen(self.get_balance(update.effective_user.id))
+        await self.reply(update, screen.text, screen.markup, parse_mode='Markdown')
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /help command"""
-        help_text = """
-🎮 **Casino Games Bot Help** 🎮
-
-**🔢 Keno Game:**
-• Pick 1-10 numbers from 1-20
-• Bot draws 10 random numbers
-• Win based on how many of your numbers match
-• Higher matches = bigger payouts!
-
-**🚀 Crash Game:**
-• Set your bet amount
-• Watch the multiplier rise from 1.00x
-• Cash out before it crashes!
-• The longer you wait, the higher the multiplier, but higher the risk
-
-**💰 Payouts:**
-• Keno: 0 hits = lose bet, 1-2 hits = break even, 3+ hits = profit
-• Crash: Your bet × cashout multiplier
-
-**Commands:**
-• /start - Main menu
-• /balance - Check balance  
-• /keno - Start Keno game
-• /crash - Start Crash game
-• /help - Show this help
-
-Have fun and good luck! 🍀
-        """
-        
-        keyboard = [[InlineKeyboardButton("🏠 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(help_text, reply_markup=reply_markup, parse_mode='Markdown')
+        await self.reply(update, screens.HELP_SCREEN.text, screens.HELP_SCREEN.markup, parse_mode='Markdown')
 
     # === KENO GAME IMPLEMENTATION ===
     
     async def start_keno(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        """Start Keno game - ask for bet amount"""
+        """Start Keno game - ask for bet amount (or play a quick bet given with the command)"""
+        if context.args:
+            return await self.quick_keno(update, context)
         query = update.callback_query
-        if query:
-            await query.answer()
         
         # Reset game data
-        self.current_game_data = {
-            'game': 'keno',
-            'selected_numbers': [],
-            'bet_amount': 0
-        }
+        user_id = update.effective_user.id
+        self.release_bet(user_id)
+        self.store.start_game(user_id, game='keno', selected_mask=0, bet_amount=0)
+        balance = self.get_balance(user_id)
         
         keno_text = f"""
 🔢 **KENO GAME** 🔢
 
-💰 Your balance: {self.get_balance()} credits
+💰 Your balance: {balance} credits
 
 **How to play:**
-1. Set your bet amount ({MIN_BET}-{min(MAX_BET, self.get_balance())} credits)
+1. Set your bet amount ({MIN_BET}-{min(MAX_BET, balance)} credits)
 2. Pick 1-10 numbers from 1-20
 3. Bot draws 10 random numbers
 4. Win based on matches!
 
 **💎 Payout Table:**
-• 0-1 matches: Lose bet
-• 2 matches: Break even (1x)
-• 3 matches: 2x bet
-• 4 matches: 3x bet
-• 5 matches: 5x bet
-• 6+ matches: 10x bet
-
-Please enter your bet amount ({MIN_BET}-{min(MAX_BET, self.get_balance())}):
+{payout_table_text(KENO_PAYOUTS, KENO_TOTAL_NUMBERS, KENO_DRAWN_NUMBERS, KENO_MAX_PICKS)}
+
+Please enter your bet amount ({MIN_BET}-{min(MAX_BET, balance)}):
         """
         
         if query:
-            await query.edit_message_text(keno_text, parse_mode='Markdown')
+            await self.edit_message(query, keno_text)
         else:
-            await update.message.reply_text(keno_text, parse_mode='Markdown')
+            await self.reply(update, keno_text, parse_mode='Markdown')
         
         return KENO_SET_BET
     
     async def keno_set_bet(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle bet amount input for Keno"""
+        user_id = update.effective_user.id
+        if self.store.get_game(user_id).get('game') != 'keno':
+            return await self.game_expired(update)
         try:
             bet_amount = int(update.message.text)
             
             if bet_amount < MIN_BET:
-                await update.message.reply_text(f"❌ Minimum bet is {MIN_BET} credits. Please try again:")
-                return KENO_SET_BET
-            
-            if bet_amount > self.get_balance():
-                await update.message.reply_text(f"❌ Insufficient balance! You have {self.get_balance()} credits. Please try again:")
+                await self.reply(update, f"❌ Minimum bet is {MIN_BET} credits. Please try again:")
                 return KENO_SET_BET
             
             if bet_amount > MAX_BET:
-                await update.message.reply_text(f"❌ Maximum bet is {MAX_BET} credits. Please try again:")
+                await self.reply(update, f"❌ Maximum bet is {MAX_BET} credits. Please try again:")
                 return KENO_SET_BET
             
-            self.current_game_data['bet_amount'] = bet_amount
-            
-            # Show number selection interface
-            numbers_text = f"""
-🔢 **KENO - Pick Your Numbers** 🔢
-
-💰 Bet amount: {bet_amount} credits
-🎯 Selected: {len(self.current_game_data['selected_numbers'])}/10 numbers
-
-Pick 1-10 numbers from 1-20. Tap numbers below to select/deselect:
-            """
-            
-            keyboard = []
-            for row in range(4):  # 4 rows of 5 numbers each
-                button_row = []
-                for col in range(5):
-                    number = row * 5 + col + 1
-                    if number <= 20:
-                        # Mark selected numbers with ✅
-                        display_text = f"✅{number}" if number in self.current_game_data['selected_numbers'] else str(number)
-                        button_row.append(InlineKeyboardButton(display_text, callback_data=f"keno_select_{number}"))
-                keyboard.append(button_row)
+            # Hold the bet now so it cannot be spent twice before the round is played
+            if not self.reserve_bet(user_id, bet_amount):
+                balance = self.store.get_available_balance(user_id)
+                await self.reply(update, f"❌ Insufficient balance! You have {balance} credits. Please try again:")
+                return KENO_SET_BET
             
-            # Control buttons
-            keyboard.append([
-                InlineKeyboardButton("🎲 PLAY", callback_data="keno_play"),
-                InlineKeyboardButton("🔄 Clear All", callback_data="keno_clear"),
-                InlineKeyboardButton("❌ Cancel", callback_data="main_menu")
-            ])
+            game_data = self.store.get_game(user_id)
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(numbers_text, reply_markup=reply_markup, parse_mode='Markdown')
+            # Show number selection interface (selected numbers marked with ✅) plus control buttons
+            screen = screens.keno_pick_screen(bet_amount, game_data['selected_mask'])
+            await self.reply(update, screen.text, screen.markup, parse_mode='Markdown')
             
             return KENO_PICK_NUMBERS
             
         except ValueError:
-            await update.message.reply_text("❌ Please enter a valid number:")
+            await self.reply(update, "❌ Please enter a valid number:")
             return KENO_SET_BET
     
-    async def keno_number_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    async def keno_select_number(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle number selection for Keno"""
         query = update.callback_query
-        await query.answer()
         
-        callback_data = query.data
+        number = context.match.arg
+        user_id = update.effective_user.id
+        game_data = self.store.get_game(user_id)
+        if game_data.get('game') != 'keno':
+            return await self.game_expired(update)
+        selected_mask = game_data['selected_mask']
         
-        if callback_data.startswith("keno_select_"):
-            number = int(callback_data.split("_")[2])
-            
-            if number in self.current_game_data['selected_numbers']:
-                # Deselect number
-                self.current_game_data['selected_numbers'].remove(number)
-            else:
-                # Select number (max 10)
-                if len(self.current_game_data['selected_numbers']) < 10:
-                    self.current_game_data['selected_numbers'].append(number)
-                else:
-                    await query.answer("Maximum 10 numbers allowed!", show_alert=True)
-                    return KENO_PICK_NUMBERS
-            
-            # Update the keyboard
-            numbers_text = f"""
-🔢 **KENO - Pick Your Numbers** 🔢
-
-💰 Bet amount: {self.current_game_data['bet_amount']} credits
-🎯 Selected: {len(self.current_game_data['selected_numbers'])}/10 numbers
-
-Pick 1-10 numbers from 1-20. Tap numbers below to select/deselect:
-            """
-            
-            keyboard = []
-            for row in range(4):
-                button_row = []
-                for col in range(5):
-                    number = row * 5 + col + 1
-                    if number <= 20:
-                        display_text = f"✅{number}" if number in self.current_game_data['selected_numbers'] else str(number)
-                        button_row.append(InlineKeyboardButton(display_text, callback_data=f"keno_select_{number}"))
-                keyboard.append(button_row)
-            
-            keyboard.append([
-                InlineKeyboardButton("🎲 PLAY", callback_data="keno_play"),
-                InlineKeyboardButton("🔄 Clear All", callback_data="keno_clear"),
-                InlineKeyboardButton("❌ Cancel", callback_data="main_menu")
-            ])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(numbers_text, reply_markup=reply_markup, parse_mode='Markdown')
+        # Select number (max 10) or deselect it
+        if not keno.is_selected(selected_mask, number) and keno.popcount(selected_mask) >= KENO_MAX_PICKS:
+            answers.alert(query, f"Maximum {KENO_MAX_PICKS} numbers allowed!")
+            return KENO_PICK_NUMBERS
         
-        elif callback_data == "keno_clear":
-            self.current_game_data['selected_numbers'] = []
-            # Update keyboard with cleared selections
-            numbers_text = f"""
-🔢 **KENO - Pick Your Numbers** 🔢
-
-💰 Bet amount: {self.current_game_data['bet_amount']} credits
-🎯 Selected: 0/10 numbers
-
-Pick 1-10 numbers from 1-20. Tap numbers below to select/deselect:
-            """
-            
-            keyboard = []
-            for row in range(4):
-                button_row = []
-                for col in range(5):
-                    number = row * 5 + col + 1
-                    if number <= 20:
-                        button_row.append(InlineKeyboardButton(str(number), callback_data=f"keno_select_{number}"))
-                keyboard.append(button_row)
-            
-            keyboard.append([
-                InlineKeyboardButton("🎲 PLAY", callback_data="keno_play"),
-                InlineKeyboardButton("🔄 Clear All", callback_data="keno_clear"),
-                InlineKeyboardButton("❌ Cancel", callback_data="main_menu")
-            ])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(numbers_text, reply_markup=reply_markup, parse_mode='Markdown')
+        game_data = self.store.update_game(user_id, selected_mask=keno.toggle_number(selected_mask, number))
         
-        elif callback_data == "keno_play":
-            if len(self.current_game_data['selected_numbers']) == 0:
-                await query.answer("Please select at least 1 number!", show_alert=True)
-                return KENO_PICK_NUMBERS
-            
-            # Play the game!
-            await self.play_keno_round(query)
-            return ConversationHandler.END
+        # Update the keyboard
+        screen = screens.keno_pick_screen(game_data['bet_amount'], game_data['selected_mask'])
+        await self.edit_message(query, screen.text, screen.markup)
+        return KENO_PICK_NUMBERS
+    
+    async def keno_clear(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Clear the Keno selection"""
+        query = update.callback_query
         
+        user_id = update.effective_user.id
+        if self.store.get_game(user_id).get('game') != 'keno':
+            return await self.game_expired(update)
+        game_data = self.store.update_game(user_id, selected_mask=0)
+        # Update keyboard with cleared selections
+        screen = screens.keno_pick_screen(game_data['bet_amount'], 0)
+        await self.edit_message(query, screen.text, screen.markup)
         return KENO_PICK_NUMBERS
     
-    async def play_keno_round(self, query) -> None:
-        """Execute Keno game round and show results"""
-        # Deduct bet from balance
-        bet_amount = self.current_game_data['bet_amount']
-        self.update_balance(-bet_amount)
+    async def keno_play(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Play the Keno ticket (or queue it for the next draw)"""
+        query = update.callback_query
         
-        # Generate 10 random winning numbers
-        winning_numbers = sorted(random.sample(range(1, 21), 10))
-        user_numbers = sorted(self.current_game_data['selected_numbers'])
+        game_data = self.store.get_game(update.effective_user.id)
+        if game_data.get('game') != 'keno':
+            return await self.game_expired(update)
+        if game_data['selected_mask'] == 0:
+            answers.alert(query, "Please select at least 1 number!")
+            return KENO_PICK_NUMBERS
         
-        # Calculate matches
-        matches = [num for num in user_numbers if num in winning_numbers]
-        match_count = len(matches)
+        # Play the game!
+        user_id = update.effective_user.id
+        if self.keno_draws is not None:
+            screen = self.queue_keno_ticket(user_id, query.message.chat_id, query.message.message_id)
+        else:
+            screen = self.play_keno_round(user_id)
+        if screen is not None:
+            await self.edit_message(query, screen.text, screen.markup)
+        return ConversationHandler.END
+    
+    async def quick_keno(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Play a whole Keno ticket from one command: /keno <bet> <numbers>"""
+        user_id = update.effective_user.id
+        try:
+            ticket = quick_bets.parse_keno(context.args, MIN_BET, MAX_BET, KENO_TOTAL_NUMBERS, KENO_MAX_PICKS)
+        except ValueError as e:
+            await self.reply(update, f"❌ {e}\n\n{quick_bets.KENO_USAGE}")
+            return ConversationHandler.END
+        
+        # Replaces any game in progress, like /keno
+        self.release_bet(user_id)
+        self.store.start_game(user_id, game='keno', selected_mask=ticket.selected_mask, bet_amount=0)
+        if not self.reserve_bet(user_id, ticket.bet_amount):
+            balance = self.store.get_available_balance(user_id)
+            await self.reply(update, f"❌ Insufficient balance! You have {balance} credits.")
+            return ConversationHandler.END
+        
+        if self.keno_draws is not None:
+            await self.place_quick_bet(update, context, self.queue_keno_ticket)
+        else:
+            screen = self.play_keno_round(user_id)
+            await self.reply(update, screen.text, screen.markup, parse_mode='Markdown')
+        return ConversationHandler.END
+    
+    async def place_quick_bet(self, update: Update, context: ContextTypes.DEFAULT_TYPE, place) -> None:
+        """Send a message for a quick bet that a draw or round settles later, then hand the bet over"""
+        # Results are edited into this message, so it must exist first
+        message = await self.reply(update, "⏳ Placing your bet...")
+        screen = place(update.effective_user.id, message.chat_id, message.message_id)
+        if screen is not None:
+            await self.edit_chat_message(context.bot, message.chat_id, message.message_id, screen.text,
+                                         screen.markup)
+    
+    def play_keno_round(self, user_id: int) -> Optional[screens.Screen]:
+        """Draw the numbers for the session's ticket and settle it; returns the result screen"""
+        game_data = self.store.get_game(user_id)
+        bet_amount = game_data['bet_amount']
+        
+        # Draw 10 random winning numbers and count matches on the bitmasks
+        selected_mask = game_data['selected_mask']
+        winning_mask = keno.draw_mask(KENO_TOTAL_NUMBERS, KENO_DRAWN_NUMBERS)
+        match_count = keno.count_matches(selected_mask, winning_mask)
         
         # Calculate payout using config
-        payout_multiplier = KENO_PAYOUTS.get(match_count, 0)
+        winnings = keno.payout(bet_amount, match_count, KENO_PAYOUTS)
         
-        winnings = bet_amount * payout_multiplier
-        net_result = winnings - bet_amount
+        # Charge the held bet and pay out in one step; a repeated PLAY tap finds
+        # the reservation already settled and is ignored
+        new_balance = self.store.settle(user_id, game_data.get('reservation'), winnings, 'keno')
+        if new_balance is None:
+            logger.info(f"Ignoring repeated Keno settlement for user {user_id}")
+            return None
+        if self.metrics is not None:
+            self.metrics.record_settlement('keno', bet_amount, winnings)
         
-        if winnings > 0:
-            self.update_balance(winnings)
+        return screens.Screen(self.keno_result_text(bet_amount, selected_mask, winning_mask, winnings, new_balance),
+                              KENO_RESULT_MARKUP)
+    
+    def keno_result_text(self, bet_amount: int, selected_mask: int, winning_mask: int,
+                         winnings: int, new_balance: int, title: str = "KENO RESULTS") -> str:
+        """Result screen of a Keno ticket"""
+        net_result = winnings - bet_amount
+        match_count = keno.count_matches(selected_mask, winning_mask)
         
         # Format results
-        user_numbers_str = " ".join([f"**{num}**" if num in matches else str(num) for num in user_numbers])
+        user_numbers = keno.mask_to_numbers(selected_mask)
+        winning_numbers = keno.mask_to_numbers(winning_mask)
+        matches = keno.mask_to_numbers(selected_mask & winning_mask)
+        user_numbers_str = " ".join([f"**{num}**" if keno.is_selected(winning_mask, num) else str(num) for num in user_numbers])
         winning_numbers_str = " ".join([str(num) for num in winning_numbers])
         matches_str = " ".join([str(num) for num in matches]) if matches else "None"
         
-        result_text = f"""
-🔢 **KENO RESULTS** 🔢
+        return f"""
+🔢 **{title}** 🔢
 
 **Your Numbers:** {user_numbers_str}
 **Winning Numbers:** {winning_numbers_str}
@@ -386,45 +487,81 @@ Pick 1-10 numbers from 1-20. Tap numbers below to select/deselect:
 🏆 **Winnings:** {winnings} credits
 📊 **Net Result:** {"+" if net_result >= 0 else ""}{net_result} credits
 
-💳 **New Balance:** {self.get_balance()} credits
+💳 **New Balance:** {new_balance} credits
 
 {"🎉 Congratulations!" if net_result > 0 else "😔 Better luck next time!" if net_result < 0 else "🤝 Break even!"}
         """
+    
+    def queue_keno_ticket(self, user_id: int, chat_id: int, message_id: int) -> Optional[screens.Screen]:
+        """Hand the held bet and picks to the next scheduled draw, whose result replaces the message"""
+        game_data = self.store.get_game(user_id)
+        
+        # A repeated PLAY tap finds the ticket already queued and is ignored
+        reservation = game_data.get('reservation')
+        if reservation is None:
+            return None
         
-        keyboard = [
-            [
-                InlineKeyboardButton("🔢 Play Again", callback_data="start_keno"),
-                InlineKeyboardButton("🚀 Try Crash", callback_data="start_crash")
-            ],
-            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        ticket_draw = self.keno_draws.queue_ticket(user_id, chat_id, message_id, game_data['selected_mask'],
+                                                   game_data['bet_amount'], reservation)
+        # The draw owns the bet now, so leaving the game must not release it
+        self.store.update_game(user_id, reservation=None, draw=ticket_draw.number)
+        
+        seconds = self.keno_draws.seconds_to_draw()
+        when = f"in {round(seconds)}s" if seconds is not None else "soon"
+        numbers_str = " ".join(str(num) for num in keno.mask_to_numbers(game_data['selected_mask']))
+        ticket_text = f"""
+🔢 **KENO DRAW #{ticket_draw.number}** 🔢
+
+🎟️ Ticket queued! {len(ticket_draw)} ticket(s) in this draw so far.
+
+**Your Numbers:** {numbers_str}
+💰 **Bet:** {game_data['bet_amount']} credits
+
+🕐 Numbers are drawn {when}...
+        """
+        return screens.Screen(ticket_text, None)
+    
+    async def show_keno_draw(self, ticket_draw: KenoDraw, matches: List[int], winnings: List[int],
+                             balances: List[Optional[int]]) -> None:
+        """Show the result of a settled draw on each of its tickets"""
+        if self.metrics is not None:
+            self.metrics.record_settlements('keno', ticket_draw.bets, winnings, balances)
         
-        await query.edit_message_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
+        title = f"KENO DRAW #{ticket_draw.number}"
+        for index, new_balance in enumerate(balances):
+            if new_balance is None:
+                continue
+            result_text = self.keno_result_text(ticket_draw.bets[index], ticket_draw.picks[index],
+                                                ticket_draw.drawn_mask, winnings[index], new_balance, title)
+            try:
+                await self.edit_chat_message(self.keno_draws.bot, ticket_draw.chat_ids[index],
+                                             ticket_draw.message_ids[index], result_text, KENO_RESULT_MARKUP)
+            except TelegramError as e:
+                logger.warning(f"Keno result edit failed: {e}")
+            if index % 1000 == 999:
+                await asyncio.sleep(0)  # Let updates in between the results of a large draw
 
     # === CRASH GAME IMPLEMENTATION ===
     
     async def start_crash(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        """Start Crash game - ask for bet amount"""
+        """Start Crash game - ask for bet amount (or play a quick bet given with the command)"""
+        if context.args:
+            return await self.quick_crash(update, context)
         query = update.callback_query
-        if query:
-            await query.answer()
         
         # Reset game data
-        self.current_game_data = {
-            'game': 'crash',
-            'bet_amount': 0,
-            'target_multiplier': 1.0,
-            'actual_multiplier': 0.0
-        }
+        user_id = update.effective_user.id
+        self.release_bet(user_id)
+        self.store.start_game(user_id, game='crash', bet_amount=0, target_multiplier=1.0, actual_multiplier=0.0)
+        balance = self.get_balance(user_id)
         
         crash_text = f"""
 🚀 **CRASH GAME** 🚀
 
-💰 Your balance: {self.get_balance()} credits
+💰 Your balance: {balance} credits
 
 **How to play:**
-1. Set your bet amount ({MIN_BET}-{min(MAX_BET, self.get_balance())} credits)
+1. Set your bet amount ({MIN_BET}-{min(MAX_BET, balance)} credits)
 2. Choose your cash-out multiplier (1.1x - 10.0x)
 3. Bot generates a random crash point
 4. If you cash out before the crash, you win!
@@ -435,92 +572,74 @@ Pick 1-10 numbers from 1-20. Tap numbers below to select/deselect:
 • If crash happens at 3.0x → Win 250 credits!
 • If crash happens at 2.0x → Lose 100 credits!
 
-Please enter your bet amount ({MIN_BET}-{min(MAX_BET, self.get_balance())}):
+Please enter your bet amount ({MIN_BET}-{min(MAX_BET, balance)}):
         """
         
         if query:
-            await query.edit_message_text(crash_text, parse_mode='Markdown')
+            await self.edit_message(query, crash_text)
         else:
-            await update.message.reply_text(crash_text, parse_mode='Markdown')
+            await self.reply(update, crash_text, parse_mode='Markdown')
         
         return CRASH_SET_BET
     
     async def crash_set_bet(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle bet amount input for Crash"""
+        user_id = update.effective_user.id
+        if self.store.get_game(user_id).get('game') != 'crash':
+            return await self.game_expired(update)
         try:
             bet_amount = int(update.message.text)
             
             if bet_amount < MIN_BET:
-                await update.message.reply_text(f"❌ Minimum bet is {MIN_BET} credits. Please try again:")
+                await self.reply(update, f"❌ Minimum bet is {MIN_BET} credits. Please try again:")
                 return CRASH_SET_BET
             
-            if bet_amount > self.get_balance():
-                await update.message.reply_text(f"❌ Insufficient balance! You have {self.get_balance()} credits. Please try again:")
+            if bet_amount > MAX_BET:
+                await self.reply(update, f"❌ Maximum bet is {MAX_BET} credits. Please try again:")
                 return CRASH_SET_BET
             
-            if bet_amount > MAX_BET:
-                await update.message.reply_text(f"❌ Maximum bet is {MAX_BET} credits. Please try again:")
+            # Hold the bet now so it cannot be spent twice before the round is played
+            if not self.reserve_bet(user_id, bet_amount):
+                balance = self.store.get_available_balance(user_id)
+                await self.reply(update, f"❌ Insufficient balance! You have {balance} credits. Please try again:")
                 return CRASH_SET_BET
             
-            self.current_game_data['bet_amount'] = bet_amount
+            game_data = self.store.get_game(user_id)
             
             # Show cashout selection interface
             cashout_text = f"""
 🚀 **CRASH - Choose Cash-Out Point** 🚀
 
 💰 Bet amount: {bet_amount} credits
-🎯 Current selection: {self.current_game_data['target_multiplier']:.1f}x
+🎯 Current selection: {game_data['target_multiplier']:.1f}x
 
 Choose your cash-out multiplier. Higher multipliers = higher risk & reward!
 
-**Potential Winnings:** {int(bet_amount * self.current_game_data['target_multiplier'])} credits
+**Potential Winnings:** {int(bet_amount * game_data['target_multiplier'])} credits
             """
             
-            keyboard = [
-                [
-                    InlineKeyboardButton("1.1x", callback_data="crash_mult_1.1"),
-                    InlineKeyboardButton("1.5x", callback_data="crash_mult_1.5"),
-                    InlineKeyboardButton("2.0x", callback_data="crash_mult_2.0"),
-                    InlineKeyboardButton("2.5x", callback_data="crash_mult_2.5")
-                ],
-                [
-                    InlineKeyboardButton("3.0x", callback_data="crash_mult_3.0"),
-                    InlineKeyboardButton("4.0x", callback_data="crash_mult_4.0"),
-                    InlineKeyboardButton("5.0x", callback_data="crash_mult_5.0"),
-                    InlineKeyboardButton("7.5x", callback_data="crash_mult_7.5")
-                ],
-                [
-                    InlineKeyboardButton("10.0x", callback_data="crash_mult_10.0")
-                ],
-                [
-                    InlineKeyboardButton("🚀 LAUNCH", callback_data="crash_play"),
-                    InlineKeyboardButton("❌ Cancel", callback_data="main_menu")
-                ]
-            ]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(cashout_text, reply_markup=reply_markup, parse_mode='Markdown')
+            reply_markup = crash_target_markup(game_data['target_multiplier'])
+            await self.reply(update, cashout_text, reply_markup, parse_mode='Markdown')
             
             return CRASH_CASHOUT
             
         except ValueError:
-            await update.message.reply_text("❌ Please enter a valid number:")
+            await self.reply(update, "❌ Please enter a valid number:")
             return CRASH_SET_BET
     
-    async def crash_multiplier_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    async def crash_select_target(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle multiplier selection for Crash"""
         query = update.callback_query
-        await query.answer()
         
-        callback_data = query.data
+        multiplier = context.match.arg
+        user_id = update.effective_user.id
+        if self.store.get_game(user_id).get('game') != 'crash':
+            return await self.game_expired(update)
+        game_data = self.store.update_game(user_id, target_multiplier=multiplier)
         
-        if callback_data.startswith("crash_mult_"):
-            multiplier = float(callback_data.split("_")[2])
-            self.current_game_data['target_multiplier'] = multiplier
-            
-            # Update the display
-            bet_amount = self.current_game_data['bet_amount']
-            cashout_text = f"""
+        # Update the display
+        bet_amount = game_data['bet_amount']
+        cashout_text = f"""
 🚀 **CRASH - Choose Cash-Out Point** 🚀
 
 💰 Bet amount: {bet_amount} credits
@@ -529,62 +648,86 @@ Choose your cash-out multiplier. Higher multipliers = higher risk & reward!
 Choose your cash-out multiplier. Higher multipliers = higher risk & reward!
 
 **Potential Winnings:** {int(bet_amount * multiplier)} credits
-            """
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("✅1.1x" if multiplier == 1.1 else "1.1x", callback_data="crash_mult_1.1"),
-                    InlineKeyboardButton("✅1.5x" if multiplier == 1.5 else "1.5x", callback_data="crash_mult_1.5"),
-                    InlineKeyboardButton("✅2.0x" if multiplier == 2.0 else "2.0x", callback_data="crash_mult_2.0"),
-                    InlineKeyboardButton("✅2.5x" if multiplier == 2.5 else "2.5x", callback_data="crash_mult_2.5")
-                ],
-                [
-                    InlineKeyboardButton("✅3.0x" if multiplier == 3.0 else "3.0x", callback_data="crash_mult_3.0"),
-                    InlineKeyboardButton("✅4.0x" if multiplier == 4.0 else "4.0x", callback_data="crash_mult_4.0"),
-                    InlineKeyboardButton("✅5.0x" if multiplier == 5.0 else "5.0x", callback_data="crash_mult_5.0"),
-                    InlineKeyboardButton("✅7.5x" if multiplier == 7.5 else "7.5x", callback_data="crash_mult_7.5")
-                ],
-                [
-                    InlineKeyboardButton("✅10.0x" if multiplier == 10.0 else "10.0x", callback_data="crash_mult_10.0")
-                ],
-                [
-                    InlineKeyboardButton("🚀 LAUNCH", callback_data="crash_play"),
-                    InlineKeyboardButton("❌ Cancel", callback_data="main_menu")
-                ]
-            ]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(cashout_text, reply_markup=reply_markup, parse_mode='Markdown')
+        """
         
-        elif callback_data == "crash_play":
-            # Play the game!
-            await self.play_crash_round(query)
+        reply_markup = crash_target_markup(multiplier)
+        await self.edit_message(query, cashout_text, reply_markup)
+        return CRASH_CASHOUT
+    
+    async def crash_launch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Launch the Crash bet (or join the shared round)"""
+        query = update.callback_query
+        
+        if self.store.get_game(update.effective_user.id).get('game') != 'crash':
+            return await self.game_expired(update)
+        
+        # Play the game!
+        user_id = update.effective_user.id
+        if self.crash_rounds is not None:
+            screen = self.join_crash_round(user_id, query.message.chat_id, query.message.message_id)
+        else:
+            screen = self.play_crash_round(user_id)
+        if screen is not None:
+            await self.edit_message(query, screen.text, screen.markup)
+        return ConversationHandler.END
+    
+    async def quick_crash(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Play a whole Crash bet from one command: /crash <bet> <target>"""
+        user_id = update.effective_user.id
+        try:
+            bet = quick_bets.parse_crash(context.args, MIN_BET, MAX_BET, CRASH_MIN_MULTIPLIER, CRASH_MAX_MULTIPLIER)
+        except ValueError as e:
+            await self.reply(update, f"❌ {e}\n\n{quick_bets.CRASH_USAGE}")
             return ConversationHandler.END
         
-        return CRASH_CASHOUT
+        # Replaces any game in progress, like /crash
+        self.release_bet(user_id)
+        self.store.start_game(user_id, game='crash', bet_amount=0, target_multiplier=bet.target_multiplier,
+                              actual_multiplier=0.0)
+        if not self.reserve_bet(user_id, bet.bet_amount):
+            balance = self.store.get_available_balance(user_id)
+            await self.reply(update, f"❌ Insufficient balance! You have {balance} credits.")
+            return ConversationHandler.END
+        
+        if self.crash_rounds is not None:
+            await self.place_quick_bet(update, context, self.join_crash_round)
+        else:
+            screen = self.play_crash_round(user_id)
+            await self.reply(update, screen.text, screen.markup, parse_mode='Markdown')
+        return ConversationHandler.END
     
-    async def play_crash_round(self, query) -> None:
-        """Execute Crash game round and show results"""
-        # Deduct bet from balance
-        bet_amount = self.current_game_data['bet_amount']
-        target_multiplier = self.current_game_data['target_multiplier']
-        self.update_balance(-bet_amount)
+    def play_crash_round(self, user_id: int) -> Optional[screens.Screen]:
+        """Fly the session's bet in its own instant round; returns the result screen"""
+        game_data = self.store.get_game(user_id)
+        
+        bet_amount = game_data['bet_amount']
+        target_multiplier = game_data['target_multiplier']
         
         # Generate random crash point (weighted towards lower values for realistic casino odds)
         # Higher multipliers should be less likely
         crash_point = self.generate_crash_multiplier()
-        self.current_game_data['actual_multiplier'] = crash_point
+        self.store.update_game(user_id, actual_multiplier=crash_point)
         
         # Determine win/loss
-        won = target_multiplier <= crash_point
+        winnings = crash.payout(bet_amount, target_multiplier, crash_point)
         
-        if won:
-            winnings = int(bet_amount * target_multiplier)
-            self.update_balance(winnings)
-            net_result = winnings - bet_amount
-        else:
-            winnings = 0
-            net_result = -bet_amount
+        # Charge the held bet and pay out in one step; a repeated LAUNCH tap finds
+        # the reservation already settled and is ignored
+        new_balance = self.store.settle(user_id, game_data.get('reservation'), winnings, 'crash')
+        if new_balance is None:
+            logger.info(f"Ignoring repeated Crash settlement for user {user_id}")
+            return None
+        if self.metrics is not None:
+            self.metrics.record_settlement('crash', bet_amount, winnings)
+        
+        return screens.Screen(self.crash_result_text(bet_amount, target_multiplier, crash_point, winnings,
+                                                     new_balance), CRASH_RESULT_MARKUP)
+    
+    def crash_result_text(self, bet_amount: int, target_multiplier: float, crash_point: float,
+                          winnings: int, new_balance: int) -> str:
+        """Result screen of a Crash round"""
+        won = target_multiplier <= crash_point
+        net_result = winnings - bet_amount
         
         # Format results with some dramatic flair
         if won:
@@ -596,7 +739,7 @@ Choose your cash-out multiplier. Higher multipliers = higher risk & reward!
             result_message = "CRASHED!"
             result_description = f"Crashed at {crash_point:.2f}x before your {target_multiplier:.1f}x target!"
         
-        result_text = f"""
+        return f"""
 🚀 **CRASH RESULTS** 🚀
 
 {result_emoji} **{result_message}** {result_emoji}
@@ -609,134 +752,263 @@ Choose your cash-out multiplier. Higher multipliers = higher risk & reward!
 🏆 **Winnings:** {winnings} credits  
 📊 **Net Result:** {"+" if net_result >= 0 else ""}{net_result} credits
 
-💳 **New Balance:** {self.get_balance()} credits
+💳 **New Balance:** {new_balance} credits
 
 {"🎉 Congratulations!" if won else "😔 Better luck next time!"}
         """
+    
+    def join_crash_round(self, user_id: int, chat_id: int, message_id: int) -> Optional[screens.Screen]:
+        """Hand the held bet to the shared round that is taking bets, whose ticker takes over the message"""
+        game_data = self.store.get_game(user_id)
+        
+        # A repeated LAUNCH tap finds the bet already handed over and is ignored
+        reservation = game_data.get('reservation')
+        if reservation is None:
+            return None
         
-        keyboard = [
-            [
-                InlineKeyboardButton("🚀 Play Again", callback_data="start_crash"),
-                InlineKeyboardButton("🔢 Try Keno", callback_data="start_keno")
-            ],
-            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        rounds = self.crash_rounds
+        crash_round = rounds.place_bet(user_id, chat_id, message_id, game_data['bet_amount'],
+                                       game_data['target_multiplier'], reservation)
+        if crash_round is None:
+            self.release_bet(user_id)
+            self.store.update_game(user_id, reservation=None)
+            return screens.Screen("🚀 You already have a bet in the next Crash round!", CRASH_RESULT_MARKUP)
+        # The round owns the bet now, so leaving the game must not release it
+        self.store.update_game(user_id, reservation=None, round=crash_round.number)
         
-        await query.edit_message_text(result_text, reply_markup=reply_markup, parse_mode='Markdown')
+        if rounds.current is not None:
+            launch = "after the round in the air lands"
+        else:
+            launch = f"in {max(0, round(crash_round.starts_at - time.monotonic()))}s"
+        joined_text = f"""
+🚀 **CRASH ROUND #{crash_round.number}** 🚀
+
+✅ You're in! {len(crash_round)} player(s) so far.
+
+💰 **Bet:** {game_data['bet_amount']} credits
+🎯 **Your Target:** {game_data['target_multiplier']:.1f}x
+
+🕐 Launching {launch}...
+        """
+        return screens.Screen(joined_text, None)
+    
+    async def show_crash_tick(self, crash_round: CrashRound, multiplier: float, indices: List[int]) -> None:
+        """Show the live multiplier on the messages of some bettors of a round"""
+        for index in indices:
+            bet_amount = crash_round.bets[index]
+            target = crash_round.targets[index]
+            if multiplier >= target:
+                status = f"✅ Cashed out at {target:.1f}x → {int(bet_amount * target)} credits"
+            else:
+                status = f"🎯 Cashing out at {target:.1f}x"
+            tick_text = f"""
+🚀 **CRASH ROUND #{crash_round.number}** 🚀
+
+📈 **{multiplier:.2f}x**
+
+💰 **Bet:** {bet_amount} credits
+{status}
+            """
+            try:
+                await self.edit_chat_message(self.crash_rounds.bot, crash_round.chat_ids[index],
+                                             crash_round.message_ids[index], tick_text)
+            except TelegramError as e:
+                logger.warning(f"Crash tick edit failed: {e}")
+    
+    async def show_crash_settlement(self, crash_round: CrashRound, winnings: List[int],
+                                    balances: List[Optional[int]]) -> None:
+        """Show the result of a settled round to each of its bettors"""
+        if self.metrics is not None:
+            self.metrics.record_settlements('crash', crash_round.bets, winnings, balances)
+        
+        for index, new_balance in enumerate(balances):
+            if new_balance is None:
+                continue
+            result_text = self.crash_result_text(crash_round.bets[index], crash_round.targets[index],
+                                                 crash_round.crash_point, winnings[index], new_balance)
+            try:
+                await self.edit_chat_message(self.crash_rounds.bot, crash_round.chat_ids[index],
+                                             crash_round.message_ids[index], result_text, CRASH_RESULT_MARKUP)
+            except TelegramError as e:
+                logger.warning(f"Crash result edit failed: {e}")
+            if index % 1000 == 999:
+                await asyncio.sleep(0)  # Let updates in between the results of a large round
     
     def generate_crash_multiplier(self) -> float:
-        """Generate realistic crash multiplier with weighted probabilities"""
-        # Weighted random generation to simulate real crash game probabilities
-        rand = random.random()
-        
-        if rand < 0.33:  # 33% chance of crash between 1.0-2.0x
-            return round(random.uniform(1.0, 2.0), 2)
-        elif rand < 0.65:  # 32% chance of crash between 2.0-4.0x  
-            return round(random.uniform(2.0, 4.0), 2)
-        elif rand < 0.85:  # 20% chance of crash between 4.0-7.0x
-            return round(random.uniform(4.0, 7.0), 2)
-        elif rand < 0.95:  # 10% chance of crash between 7.0-15.0x
-            return round(random.uniform(7.0, 15.0), 2)
-        else:  # 5% chance of crash above 15.0x (rare!)
-            return round(random.uniform(15.0, 50.0), 2)
+        """Generate a crash multiplier from the configured distribution"""
+        # Distributions live in crash.py so the simulator uses the same odds
+        return self.crash_points.next()
+
+    # === AUTOBET ===
+    
+    async def autokeno_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /autokeno - play one Keno ticket for many rounds at once"""
+        user_id = update.effective_user.id
+        try:
+            rules, ticket = autobet.parse_keno(context.args, MIN_BET, MAX_BET, AUTOBET_MAX_ROUNDS,
+                                               KENO_TOTAL_NUMBERS, KENO_MAX_PICKS)
+        except ValueError as e:
+            await self.reply(update, f"❌ {e}\n\n{autobet.KENO_USAGE}")
+            return
+        
+        self.release_bet(user_id)
+        self.store.start_game(user_id, game='keno', selected_mask=ticket.selected_mask, bet_amount=0)
+        if not await self.reserve_autobet(update, ticket.bet_amount, rules):
+            return
+        
+        # Every round drawn and settled in one vectorized call
+        result = autobet.play_keno(ticket.selected_mask, ticket.bet_amount, rules, KENO_PAYOUTS,
+                                   KENO_TOTAL_NUMBERS, KENO_DRAWN_NUMBERS)
+        numbers_str = " ".join(str(num) for num in keno.mask_to_numbers(ticket.selected_mask))
+        await self.finish_autobet(update, 'keno', ticket.bet_amount, rules, result,
+                                  f"🔢 **KENO AUTOBET** 🔢\n\n**Your Numbers:** {numbers_str}", KENO_RESULT_MARKUP)
+    
+    async def autocrash_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /autocrash - play one Crash bet for many instant rounds at once"""
+        user_id = update.effective_user.id
+        try:
+            rules, bet = autobet.parse_crash(context.args, MIN_BET, MAX_BET, AUTOBET_MAX_ROUNDS,
+                                             CRASH_MIN_MULTIPLIER, CRASH_MAX_MULTIPLIER)
+        except ValueError as e:
+            await self.reply(update, f"❌ {e}\n\n{autobet.CRASH_USAGE}")
+            return
+        
+        self.release_bet(user_id)
+        self.store.start_game(user_id, game='crash', bet_amount=0, target_multiplier=bet.target_multiplier,
+                              actual_multiplier=0.0)
+        if not await self.reserve_autobet(update, bet.bet_amount, rules):
+            return
+        
+        # Private instant rounds, even when single bets fly in shared rounds
+        result = autobet.play_crash(bet.bet_amount, bet.target_multiplier, rules, self.crash_distribution)
+        await self.finish_autobet(update, 'crash', bet.bet_amount, rules, result,
+                                  f"🚀 **CRASH AUTOBET** 🚀\n\n**Your Target:** {bet.target_multiplier:.1f}x",
+                                  CRASH_RESULT_MARKUP)
+    
+    async def reserve_autobet(self, update: Update, bet_amount: int, rules: autobet.AutobetRules) -> bool:
+        """Hold the stakes of every round up front, or tell the player how many rounds they can afford"""
+        user_id = update.effective_user.id
+        if self.reserve_bet(user_id, bet_amount * rules.rounds):
+            return True
+        balance = self.store.get_available_balance(user_id)
+        await self.reply(update, f"❌ Insufficient balance! {rules.rounds} rounds of {bet_amount} need "
+                                 f"{bet_amount * rules.rounds} credits; you have {balance} "
+                                 f"(enough for {balance // bet_amount} rounds).")
+        return False
+    
+    async def finish_autobet(self, update: Update, game: str, bet_amount: int, rules: autobet.AutobetRules,
+                             result: autobet.AutobetResult, header: str,
+                             reply_markup: InlineKeyboardMarkup) -> None:
+        """Charge the played rounds with one wallet update and send one summary"""
+        user_id = update.effective_user.id
+        # Stakes of the rounds a stop rule skipped go back to the balance
+        new_balance = self.store.settle(user_id, self.store.get_game(user_id).get('reservation'), result.won, game,
+                                        charge=result.wagered)
+        if new_balance is None:
+            return
+        # The session shows what was staked, not what was held
+        self.store.update_game(user_id, bet_amount=result.wagered, round_bet=bet_amount, rounds=result.rounds,
+                               reservation=None)
+        if self.metrics is not None:
+            self.metrics.record_settlements(game, [bet_amount] * result.rounds, result.payouts)
+        
+        stopped = {
+            autobet.STOP_LOSS: f"stop-loss of {rules.stop_loss} credits reached",
+            autobet.TAKE_PROFIT: f"take-profit of {rules.take_profit} credits reached",
+            autobet.ALL_ROUNDS: "all rounds played"
+        }[result.stopped]
+        text = f"""
+{header}
+
+🔁 **Rounds:** {result.rounds} of {rules.rounds} ({stopped})
+💰 **Bet:** {bet_amount} credits per round
+🎯 **Winning Rounds:** {result.wins}
+⭐ **Best Round:** {result.best} credits
+
+💸 **Wagered:** {result.wagered} credits
+🏆 **Winnings:** {result.won} credits
+📊 **Net Result:** {"+" if result.net >= 0 else ""}{result.net} credits
+
+💳 **New Balance:** {new_balance} credits
+        """
+        await self.reply(update, text, reply_markup, parse_mode='Markdown')
 
     # === GENERAL HANDLERS ===
     
-    async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle general button presses"""
+    async def main_menu_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle the main menu button"""
         query = update.callback_query
-        await query.answer()
-        
-        if query.data == "main_menu":
-            await self.show_main_menu(query)
-        elif query.data == "check_balance":
-            await self.show_balance(query)
-        elif query.data == "show_help":
-            await self.show_help(query)
-        elif query.data == "start_keno":
-            await self.start_keno(update, context)
-        elif query.data == "start_crash":
-            await self.start_crash(update, context)
+        await self.show_main_menu(query)
+    
+    async def balance_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle the balance button"""
+        query = update.callback_query
+        await self.show_balance(query)
+    
+    async def help_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle the help button"""
+        query = update.callback_query
+        await self.show_help(query)
+    
+    async def leave_game(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Leave a game for the main menu, giving back its bet"""
+        query = update.callback_query
+        self.release_bet(update.effective_user.id)
+        await self.show_main_menu(query)
+        return ConversationHandler.END
+    
+    async def ignore_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Acknowledge a button that does nothing in the current game step (the router answers it)"""
     
     async def show_main_menu(self, query) -> None:
         """Show main menu"""
-        menu_text = f"""
-🎮 **Casino Games Bot** 🎮
-
-💰 Your balance: **{self.get_balance()} credits**
-
-Choose a game or check your stats:
-        """
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🔢 Play Keno", callback_data="start_keno"),
-                InlineKeyboardButton("🚀 Play Crash", callback_data="start_crash")
-            ],
-            [
-                InlineKeyboardButton("💰 Check Balance", callback_data="check_balance"),
-                InlineKeyboardButton("ℹ️ Help", callback_data="show_help")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(menu_text, reply_markup=reply_markup, parse_mode='Markdown')
+        screen = screens.main_menu_screen(self.get_balance(query.from_user.id))
+        await self.edit_message(query, screen.text, screen.markup)
     
     async def show_balance(self, query) -> None:
         """Show balance via callback"""
-        balance_text = f"💰 **Your Current Balance**\n\n{self.get_balance()} credits"
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🔢 Play Keno", callback_data="start_keno"),
-                InlineKeyboardButton("🚀 Play Crash", callback_data="start_crash")
-            ],
-            [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(balance_text, reply_markup=reply_markup, parse_mode='Markdown')
+        screen = screens.balance_screen(self.get_balance(query.from_user.id))
+        await self.edit_message(query, screen.text, screen.markup)
     
     async def show_help(self, query) -> None:
         """Show help via callback"""
-        help_text = """
-🎮 **Casino Games Bot Help** 🎮
-
-**🔢 Keno Game:**
-• Pick 1-10 numbers from 1-20
-• Bot draws 10 random numbers  
-• Win based on how many of your numbers match
-• Higher matches = bigger payouts!
-
-**🚀 Crash Game:**
-• Set your bet amount
-• Choose your cash-out multiplier
-• Bot generates random crash point
-• Win if you cash out before the crash!
-
-**💰 Payouts:**
-• Keno: 0-1 hits = lose, 2 hits = break even, 3+ hits = profit
-• Crash: Your bet × cashout multiplier
-
-**Commands:**
-• /start - Main menu
-• /balance - Check balance
-• /keno - Start Keno game  
-• /crash - Start Crash game
-• /help - Show this help
-
-Have fun and good luck! 🍀
+        await self.edit_message(query, screens.HELP_SCREEN.text, screens.HELP_SCREEN.markup)
+    
+    async def game_expired(self, update: Update) -> int:
+        """End a conversation whose game session is gone (abandoned, or replaced by another game)"""
+        text = "⌛ This game is no longer active and its bet was returned. Use /start to play again!"
+        if update.callback_query:
+            await self.edit_message(update.callback_query, text, screens.MAIN_MENU_MARKUP)
+        else:
+            await self.reply(update, text)
+        return ConversationHandler.END
+    
+    async def keno_timeout(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Give back the bet of a Keno game left without a move for the session TTL"""
+        await self.game_timeout(update, context, 'keno')
+    
+    async def crash_timeout(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Give back the bet of a Crash game left without a move for the session TTL"""
+        await self.game_timeout(update, context, 'crash')
+    
+    async def game_timeout(self, update: Update, context: ContextTypes.DEFAULT_TYPE, game: str) -> None:
+        """End the session of game once its conversation times out
+
+        A conversation left behind when the user switched games must not
+        end the game they switched to.
         """
-        
-        keyboard = [[InlineKeyboardButton("🏠 Back to Menu", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(help_text, reply_markup=reply_markup, parse_mode='Markdown')
+        if not self.store.end_game(update.effective_user.id, game=game):
+            return
+        text = "⌛ Your game timed out and its bet was returned. Use /start to play again!"
+        if self.outbox is not None:
+            await self.outbox.send_message(update.effective_chat.id, text)
+        else:
+            await context.bot.send_message(update.effective_chat.id, text)
     
     async def cancel_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle conversation cancellation"""
-        await update.message.reply_text("❌ Game cancelled. Use /start to play again!")
+        self.release_bet(update.effective_user.id)
+        await self.reply(update, "❌ Game cancelled. Use /start to play again!")
         return ConversationHandler.END
     
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -744,23 +1016,66 @@ Have fun and good luck! 🍀
         logger.error(f"Exception while handling an update: {context.error}")
 
 
-def main() -> None:
-    """Main function to run the bot"""
-    # Check if bot token is set
-    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
-        print("❌ ERROR: Please set your bot token!")
-        print("Options:")
-        print("1. Set environment variable: export TELEGRAM_BOT_TOKEN='your_token'")
-        print("2. Edit BOT_TOKEN in config.py")
-        print("3. Edit BOT_TOKEN directly in this file")
-        print("\nGet your token from @BotFather on Telegram")
-        return
+def build_application(bot: GameBot, token: str = BOT_TOKEN, request: Optional[BaseRequest] = None,
+                      get_updates_request: Optional[BaseRequest] = None,
+                      persistence: Optional[ConversationPersistence] = None,
+                      concurrent_updates: int = CONCURRENT_UPDATES) -> Application:
+    """Create the application and register all handlers of the bot
+
+    With a persistence the Keno and Crash conversations survive restarts.
+    Up to concurrent_updates updates of different users are handled at
+    once; each user's updates always run in order. Without request and
+    get_updates_request the Bot API pools are built from the configuration.
+    """
+    builder = Application.builder().token(token)
+    if concurrent_updates > 1:
+        builder = builder.application_class(UserOrderedApplication, {'max_concurrent': concurrent_updates})
+        builder = builder.concurrent_updates(MAX_PENDING_UPDATES)
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    if bot.keno_draws is not None:
+        async def post_init(application: Application) -> None:
+            bot.keno_draws.schedule(application)
+        
+        builder = builder.post_init(post_init)
+    if bot.outbox is not None or bot.crash_rounds is not None or bot.keno_draws is not None:
+        async def post_stop(application: Application) -> None:
+            # Refund unfinished rounds and draws, then send the queued edits
+            # before the bot's connection is closed
+            if bot.crash_rounds is not None:
+                await bot.crash_rounds.close()
+            if bot.keno_draws is not None:
+                await bot.keno_draws.close()
+            if bot.outbox is not None:
+                await bot.outbox.close()
+        
+        builder = builder.post_stop(post_stop)
+    if request is None:
+        request = build_request(bot.metrics)
+    if get_updates_request is None:
+        get_updates_request = build_request(bot.metrics, get_updates=True)
+    builder = builder.request(request).get_updates_request(get_updates_request)
+    application = builder.build()
+    if bot.outbox is not None:
+        bot.outbox.bot = application.bot
+    if bot.crash_rounds is not None:
+        bot.crash_rounds.bot = application.bot
+    if bot.keno_draws is not None:
+        bot.keno_draws.bot = application.bot
     
-    # Create bot instance
-    bot = GameBot()
+    # Games left without a move end after the session TTL, giving back their
+    # bet (timeouts run on the JobQueue; without it the store still expires them)
+    session_ttl = bot.store.session_ttl if application.job_queue is not None else None
+    if session_ttl is not None:
+        async def sweep_users(context: ContextTypes.DEFAULT_TYPE) -> None:
+            bot.store.sweep()
+        
+        application.job_queue.run_repeating(sweep_users, interval=session_ttl / 4)
     
-    # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Returning users are read from the wallet in a thread before the game
+    # handlers look them up (group -2 runs ahead of the metrics' group -1)
+    if bot.store.ledger is not None:
+        application.add_handler(TypeHandler(Update, bot.load_user), group=-2)
     
     # Add command handlers
     application.add_handler(CommandHandler("start", bot.start_command))
@@ -771,71 +1086,241 @@ def main() -> None:
     keno_handler = ConversationHandler(
         entry_points=[
             CommandHandler("keno", bot.start_keno),
-            CallbackQueryHandler(bot.start_keno, pattern="^start_keno$")
+            CallbackRouter({callbacks.START_KENO: bot.start_keno})
         ],
         states={
             KENO_SET_BET: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.keno_set_bet)],
-            KENO_PICK_NUMBERS: [CallbackQueryHandler(bot.keno_number_selection)]
+            KENO_PICK_NUMBERS: [CallbackRouter({
+                callbacks.KENO_SELECT: bot.keno_select_number,
+                callbacks.KENO_CLEAR: bot.keno_clear,
+                callbacks.KENO_PLAY: bot.keno_play,
+                callbacks.MAIN_MENU: bot.leave_game
+            }, default=bot.ignore_button)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, bot.keno_timeout)]
         },
-        fallbacks=[CommandHandler("cancel", bot.cancel_handler)]
+        # A quick bet also replaces a game in progress
+        fallbacks=[CommandHandler("cancel", bot.cancel_handler),
+                   CommandHandler("keno", bot.quick_keno, filters.Regex(quick_bets.COMMAND_WITH_ARGS))],
+        conversation_timeout=session_ttl,
+        name='keno',
+        persistent=persistence is not None
     )
     
     # Crash conversation handler
     crash_handler = ConversationHandler(
         entry_points=[
             CommandHandler("crash", bot.start_crash),
-            CallbackQueryHandler(bot.start_crash, pattern="^start_crash$")
+            CallbackRouter({callbacks.START_CRASH: bot.start_crash})
         ],
         states={
             CRASH_SET_BET: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.crash_set_bet)],
-            CRASH_CASHOUT: [CallbackQueryHandler(bot.crash_multiplier_selection)]
+            CRASH_CASHOUT: [CallbackRouter({
+                callbacks.CRASH_TARGET: bot.crash_select_target,
+                callbacks.CRASH_PLAY: bot.crash_launch,
+                callbacks.MAIN_MENU: bot.leave_game
+            }, default=bot.ignore_button)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, bot.crash_timeout)]
         },
-        fallbacks=[CommandHandler("cancel", bot.cancel_handler)]
+        # A quick bet also replaces a game in progress
+        fallbacks=[CommandHandler("cancel", bot.cancel_handler),
+                   CommandHandler("crash", bot.quick_crash, filters.Regex(quick_bets.COMMAND_WITH_ARGS))],
+        conversation_timeout=session_ttl,
+        name='crash',
+        persistent=persistence is not None
     )
     
     # Add conversation handlers
     application.add_handler(keno_handler)
     application.add_handler(crash_handler)
     
+    # Autobets replace any game in progress
+    application.add_handler(CommandHandler("autokeno", bot.autokeno_command))
+    application.add_handler(CommandHandler("autocrash", bot.autocrash_command))
+    
     # Add general callback handler (must be after conversation handlers)
-    application.add_handler(CallbackQueryHandler(bot.button_handler))
+    application.add_handler(CallbackRouter({
+        callbacks.MAIN_MENU: bot.main_menu_button,
+        callbacks.CHECK_BALANCE: bot.balance_button,
+        callbacks.SHOW_HELP: bot.help_button,
+        callbacks.START_KENO: bot.start_keno,
+        callbacks.START_CRASH: bot.start_crash
+    }, default=bot.ignore_button))
     
     # Add error handler
     application.add_error_handler(bot.error_handler)
     
+    # Instrument every handler registered above (skipped entirely when metrics are off)
+    if bot.metrics is not None:
+        bot.metrics.track_conversation('keno', keno_handler, KENO_STATE_NAMES)
+        bot.metrics.track_conversation('crash', crash_handler, CRASH_STATE_NAMES)
+        bot.metrics.track_user_store(bot.store)
+        if bot.store.ledger is not None:
+            bot.metrics.track_ledger(bot.store.ledger)
+        pools = [pool for pool in (request, get_updates_request) if isinstance(pool, PooledRequest)]
+        if pools:
+            bot.metrics.track_transport(*pools)
+        if bot.outbox is not None:
+            bot.metrics.track_outbox(bot.outbox)
+        if bot.fingerprints is not None:
+            bot.metrics.track_fingerprints(bot.fingerprints)
+        if bot.crash_rounds is not None:
+            bot.metrics.track_crash_rounds(bot.crash_rounds)
+        if bot.keno_draws is not None:
+            bot.metrics.track_keno_draws(bot.keno_draws)
+        bot.metrics.instrument_application(application)
+    
+    return application
+
+
+def build_bot(metrics: Optional[Metrics] = None, outbox_global_rate: float = OUTBOX_GLOBAL_RATE,
+              outbox_chat_rate: float = OUTBOX_CHAT_RATE, ledger_path: str = LEDGER_PATH,
+              ledger_owner: str = '', crash_betting_window: float = CRASH_BETTING_WINDOW,
+              crash_growth_rate: float = CRASH_GROWTH_RATE) -> GameBot:
+    """Create the bot from the configuration, with a persistent wallet
+
+    Processes sharing the wallet need a ledger_owner each, so they never
+    delete each other's game sessions.
+    """
+    ledger = WalletLedger(ledger_path, LEDGER_FLUSH_INTERVAL_MS, owner=ledger_owner)
+    outbox = EditScheduler(
+        chat_rate=outbox_chat_rate,
+        chat_burst=OUTBOX_CHAT_BURST,
+        global_rate=outbox_global_rate,
+        window=OUTBOX_COALESCE_WINDOW_MS / 1000
+    ) if OUTBOX_ENABLED else None
+    crash_rounds = CrashRoundScheduler(
+        betting_window=crash_betting_window,
+        tick_interval=CRASH_TICK_INTERVAL,
+        growth_rate=crash_growth_rate,
+        edit_interval=CRASH_EDIT_INTERVAL,
+        edits_per_tick=CRASH_EDITS_PER_TICK
+    ) if CRASH_SHARED_ROUNDS else None
+    keno_draws = KenoDrawScheduler(
+        KENO_PAYOUTS,
+        total_numbers=KENO_TOTAL_NUMBERS,
+        drawn_numbers=KENO_DRAWN_NUMBERS,
+        interval=KENO_DRAW_INTERVAL
+    ) if KENO_SCHEDULED_DRAWS else None
+    # Game sessions are saved with the wallet when games survive restarts, and
+    # idle users are dropped from memory and read back from the wallet
+    store = UserStateStore(STARTING_BALANCE, USER_STORE_SHARDS, ledger=ledger, sessions=STATE_PERSISTENCE,
+                           session_ttl=SESSION_TTL, memory_budget=USER_STORE_MEMORY_MB * 2 ** 20)
+    return GameBot(store=store, metrics=metrics, outbox=outbox, crash_rounds=crash_rounds, keno_draws=keno_draws)
+
+
+def build_request(metrics: Optional[Metrics] = None, get_updates: bool = False) -> PooledRequest:
+    """Create the HTTP connection pool for Bot API calls (or for long polling) from the configuration"""
+    return PooledRequest(
+        pool='get_updates' if get_updates else 'api',
+        connection_pool_size=GET_UPDATES_POOL_SIZE if get_updates else API_POOL_SIZE,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY,
+        http_version=API_HTTP_VERSION,
+        read_timeout=API_READ_TIMEOUT,
+        write_timeout=API_WRITE_TIMEOUT,
+        connect_timeout=API_CONNECT_TIMEOUT,
+        pool_timeout=API_POOL_TIMEOUT,
+        metrics=metrics
+    )
+
+
+def build_front_bot(token: str = BOT_TOKEN) -> Bot:
+    """Create the bot the front process of the workers receives updates with, on the configured pools"""
+    return Bot(token, request=build_request(), get_updates_request=build_request(get_updates=True))
+
+
+def build_persistence(directory: str = STATE_DIR) -> Optional[ConversationPersistence]:
+    """Create the conversation persistence from the configuration (None when disabled)"""
+    if not STATE_PERSISTENCE:
+        return None
+    return ConversationPersistence(directory, update_interval=STATE_UPDATE_INTERVAL)
+
+
+def build_worker(worker: int) -> Application:
+    """Create the application of one worker process (see cluster.py)"""
+    # The workers split Telegram's global flood limit between them
+    bot = build_bot(outbox_global_rate=OUTBOX_GLOBAL_RATE / WORKER_PROCESSES, ledger_owner=f'worker-{worker}')
+    # Each worker keeps the conversations of its own users
+    application = build_application(bot, persistence=build_persistence(os.path.join(STATE_DIR, f'worker-{worker}')))
+    
+    async def close_ledger(application: Application) -> None:
+        bot.store.ledger.close()
+    
+    application.post_shutdown = close_ledger
+    return application
+
+
+def main() -> None:
+    """Main function to run the bot"""
+    # Check if bot token is set
+    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
+        print("❌ ERROR: Please set your bot token!")
+        print("Options:")
+        print("1. Set environment variable: export TELEGRAM_BOT_TOKEN='your_token'")
+        print("2. Edit BOT_TOKEN in config.py")
+        print("3. Edit BOT_TOKEN directly in this file")
+        print("\nGet your token from @BotFather on Telegram")
+        return
+    
+    # Validate settings, including the exact RTP of the Keno payout table
+    try:
+        from config import validate_config
+    except ImportError:
+        validate_config = None
+    if validate_config:
+        try:
+            validate_config()
+        except ValueError as e:
+            print(f"❌ Configuration Error: {e}")
+            return
+    
+    # Render sets PORT; the same event loop then serves health checks and
+    # metrics, and webhook updates too when WEBHOOK_URL is set (long polling otherwise)
+    port = int(os.getenv('PORT')) if os.getenv('PORT') else None
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    
+    # With several worker processes this process only hands out the updates
+    if WORKER_PROCESSES > 1:
+        pool = WorkerPool(build_worker, WORKER_PROCESSES, handoff_idle=WORKER_HANDOFF_IDLE)
+        print(f"🚀 Starting Telegram Games Bot with {WORKER_PROCESSES} worker processes...")
+        print("Press Ctrl+C to stop the bot")
+        try:
+            asyncio.run(run_front(
+                pool,
+                build_front_bot(),
+                port=port,
+                webhook_url=WEBHOOK_URL,
+                webhook_path=WEBHOOK_PATH,
+                secret_token=secret_token
+            ))
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    # Metrics are only collected when they can be scraped
+    metrics = Metrics() if METRICS_ENABLED and port else None
+    
+    # Create bot instance with a persistent wallet
+    bot = build_bot(metrics)
+    application = build_application(bot, persistence=build_persistence())
+    
     # Start the bot
     print("🚀 Starting Telegram Games Bot...")
     print("Press Ctrl+C to stop the bot")
     
-    # Check if running on Render (has PORT environment variable)
-    import os
-    if os.getenv('PORT'):
-        # Running on Render - start HTTP server for health checks
-        port = int(os.getenv('PORT', 8080))
-        import threading
-        from http.server import HTTPServer, BaseHTTPRequestHandler
-        
-        class HealthHandler(BaseHTTPRequestHandler):
-            def do_GET(self):
-                self.send_response(200)
-                self.send_header('Content-type', 'text/plain')
-                self.end_headers()
-                self.wfile.write(b'Telegram Bot is running!')
-                
-            def log_message(self, format, *args):
-                pass  # Suppress HTTP server logs
-        
-        # Start HTTP server in background thread
-        def run_server():
-            server = HTTPServer(('0.0.0.0', port), HealthHandler)
-            print(f"🌐 HTTP server running on port {port} for Render")
-            server.serve_forever()
-        
-        server_thread = threading.Thread(target=run_server, daemon=True)
-        server_thread.start()
-    
     # Run the bot until the user presses Ctrl-C
-    application.run_polling()
+    try:
+        asyncio.run(run_application(
+            application,
+            port=port,
+            webhook_url=WEBHOOK_URL,
+            webhook_path=WEBHOOK_PATH,
+            secret_token=secret_token,
+            metrics=metrics
+        ))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bot.store.ledger.close()
 
 
 if __name__ == '__main__':
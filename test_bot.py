@@ -80,13 +80,15 @@ def test_game_logic():
         # Create bot instance
         bot = GameBot()
         
+        user_id = 12345
+        
         # Test balance operations
-        initial_balance = bot.get_balance()
+        initial_balance = bot.get_balance(user_id)
         print(f"✅ Initial balance: {initial_balance} credits")
         
         # Test balance update
-        bot.update_balance(100)
-        new_balance = bot.get_balance()
+        bot.update_balance(user_id, 100)
+        new_balance = bot.get_balance(user_id)
         if new_balance == initial_balance + 100:
             print("✅ Balance update works correctly")
         else:
@@ -94,15 +96,15 @@ def test_game_logic():
             return False
         
         # Test negative balance protection
-        bot.update_balance(-10000)  # Try to go negative
-        if bot.get_balance() >= 0:
+        bot.update_balance(user_id, -10000)  # Try to go negative
+        if bot.get_balance(user_id) >= 0:
             print("✅ Negative balance protection works")
         else:
             print("❌ Negative balance protection failed")
             return False
         
         # Test crash multiplier generation
-        bot.update_balance(1000)  # Reset balance
+        bot.update_balance(user_id, 1000)  # Reset balance
         multiplier = bot.generate_crash_multiplier()
         if 1.0 <= multiplier <= 50.0:
             print(f"✅ Crash multiplier generation works: {multiplier:.2f}x")
@@ -116,6 +118,1547 @@ def test_game_logic():
         print(f"❌ Game logic test failed: {e}")
         return False
 
+def test_user_store():
+    """Test per-user balance and session isolation"""
+    print("\n👥 Testing per-user state store...")
+    
+    try:
+        import threading
+        from user_store import UserStateStore
+        
+        store = UserStateStore(starting_balance=1000, num_shards=8)
+        
+        # Users must not share wallets or game sessions
+        store.update_balance(1, -300)
+        store.start_game(1, game='keno', bet_amount=50)
+        store.start_game(2, game='crash', bet_amount=20)
+        if store.get_balance(1) != 700 or store.get_balance(2) != 1000:
+            print("❌ Balances leaked between users")
+            return False
+        if store.get_game(1)['game'] != 'keno' or store.get_game(2)['game'] != 'crash':
+            print("❌ Game sessions leaked between users")
+            return False
+        print("✅ Users have separate balances and sessions")
+        
+        # Concurrent updates on many users must not lose writes
+        def worker(first_user):
+            for _ in range(1000):
+                for user_id in range(first_user, first_user + 16):
+                    store.update_balance(user_id, 1)
+        
+        threads = [threading.Thread(target=worker, args=(100 + i * 16,)) for i in range(4)]
+        threads += [threading.Thread(target=worker, args=(100,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if store.get_balance(100) != 1000 + 5000 or store.get_balance(150) != 2000:
+            print("❌ Concurrent balance updates were lost")
+            return False
+        print("✅ Concurrent balance updates are consistent")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ User store test failed: {e}")
+        return False
+
+def test_wallet_ledger():
+    """Test that balances survive a restart through the wallet ledger"""
+    print("\n💾 Testing wallet ledger...")
+    
+    try:
+        import asyncio
+        import logging
+        import sqlite3
+        import tempfile
+        from user_store import UserStateStore
+        from wallet import WalletLedger
+        logging.getLogger('wallet').setLevel(logging.CRITICAL)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'wallet.db')
+            
+            ledger = WalletLedger(path, flush_interval_ms=200)
+            store = UserStateStore(starting_balance=1000, ledger=ledger)
+            store.update_balance(1, -50, 'keno_bet')
+            store.update_balance(1, 150, 'keno_payout')
+            store.update_balance(2, -20, 'crash_bet')
+            ledger.close()
+            
+            if ledger.commits > 1 or ledger.entries_written != 3:
+                print(f"❌ Expected one group commit of 3 entries, got {ledger.commits} commits")
+                return False
+            print("✅ Entries were group-committed")
+            
+            # Simulate a restart
+            ledger = WalletLedger(path, flush_interval_ms=5)
+            store = UserStateStore(starting_balance=1000, ledger=ledger)
+            balances = (store.get_balance(1), store.get_balance(2), store.get_balance(3))
+            ledger.close()
+            
+            if balances != (1100, 980, 1000):
+                print(f"❌ Balances not restored: {balances}")
+                return False
+            print("✅ Balances restored after restart")
+            
+            # A failing commit is rolled back and retried, never dropped
+            ledger = WalletLedger(path, flush_interval_ms=1, retry_interval=0.02)
+            store = UserStateStore(starting_balance=1000, ledger=ledger)
+            other = sqlite3.connect(path, isolation_level=None)
+            other.execute("ALTER TABLE entries RENAME TO entries_moved")
+            store.update_balance(1, 50, 'adjust')
+            failed = not ledger.flush(timeout=2)
+            other.execute("ALTER TABLE entries_moved RENAME TO entries")
+            other.close()
+            recovered = ledger.flush(timeout=2)
+            balance = ledger.load_balance(1)
+            ledger.close()
+            
+            if not failed or not ledger.write_errors or not recovered or balance != 1150:
+                print(f"❌ Failed commit not retried: {ledger.write_errors} errors, balance {balance}")
+                return False
+            print(f"✅ Failed commit retried after {ledger.write_errors} errors")
+            
+            # Returning users are read on a connection of their own, so a
+            # group commit in progress does not hold them up
+            ledger = WalletLedger(path, flush_interval_ms=5)
+            store = UserStateStore(starting_balance=1000, ledger=ledger)
+            with ledger._lock:
+                asyncio.run(asyncio.wait_for(store.load(1), 2))
+            balance, misses = store.get_balance(1), store.stats()['misses']
+            ledger.close()
+            
+            if balance != 1150 or misses != 1:
+                print(f"❌ User not loaded beside the writer: balance {balance}, {misses} misses")
+                return False
+            print("✅ Returning user read while a commit held the writer")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Wallet ledger test failed: {e}")
+        return False
+
+def test_bet_reservations():
+    """Stress test bet reservations under concurrent taps"""
+    print("\n🔒 Testing bet reservations...")
+    
+    try:
+        import random
+        import threading
+        from user_store import UserStateStore
+        
+        store = UserStateStore(starting_balance=1000, num_shards=4)
+        user_id = 42
+        
+        # A reservation can only be settled once
+        reservation = store.reserve(user_id, 100)
+        first = store.settle(user_id, reservation, 300, 'keno')
+        second = store.settle(user_id, reservation, 300, 'keno')
+        if first != 1200 or second is not None:
+            print(f"❌ Double settlement was not rejected: {first}, {second}")
+            return False
+        print("✅ Repeated settlement is rejected")
+        
+        # Funds held by one bet cannot back another
+        if store.reserve(user_id, 1000) is None or store.reserve(user_id, 201) is not None:
+            print("❌ Held funds were spent twice")
+            return False
+        print("✅ Held funds cannot be reserved twice")
+        
+        # Many threads tapping PLAY on the same reservations
+        store = UserStateStore(starting_balance=10_000, num_shards=4)
+        expected = {'net': 0}
+        expected_lock = threading.Lock()
+        errors = []
+        
+        def player(seed):
+            rng = random.Random(seed)
+            for _ in range(2000):
+                bet = rng.randint(10, 500)
+                reservation = store.reserve(user_id, bet)
+                if reservation is None:
+                    continue
+                if store.get_available_balance(user_id) < 0:
+                    errors.append("available balance went negative")
+                payout = rng.choice((0, bet, bet * 2))
+                if rng.random() < 0.1:
+                    store.release(user_id, reservation)
+                    continue
+                settled = [store.settle(user_id, reservation, payout, 'keno') for _ in range(2)]
+                if settled[1] is not None:
+                    errors.append("reservation settled twice")
+                if settled[0] is not None:
+                    with expected_lock:
+                        expected['net'] += payout - bet
+        
+        threads = [threading.Thread(target=player, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        balance = store.get_balance(user_id)
+        if errors or balance != 10_000 + expected['net'] or store.get_available_balance(user_id) != balance:
+            print(f"❌ Balance went wrong under concurrency: {balance} ({errors[:1]})")
+            return False
+        print(f"✅ Balance is exact after concurrent settlements: {balance} credits")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Bet reservation test failed: {e}")
+        return False
+
+def test_keno_engine():
+    """Test bitmask Keno matching against the list-based rules"""
+    print("\n🔢 Testing Keno engine...")
+    
+    try:
+        import random
+        import keno
+        from config import KENO_PAYOUTS
+        
+        rng = random.Random(7)
+        for _ in range(1000):
+            picks = rng.sample(range(1, 21), rng.randint(1, 10))
+            draw = rng.sample(range(1, 21), 10)
+            expected = len([num for num in picks if num in draw])
+            if keno.count_matches(keno.numbers_to_mask(picks), keno.numbers_to_mask(draw)) != expected:
+                print(f"❌ Wrong match count for {picks} vs {draw}")
+                return False
+            if keno.mask_to_numbers(keno.numbers_to_mask(picks)) != sorted(picks):
+                print(f"❌ Mask round trip failed for {picks}")
+                return False
+        print("✅ Bitmask match counting agrees with list scans")
+        
+        mask = keno.toggle_number(keno.toggle_number(0, 7), 12)
+        if keno.toggle_number(mask, 7) != keno.numbers_to_mask([12]):
+            print("❌ Toggling numbers failed")
+            return False
+        print("✅ Number toggles work")
+        
+        if keno.np is None:
+            print("⚠️ NumPy not installed, skipping batch settlement")
+            return True
+        
+        np = keno.np
+        generator = np.random.default_rng(7)
+        draws = keno.draw_masks(10_000, rng=generator)
+        if set(keno.popcount_batch(draws).tolist()) != {10} or int(draws.max()) >= 1 << 20:
+            print("❌ Batch draws are not 10 distinct numbers from 1-20")
+            return False
+        
+        picks = np.array([keno.numbers_to_mask(rng.sample(range(1, 21), rng.randint(1, 10))) for _ in range(10_000)])
+        bets = generator.integers(10, 500, size=10_000)
+        winnings = keno.settle_batch(picks, draws, bets, KENO_PAYOUTS)
+        for i in range(0, 10_000, 97):
+            matches = keno.count_matches(int(picks[i]), int(draws[i]))
+            if winnings[i] != keno.payout(int(bets[i]), matches, KENO_PAYOUTS):
+                print(f"❌ Batch settlement differs from single round {i}")
+                return False
+        print("✅ Batch settlement matches single-round payouts")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Keno engine test failed: {e}")
+        return False
+
+def test_simulator():
+    """Test the crash engine and the Monte Carlo simulator"""
+    print("\n🎰 Testing RTP simulator...")
+    
+    try:
+        import random
+        import crash
+        
+        rng = random.Random(3)
+        for _ in range(1000):
+            point = crash.generate_crash_multiplier(rng)
+            if not 1.0 <= point <= 50.0:
+                print(f"❌ Crash point out of range: {point}")
+                return False
+        if crash.payout(100, 2.5, 3.0) != 250 or crash.payout(100, 2.5, 2.0) != 0:
+            print("❌ Crash payout rules are wrong")
+            return False
+        print("✅ Crash engine works")
+        
+        if crash.np is None:
+            print("⚠️ NumPy not installed, skipping simulator")
+            return True
+        
+        import simulate
+        
+        np = crash.np
+        points = crash.crash_multipliers(200_000, np.random.default_rng(3))
+        low_share = float((points < 2.0).mean())
+        if not 0.32 < low_share < 0.34 or points.min() < 1.0 or points.max() > 50.0:
+            print(f"❌ Batch crash points have the wrong distribution ({low_share:.3f} below 2x)")
+            return False
+        print("✅ Batch crash points follow the bucket weights")
+        
+        # With 2 picks the exact RTP is P(both drawn) = C(10,2) / C(20,2) = 45 / 190
+        results = simulate.simulate('keno', [1, 2], 400_000, workers=1, seed=3)
+        low, high = results[2].confidence_interval()
+        if results[1].rtp != 0 or not low <= 45 / 190 <= high:
+            print(f"❌ Simulated Keno RTP is off: {results[2].rtp:.4f}")
+            return False
+        print(f"✅ Simulated 2-pick Keno RTP {results[2].rtp:.2%} matches the exact 23.68%")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Simulator test failed: {e}")
+        return False
+
+def test_keno_odds():
+    """Test exact Keno odds and payout table validation"""
+    print("\n📈 Testing Keno odds...")
+    
+    try:
+        from fractions import Fraction
+        import keno_odds
+        
+        table = keno_odds.odds_table(20, 10, 10)
+        if any(sum(probabilities) != 1 for probabilities in table.values()):
+            print("❌ Match probabilities do not sum to 1")
+            return False
+        if table[2][2] != Fraction(45, 190):
+            print(f"❌ Wrong odds for 2 of 2 matches: {table[2][2]}")
+            return False
+        print("✅ Hypergeometric odds are exact")
+        
+        payouts = {2: 3}
+        if keno_odds.rtp(2, payouts) != Fraction(3 * 45, 190):
+            print("❌ Wrong exact RTP")
+            return False
+        print(f"✅ Exact RTP for 2 picks paying 3x: {float(keno_odds.rtp(2, payouts)):.2%}")
+        
+        try:
+            keno_odds.check_payouts({2: 5}, target_rtp=0.97, max_picks=2)
+            print("❌ Over-paying table was accepted")
+            return False
+        except ValueError:
+            pass
+        keno_odds.check_payouts({2: 4}, target_rtp=0.97, max_picks=2)
+        print("✅ Payout tables above the target RTP are rejected")
+        
+        text = keno_odds.payout_table_text({1: 1, 2: 3}, max_picks=2)
+        if "• 1 match: Break even (1x)" not in text or "1 matches" in text:
+            print(f"❌ Payout table labels are wrong:\n{text}")
+            return False
+        print("✅ Payout table labels a single match in the singular")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Keno odds test failed: {e}")
+        return False
+
+def test_crash_distributions():
+    """Test inverse-CDF crash distributions"""
+    print("\n📉 Testing crash distributions...")
+    
+    try:
+        import random
+        import crash
+        
+        house = crash.make_distribution('house_edge', house_edge=0.01)
+        piecewise = crash.make_distribution('piecewise')
+        
+        # Every target returns exactly 1 - edge under the house_edge family
+        for target in crash.CASHOUT_TARGETS:
+            if abs(house.rtp(target) - 0.99) > 1e-12:
+                print(f"❌ House edge RTP at {target}x is {house.rtp(target)}")
+                return False
+        if house.inverse_cdf(0.0) != 1.0 or house.inverse_cdf(0.5) != 1.98:
+            print("❌ House edge inverse CDF is wrong")
+            return False
+        print("✅ House edge distribution returns exactly 99% at every target")
+        
+        rng = random.Random(5)
+        points = [piecewise.sample(rng) for _ in range(50_000)]
+        low_share = sum(point < 2.0 for point in points) / len(points)
+        if not 0.32 < low_share < 0.34 or min(points) < 1.0 or max(points) > 50.0:
+            print(f"❌ Piecewise distribution is off ({low_share:.3f} below 2x)")
+            return False
+        print("✅ Piecewise distribution keeps the bucket weights")
+        
+        if crash.np is None:
+            print("⚠️ NumPy not installed, skipping batch sampling")
+            return True
+        
+        np = crash.np
+        uniforms = np.random.default_rng(5).random(10_000)
+        for distribution in (house, piecewise):
+            batch = distribution.inverse_cdf_batch(uniforms)
+            if any(batch[i] != distribution.inverse_cdf(float(uniforms[i])) for i in range(0, 10_000, 7)):
+                print(f"❌ Batch and scalar {distribution.name} samples differ")
+                return False
+        print("✅ Batch sampling matches scalar sampling")
+        
+        buffer = crash.CrashPointBuffer(house, batch_size=16)
+        if not all(house.inverse_cdf(0.0) <= buffer.next() for _ in range(40)):
+            print("❌ Crash point buffer returned invalid points")
+            return False
+        print("✅ Pre-drawn crash point buffer works")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Crash distribution test failed: {e}")
+        return False
+
+def test_webhook_server():
+    """Test webhook ingestion and health checks on one asyncio server"""
+    print("\n🌐 Testing webhook server...")
+    
+    try:
+        import asyncio
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, message_update, post_updates
+        from telegram_games_bot import GameBot, build_application
+        from webserver import BotHTTPServer, HEALTH_TEXT, MAX_BODY_SIZE, health_check, webhook_route
+        
+        async def scenario():
+            api = FakeBotAPI()
+            application = build_application(GameBot(), token=FAKE_TOKEN, request=api, get_updates_request=api)
+            server = BotHTTPServer('127.0.0.1', 0)
+            server.add_route('GET', '/health', health_check)
+            server.add_route('POST', '/telegram', webhook_route(application, 'secret'))
+            await application.initialize()
+            await application.start()
+            await server.start()
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+                writer.write(b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                health = await reader.read()
+                writer.close()
+                
+                malformed = []
+                for length in (b"-5", b"ten", str(MAX_BODY_SIZE + 1).encode()):
+                    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+                    writer.write(b"POST /telegram HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+                    malformed.append((await reader.read())[:12])
+                    writer.close()
+                
+                rejected = await post_updates(server.port, '/telegram', [message_update(1, 7, "/balance")], 'wrong')
+                accepted = await post_updates(server.port, '/telegram',
+                                              [message_update(i, 7, "/balance") for i in range(2, 12)], 'secret')
+                await api.wait_for_calls('sendMessage', 10, timeout=10)
+                return health, malformed, rejected, accepted, api.calls['sendMessage']
+            finally:
+                await server.stop()
+                await application.stop()
+                await application.shutdown()
+        
+        health, malformed, rejected, accepted, replies = asyncio.run(scenario())
+        
+        if not health.startswith(b"HTTP/1.1 200") or not health.endswith(HEALTH_TEXT):
+            print("❌ Health check failed")
+            return False
+        print("✅ Health check answered")
+        
+        if malformed != [b"HTTP/1.1 400", b"HTTP/1.1 400", b"HTTP/1.1 413"]:
+            print(f"❌ Malformed or oversized bodies got {malformed}")
+            return False
+        print("✅ Malformed and oversized Content-Length rejected")
+        
+        if rejected != [403]:
+            print(f"❌ Wrong secret token got {rejected}")
+            return False
+        print("✅ Wrong secret token rejected")
+        
+        if accepted != [200] * 10 or replies != 10:
+            print(f"❌ Webhook updates not processed ({accepted}, {replies} replies)")
+            return False
+        print("✅ Webhook updates acknowledged and processed")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Webhook server test failed: {e}")
+        return False
+
+def test_metrics():
+    """Test handler instrumentation and the metrics exposition"""
+    print("\n📈 Testing metrics...")
+    
+    try:
+        import asyncio
+        from telegram import Update
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+        from metrics import Metrics, parse_samples
+        from telegram_games_bot import GameBot, build_application
+        
+        async def scenario():
+            metrics = Metrics()
+            api = FakeBotAPI()
+            application = build_application(GameBot(metrics=metrics), token=FAKE_TOKEN, request=api)
+            await application.initialize()
+            snapshots = []
+            updates = [
+                message_update(1, 7, "/keno"),
+                message_update(2, 7, "50"),
+                callback_update(3, 7, "keno_select_4"),
+                callback_update(4, 7, "keno_play"),
+            ]
+            for data in updates:
+                await application.process_update(Update.de_json(data, application.bot))
+                snapshots.append(parse_samples(metrics.render()))
+            await application.shutdown()
+            return snapshots
+        
+        snapshots = asyncio.run(scenario())
+        picking, final = snapshots[2], snapshots[3]
+        
+        if (final['telegram_games_updates_total{type="message"}'] != 2
+                or final['telegram_games_updates_total{type="callback_query"}'] != 2):
+            print("❌ Updates were not counted by type")
+            return False
+        print("✅ Updates counted by type")
+        
+        for handler in ('start_keno', 'keno_set_bet', 'keno_select_number', 'keno_play'):
+            if final.get(f'telegram_games_handler_duration_seconds_count{{handler="{handler}"}}', 0) < 1:
+                print(f"❌ No latency recorded for {handler}")
+                return False
+        print("✅ Handler latency histograms recorded")
+        
+        if (picking['telegram_games_conversations{conversation="keno",state="pick_numbers"}'] != 1
+                or final['telegram_games_conversations{conversation="keno",state="pick_numbers"}'] != 0):
+            print("❌ Conversation state gauge is wrong")
+            return False
+        print("✅ Conversation state gauge follows the game")
+        
+        settled = sum(value for name, value in final.items() if name.startswith('telegram_games_settlements_total'))
+        if settled != 1 or final['telegram_games_wagered_credits_total{game="keno"}'] != 50:
+            print("❌ Settlement counters are wrong")
+            return False
+        print("✅ Settlement counters updated")
+        
+        # Bets of a shared round that had already gone back are refunds, not settlements
+        metrics = Metrics()
+        metrics.record_settlements('crash', [10, 20, 30], [0, 40, 0], [990, None, 970])
+        samples = parse_samples(metrics.render())
+        if (samples.get('telegram_games_settlements_total{game="crash",outcome="refund"}') != 1
+                or samples.get('telegram_games_settlements_total{game="crash",outcome="win"}') is not None
+                or samples['telegram_games_wagered_credits_total{game="crash"}'] != 40):
+            print("❌ Refunded bets counted as settled")
+            return False
+        print("✅ Refunded bets of a round counted apart")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Metrics test failed: {e}")
+        return False
+
+def test_outbox():
+    """Test edit coalescing, pacing and 429 handling in the outbox"""
+    print("\n📤 Testing outbound edit queue...")
+    
+    try:
+        import asyncio
+        import time
+        from telegram.error import RetryAfter
+        from outbox import EditScheduler
+        
+        class RecordingBot:
+            def __init__(self):
+                self.edits = []
+                self.flood_errors = 0
+            
+            async def edit_message_text(self, **kwargs):
+                if self.flood_errors:
+                    self.flood_errors -= 1
+                    raise RetryAfter(1)
+                self.edits.append((time.monotonic(), kwargs))
+        
+        async def scenario():
+            results = {}
+            
+            # Five taps on one message: only the last screen is sent
+            bot = RecordingBot()
+            outbox = EditScheduler(bot, window=0.05)
+            for number in range(1, 6):
+                outbox.edit_message_text(1, 10, f"Selected {number}")
+            await outbox.flush(timeout=5)
+            results['coalesced'] = ([kwargs['text'] for _, kwargs in bot.edits], outbox.coalesced)
+            
+            # One chat with a burst of 1 at 10 edits/s: edits are spaced out
+            bot = RecordingBot()
+            outbox = EditScheduler(bot, chat_rate=10.0, chat_burst=1, window=0)
+            for message_id in range(3):
+                outbox.edit_message_text(2, message_id, "screen")
+            await outbox.flush(timeout=5)
+            times = [sent for sent, _ in bot.edits]
+            results['paced'] = min(later - earlier for earlier, later in zip(times, times[1:]))
+            
+            # A 429 pauses the chat and the edit is sent again
+            bot = RecordingBot()
+            bot.flood_errors = 1
+            outbox = EditScheduler(bot, window=0)
+            start = time.monotonic()
+            outbox.edit_message_text(3, 1, "result")
+            await outbox.flush(timeout=5)
+            results['retried'] = (len(bot.edits), outbox.rate_limited, outbox.calls, time.monotonic() - start)
+            await outbox.close()
+            return results
+        
+        results = asyncio.run(scenario())
+        
+        if results['coalesced'] != (["Selected 5"], 4):
+            print(f"❌ Edits were not coalesced: {results['coalesced']}")
+            return False
+        print("✅ Queued edits of one message are coalesced")
+        
+        if results['paced'] < 0.09:
+            print(f"❌ Edits were not paced ({results['paced']:.3f}s apart)")
+            return False
+        print("✅ Per-chat token bucket paces edits")
+        
+        sent, rate_limited, calls, elapsed = results['retried']
+        if (sent, rate_limited, calls) != (1, 1, 2) or elapsed < 0.9:
+            print(f"❌ 429 was not retried after the pause: {results['retried']}")
+            return False
+        print("✅ RetryAfter pauses the chat and resends the edit")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Outbox test failed: {e}")
+        return False
+
+def test_edit_fingerprints():
+    """Test that unchanged edits are skipped and markup-only edits are reduced"""
+    print("\n🧾 Testing edit fingerprints...")
+    
+    try:
+        import asyncio
+        from keyboards import keno_grid_markup
+        from telegram_games_bot import GameBot
+        
+        class FakeMessage:
+            chat_id = 1
+            message_id = 10
+        
+        class FakeQuery:
+            message = FakeMessage()
+            
+            def __init__(self):
+                self.calls = []
+            
+            async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+                self.calls.append('text')
+            
+            async def edit_message_reply_markup(self, reply_markup=None):
+                self.calls.append('markup')
+        
+        async def scenario():
+            bot = GameBot()
+            query = FakeQuery()
+            await bot.edit_message(query, "Pick your numbers", keno_grid_markup(0))
+            await bot.edit_message(query, "Pick your numbers", keno_grid_markup(0))
+            await bot.edit_message(query, "  Pick your numbers\n", keno_grid_markup(0))
+            await bot.edit_message(query, "Pick your numbers", keno_grid_markup(1))
+            await bot.edit_message(query, "Selected 1", keno_grid_markup(1))
+            return query.calls, bot.fingerprints
+        
+        calls, cache = asyncio.run(scenario())
+        
+        if calls != ['text', 'markup', 'text']:
+            print(f"❌ Wrong edit calls: {calls}")
+            return False
+        print("✅ Unchanged edits skipped, markup-only edits use editMessageReplyMarkup")
+        
+        if (cache.unchanged, cache.markup_only, cache.full) != (2, 1, 2):
+            print(f"❌ Wrong fingerprint counters: {(cache.unchanged, cache.markup_only, cache.full)}")
+            return False
+        print("✅ Fingerprint counters updated")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Edit fingerprint test failed: {e}")
+        return False
+
+def test_crash_rounds():
+    """Test shared Crash rounds and their batch settlement"""
+    print("\n🛫 Testing shared Crash rounds...")
+    
+    try:
+        import asyncio
+        from crash_rounds import CrashRoundScheduler
+        from user_store import UserStateStore
+        
+        class FixedPoints:
+            def next(self):
+                return 2.0
+        
+        async def scenario():
+            store = UserStateStore(1000, num_shards=4)
+            rounds = CrashRoundScheduler(store, FixedPoints(), betting_window=0.05, tick_interval=0.01,
+                                         growth_rate=10.0, edit_interval=0.02, edits_per_tick=2)
+            ticks, settled = [], []
+            
+            async def on_tick(crash_round, multiplier, due):
+                ticks.append(due)
+            
+            async def on_settle(crash_round, winnings, balances):
+                settled.append((crash_round.number, winnings, balances))
+            
+            rounds.on_tick, rounds.on_settle = on_tick, on_settle
+            for user_id, target in ((1, 1.5), (2, 2.0), (3, 3.0)):
+                rounds.place_bet(user_id, user_id, 10, 100, target, store.reserve(user_id, 100))
+            duplicate = rounds.place_bet(1, 1, 10, 100, 1.5, store.reserve(1, 100))
+            await asyncio.sleep(0.08)
+            
+            # Bets placed while the round is in the air go to the next round
+            late_round = rounds.place_bet(4, 4, 10, 100, 1.1, store.reserve(4, 100))
+            while not settled:
+                await asyncio.sleep(0.01)
+            await rounds.close()
+            balances = [store.get_balance(user_id) for user_id in (1, 2, 3, 4)]
+            return duplicate, late_round.number, ticks, settled, balances, store.get_available_balance(4)
+        
+        duplicate, late_number, ticks, settled, balances, available = asyncio.run(scenario())
+        
+        if duplicate is not None or late_number != 2:
+            print(f"❌ Bets joined the wrong round (duplicate {duplicate}, late bet in round {late_number})")
+            return False
+        print("✅ One bet per user per round; late bets wait for the next round")
+        
+        if settled != [(1, [150, 200, 0], [1050, 1100, 900])] or balances != [1050, 1100, 900, 1000]:
+            print(f"❌ Wrong settlement: {settled}, balances {balances}")
+            return False
+        print("✅ Every target settled against the round's crash point in one pass")
+        
+        if not ticks or max(len(due) for due in ticks) > 2:
+            print(f"❌ Ticks did not respect the edit budget: {ticks}")
+            return False
+        print("✅ Ticker refreshes a bounded number of messages per tick")
+        
+        if available != 1000:
+            print(f"❌ Unfinished round was not refunded ({available} available)")
+            return False
+        print("✅ Bets of unfinished rounds are refunded on close")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Shared Crash round test failed: {e}")
+        return False
+
+def test_keno_draws():
+    """Test scheduled Keno draws and their batch settlement"""
+    print("\n🎟️ Testing scheduled Keno draws...")
+    
+    try:
+        import asyncio
+        import keno
+        from keno_draws import KenoDrawScheduler
+        from user_store import UserStateStore
+        
+        payouts = {0: 0, 1: 0, 2: 1, 3: 2, 4: 3}
+        store = UserStateStore(1000, num_shards=4)
+        draws = KenoDrawScheduler(payouts, store=store)
+        tickets = {1: (1, 2, 3, 4), 2: (1, 2, 11), 3: (15, 16)}
+        for user_id, numbers in tickets.items():
+            draws.queue_ticket(user_id, user_id, 10, keno.numbers_to_mask(numbers), 100, store.reserve(user_id, 100))
+        # A second ticket of user 1 in the same draw
+        draws.queue_ticket(1, 1, 11, keno.numbers_to_mask((5,)), 100, store.reserve(1, 100))
+        
+        settled, matches, winnings, balances = draws.settle_draw(keno.numbers_to_mask(range(1, 11)))
+        
+        if matches != [4, 2, 0, 1] or winnings != [300, 100, 0, 0]:
+            print(f"❌ Wrong draw settlement: matches {matches}, winnings {winnings}")
+            return False
+        print("✅ All queued tickets settled against one draw")
+        
+        if [store.get_balance(user_id) for user_id in (1, 2, 3)] != [1100, 1000, 900] or balances[-1] != 1100:
+            print(f"❌ Wrong balances after the draw: {balances}")
+            return False
+        print("✅ Wallets updated in one bulk pass")
+        
+        if draws.next_draw.number != settled.number + 1 or len(draws.next_draw):
+            print("❌ Tickets were not moved on to a fresh draw")
+            return False
+        
+        # Tickets of a draw that never happens are refunded
+        draws.queue_ticket(3, 3, 12, keno.numbers_to_mask((1,)), 100, store.reserve(3, 100))
+        asyncio.run(draws.close())
+        if store.get_available_balance(3) != 900:
+            print(f"❌ Pending ticket was not refunded ({store.get_available_balance(3)} available)")
+            return False
+        print("✅ Tickets of the next draw are refunded on close")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Scheduled Keno draw test failed: {e}")
+        return False
+
+def test_callback_codec():
+    """Test compact callback payloads and their routing"""
+    print("\n🔀 Testing callback codec...")
+    
+    try:
+        import callbacks
+        from crash import CASHOUT_TARGETS
+        
+        payloads = [(callbacks.KENO_SELECT, number) for number in range(1, 21)]
+        payloads += [(callbacks.CRASH_TARGET, target) for target in CASHOUT_TARGETS]
+        payloads += [(action, None) for action in (callbacks.MAIN_MENU, callbacks.KENO_PLAY, callbacks.CRASH_PLAY)]
+        for action, arg in payloads:
+            data = callbacks.encode(action, arg)
+            if callbacks.decode(data) != (action, arg) or len(data) > 3 or data[0] != callbacks.VERSION:
+                print(f"❌ Payload {data!r} does not round-trip to {(action, arg)}")
+                return False
+        print("✅ Payloads are versioned, at most 3 bytes and round-trip")
+        
+        legacy = {
+            'keno_select_7': (callbacks.KENO_SELECT, 7),
+            'crash_mult_2.5': (callbacks.CRASH_TARGET, 2.5),
+            'main_menu': (callbacks.MAIN_MENU, None),
+        }
+        if any(callbacks.decode(data) != decoded for data, decoded in legacy.items()):
+            print("❌ Payloads of old messages are not decoded")
+            return False
+        if callbacks.decode('keno_select_x') is not None or callbacks.decode(None) is not None:
+            print("❌ Unknown payloads were decoded")
+            return False
+        print("✅ Old payloads still decode, unknown ones are rejected")
+        
+        async def play(update, context):
+            pass
+        
+        router = callbacks.CallbackRouter({callbacks.KENO_PLAY: play})
+        catch_all = callbacks.CallbackRouter({callbacks.KENO_PLAY: play}, default=play)
+        if (router._match('1p') != (callbacks.KENO_PLAY, None) or router._match('1m') is not None
+                or not catch_all._match('1m') or not catch_all._match('anything')):
+            print("❌ Router matched the wrong payloads")
+            return False
+        print("✅ Routers match only their actions unless they have a default")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Callback codec test failed: {e}")
+        return False
+
+def test_screens():
+    """Test precomputed screens and their dynamic slots"""
+    print("\n🖼️ Testing screens...")
+    
+    try:
+        import screens
+        
+        first, second = screens.main_menu_screen(120), screens.main_menu_screen(80)
+        if first.markup is not second.markup or "**120 credits**" not in first.text or "**80 credits**" not in second.text:
+            print("❌ Main menu does not share its markup or show the balance")
+            return False
+        if screens.balance_screen(5).markup is not screens.BALANCE_MARKUP or not screens.balance_screen(5).text.endswith("5 credits"):
+            print("❌ Balance screen is wrong")
+            return False
+        print("✅ Screens fill their slots and share one markup")
+        
+        welcome = screens.welcome_screen("Ann_Lee*", 1000)
+        if "Hello Ann\\_Lee\\*!" not in welcome.text or "**1000 credits**" not in welcome.text:
+            print("❌ Welcome screen does not escape the name")
+            return False
+        print("✅ Names are escaped for Markdown")
+        
+        picker = screens.keno_pick_screen(50, 0b1011)
+        if "Bet amount: 50 credits" not in picker.text or "Selected: 3/10" not in picker.text:
+            print("❌ Keno picker shows the wrong bet or count")
+            return False
+        if "{" in screens.HELP_SCREEN.text or screens.HELP_SCREEN.text != screens.HELP_SCREEN.text.strip():
+            print("❌ Help text is not ready-made")
+            return False
+        print("✅ Keno picker and help screen are correct")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Screens test failed: {e}")
+        return False
+
+def test_worker_routing():
+    """Test consistent-hash routing of users to worker processes"""
+    print("\n👷 Testing worker routing...")
+    
+    try:
+        import tempfile
+        from cluster import HashRing, UserRouter, update_user_id
+        from fake_bot_api import callback_update, message_update
+        from user_store import UserStateStore
+        from wallet import WalletLedger
+        
+        ring = HashRing(range(3))
+        before = {user_id: ring.owner(user_id) for user_id in range(10_000)}
+        ring.add(3)
+        moved = [user_id for user_id, owner in before.items() if ring.owner(user_id) != owner]
+        if not 0.15 < len(moved) / len(before) < 0.35 or any(ring.owner(user_id) != 3 for user_id in moved):
+            print(f"❌ Adding a worker moved {len(moved)} of {len(before)} users")
+            return False
+        print("✅ A new worker takes over about a quarter of the users, from all others")
+        
+        if (update_user_id(message_update(1, 42, "/start")) != 42
+                or update_user_id(callback_update(2, 43, "1p")) != 43 or update_user_id({'update_id': 9}) != 9):
+            print("❌ Updates are attributed to the wrong user")
+            return False
+        print("✅ Updates are routed by the user who sent them")
+        
+        now = [0.0]
+        ring = HashRing(range(3))
+        router = UserRouter(ring, handoff_idle=60, clock=lambda: now[0])
+        workers = {user_id: router.route(user_id) for user_id in moved}
+        ring.add(3)
+        now[0] = 30
+        if any(router.route(user_id) != worker for user_id, worker in workers.items()):
+            print("❌ Active users were moved to the new worker")
+            return False
+        now[0] = 100
+        if any(router.route(user_id) != 3 for user_id in moved):
+            print("❌ Idle users did not move to their new worker")
+            return False
+        print("✅ Active users stay on their worker until idle, then move")
+        
+        # The old worker expiring a moved user's game must not delete the
+        # session the user's new worker now plays
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'wallet.db')
+            old_ledger, new_ledger = WalletLedger(path, owner='worker-0'), WalletLedger(path, owner='worker-1')
+            old_store = UserStateStore(1000, ledger=old_ledger, sessions=True)
+            new_store = UserStateStore(1000, ledger=new_ledger, sessions=True)
+            old_store.start_game(7, game='keno', bet_amount=50)
+            old_ledger.flush()
+            game = new_store.get_game(7)
+            new_ledger.flush()
+            old_store.end_game(7)
+            old_ledger.flush()
+            session = new_ledger.load_session(7)
+            old_ledger.close()
+            new_ledger.close()
+        if game.get('game') != 'keno' or session is None:
+            print(f"❌ Handed-off session lost: {session}")
+            return False
+        print("✅ A moved user's session survives the old worker")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Worker routing test failed: {e}")
+        return False
+
+def test_persistence():
+    """Test that Keno games in progress survive a restart"""
+    print("\n💾 Testing conversation and session persistence...")
+    
+    try:
+        import asyncio
+        import logging
+        import os
+        import tempfile
+        import warnings
+        from telegram import Update
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+        from persistence import ConversationLog, ConversationPersistence
+        from telegram_games_bot import KENO_PICK_NUMBERS, GameBot, build_application
+        from user_store import UserStateStore
+        from wallet import WalletLedger
+        logging.getLogger('telegram').setLevel(logging.CRITICAL)
+        warnings.filterwarnings('ignore', module='telegram')
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            log = ConversationLog(os.path.join(tmp, 'log.conv'))
+            log.load()
+            for user_id in range(2000):
+                log.append((user_id, user_id), 1)
+                log.append((user_id, user_id), None if user_id % 4 else 2)
+            log.close()
+            conversations = log.load()
+            log.close()
+            if len(conversations) != 500 or set(conversations.values()) != {2} or log.records != 500:
+                print(f"❌ Log replay kept {len(conversations)} conversations in {log.records} records")
+                return False
+            print("✅ Log replay keeps the last state of live conversations and compacts the file")
+            
+            async def run(updates):
+                ledger = WalletLedger(os.path.join(tmp, 'wallet.db'))
+                bot = GameBot(store=UserStateStore(1000, ledger=ledger, sessions=True))
+                application = build_application(bot, token=FAKE_TOKEN, request=FakeBotAPI(),
+                                                persistence=ConversationPersistence(os.path.join(tmp, 'state')))
+                await application.initialize()
+                await application.start()
+                for data in updates:
+                    await application.process_update(Update.de_json(data, application.bot))
+                states = dict(application.handlers[0][3]._conversations)
+                await application.stop()
+                await application.shutdown()
+                game = bot.store.get_game(7)
+                available = bot.store.get_available_balance(7)
+                ledger.close()
+                return states, game, available
+            
+            asyncio.run(run([message_update(1, 7, "/keno"), message_update(2, 7, "50"),
+                             callback_update(3, 7, "1s5", 1002)]))
+            # A new process: the number tap continues the game started before the restart
+            states, game, available = asyncio.run(run([callback_update(4, 7, "1s7", 1002)]))
+            if states.get((7, 7)) != KENO_PICK_NUMBERS or game.get('selected_mask') != 0b1010000:
+                print(f"❌ Game not restored: {states}, {game}")
+                return False
+            if available != 950 or game.get('bet_amount') != 50:
+                print(f"❌ Held bet not restored: {available} available, {game}")
+                return False
+            print("✅ Conversation state, picks and held bet survive a restart")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Persistence test failed: {e}")
+        return False
+
+def test_session_eviction():
+    """Test that abandoned sessions and idle users are dropped from memory"""
+    print("\n🧹 Testing session eviction...")
+    
+    try:
+        import asyncio
+        import logging
+        import tempfile
+        import warnings
+        from telegram import Update
+        from telegram.ext import CallbackContext
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+        from telegram_games_bot import GameBot, build_application
+        from user_store import STATE_BYTES, UserStateStore
+        from wallet import WalletLedger
+        logging.getLogger('telegram').setLevel(logging.CRITICAL)
+        warnings.filterwarnings('ignore', module='telegram')
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            ledger = WalletLedger(os.path.join(tmp, 'wallet.db'))
+            now = [0.0]
+            store = UserStateStore(1000, num_shards=1, ledger=ledger, session_ttl=60.0,
+                                   memory_budget=3 * STATE_BYTES, clock=lambda: now[0])
+            
+            # User 1 holds a bet in a game; user 2 has a bet owned by a round
+            store.start_game(1, game='keno', selected_mask=0, bet_amount=100)
+            store.update_game(1, reservation=store.reserve(1, 100))
+            store.reserve(2, 200)
+            now[0] += 5
+            store.get_balance(3)
+            store.get_balance(4)
+            if len(store) != 3 or 1 in store._shards[0].users or store.stats()['evicted_memory'] != 1:
+                print(f"❌ Least recently used user not dropped: {store.stats()}")
+                return False
+            if store.get_available_balance(1) != 1000 or store.get_game(1):
+                print("❌ Dropped session kept its bet")
+                return False
+            print("✅ Least recently used users are dropped over the memory budget, skipping held round bets")
+            
+            store.start_game(3, game='crash', bet_amount=50)
+            store.update_game(3, reservation=store.reserve(3, 50))
+            now[0] += 61
+            if store.get_available_balance(3) != 1000 or store.get_game(3) or store.stats()['expired'] != 1:
+                print(f"❌ Abandoned session not expired: {store.stats()}")
+                return False
+            now[0] += 61
+            store.sweep()
+            if 2 not in store._shards[0].users or 4 in store._shards[0].users:
+                print("❌ Sweep dropped the wrong users")
+                return False
+            stats = store.stats()
+            if stats['evicted_idle'] < 1 or stats['hits'] == 0 or stats['misses'] < 5:
+                print(f"❌ Unexpected counters: {stats}")
+                return False
+            print(f"✅ Idle sessions give back their bet after the TTL: {stats}")
+            
+            # Users stay while their last write waits for a stalled writer
+            with ledger._lock:
+                store.update_balance(5, 25, 'adjust')
+                now[0] += 61
+                store.sweep()
+                kept = 5 in store._shards[0].users
+            ledger.flush()
+            store.sweep()
+            if not kept or 5 in store._shards[0].users or store.stats()['uncommitted'] < 1:
+                print(f"❌ User dropped before their last write was committed: {store.stats()}")
+                return False
+            print("✅ Idle users are dropped only once their last write is committed")
+            
+            # A number tap after the TTL finds the game gone and ends the conversation
+            async def run():
+                api = FakeBotAPI()
+                bot = GameBot(store=UserStateStore(1000, ledger=ledger, session_ttl=60.0, clock=lambda: now[0]))
+                application = build_application(bot, token=FAKE_TOKEN, request=api)
+                await application.initialize()
+                for data in (message_update(1, 7, "/keno"), message_update(2, 7, "50")):
+                    await application.process_update(Update.de_json(data, application.bot))
+                held = bot.store.get_available_balance(7)
+                now[0] += 61
+                await application.process_update(Update.de_json(callback_update(3, 7, "1s5", 1002),
+                                                                application.bot))
+                states = dict(application.handlers[0][3]._conversations)
+                await application.shutdown()
+                return held, bot.store.get_available_balance(7), states, api._screens.get((7, 1002), ('',))[0]
+            
+            held, available, states, text = asyncio.run(run())
+            if held != 950 or available != 1000 or states or "no longer active" not in text:
+                print(f"❌ Expired game not ended: {held}, {available}, {states}, {text!r}")
+                return False
+            print("✅ Moves in an expired game end the conversation with the bet returned")
+            
+            # The Keno conversation left behind by /crash times out without touching the Crash game
+            async def switch_games():
+                api = FakeBotAPI()
+                bot = GameBot(store=UserStateStore(1000, ledger=ledger))
+                application = build_application(bot, token=FAKE_TOKEN, request=api)
+                await application.initialize()
+                updates = [Update.de_json(data, application.bot)
+                           for data in (message_update(1, 8, "/keno"), message_update(2, 8, "/crash"))]
+                for update in updates:
+                    await application.process_update(update)
+                bot.store.update_game(8, bet_amount=50, reservation=bot.store.reserve(8, 50))
+                sent = api.calls['sendMessage']
+                await bot.keno_timeout(updates[0], CallbackContext.from_update(updates[0], application))
+                kept = (bot.store.get_game(8).get('game'), bot.store.get_available_balance(8),
+                        api.calls['sendMessage'] - sent)
+                await bot.crash_timeout(updates[1], CallbackContext.from_update(updates[1], application))
+                ended = (bot.store.get_game(8), bot.store.get_available_balance(8), api.calls['sendMessage'] - sent)
+                await application.shutdown()
+                return kept, ended
+            
+            kept, ended = asyncio.run(switch_games())
+            ledger.close()
+            if kept != ('crash', 950, 0):
+                print(f"❌ Keno timeout ended the Crash game: {kept}")
+                return False
+            if ended != ({}, 1000, 1):
+                print(f"❌ Crash timeout did not end its game: {ended}")
+                return False
+            print("✅ A conversation timing out ends only its own game")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Session eviction test failed: {e}")
+        return False
+
+def test_load_harness():
+    """Test the offline load test on a few synthetic players"""
+    print("\n🏋️ Testing the load test harness...")
+    
+    try:
+        import asyncio
+        import logging
+        import warnings
+        from loadtest import percentiles, run_load
+        logging.getLogger('telegram').setLevel(logging.CRITICAL)
+        logging.getLogger('crash_rounds').setLevel(logging.ERROR)
+        warnings.filterwarnings('ignore', module='telegram')
+        
+        result = asyncio.run(run_load(users=10, games=2))
+        if result.errors or result.updates != len(result.end_to_end_latency) or result.updates < 10 * 9:
+            print(f"❌ Unexpected run: {result.updates} updates, {result.errors} errors")
+            return False
+        # Every user played one Keno game, settled right away, and one Crash
+        # game, settled when its shared round landed
+        if result.played != {'keno': 10, 'crash': 10} or result.settled != result.played:
+            print(f"❌ Games not all settled: {result.settled} of {result.played}")
+            return False
+        cuts = percentiles(result.handler_latency)
+        if not 0 < cuts[50] <= cuts[95] <= cuts[99] or result.rate <= 0:
+            print(f"❌ Bad latency percentiles: {cuts}")
+            return False
+        print(f"✅ {result.updates} updates at {result.rate:,.0f}/s, p99 handler latency {cuts[99] * 1000:.2f} ms")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Load harness test failed: {e}")
+        return False
+
+def test_concurrent_updates():
+    """Test that users are handled in parallel and each user's updates in order"""
+    print("\n🔀 Testing concurrent update processing...")
+    
+    try:
+        import asyncio
+        import random
+        from telegram import Update
+        from telegram.ext import Application, TypeHandler
+        from concurrency import MAX_PENDING_UPDATES, UserOrderedApplication
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update
+        
+        async def run():
+            application = (Application.builder().token(FAKE_TOKEN).request(FakeBotAPI())
+                           .application_class(UserOrderedApplication, {'max_concurrent': 8})
+                           .concurrent_updates(MAX_PENDING_UPDATES).build())
+            seen = {}
+            rng = random.Random(1)
+            
+            async def handle(update, context):
+                # Later taps are faster, so they would overtake without ordering
+                await asyncio.sleep(rng.random() * 0.01)
+                seen.setdefault(update.effective_user.id, []).append(update.update_id)
+            
+            application.add_handler(TypeHandler(Update, handle))
+            await application.initialize()
+            await application.start()
+            for update_id in range(180):
+                data = callback_update(update_id, update_id % 3, "1s5")
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            await application.update_queue.join()
+            await application.stop()
+            await application.shutdown()
+            return seen, application.max_in_flight
+        
+        seen, max_in_flight = asyncio.run(run())
+        if any(updates != sorted(updates) or len(updates) != 60 for updates in seen.values()) or len(seen) != 3:
+            print(f"❌ Updates of a user ran out of order: {seen}")
+            return False
+        # Eight slots, but never two updates of one user at once
+        if max_in_flight != 3:
+            print(f"❌ Expected one update in flight per user, got {max_in_flight}")
+            return False
+        print("✅ Users handled in parallel, every user's updates in arrival order")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Concurrent updates test failed: {e}")
+        return False
+
+def test_quick_bets():
+    """Test one-message Keno and Crash bets"""
+    print("\n⚡ Testing quick bets...")
+    
+    try:
+        import asyncio
+        import logging
+        import tempfile
+        import warnings
+        import keno
+        import quick_bets
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, message_update
+        from loadtest import UNPACED_RATE, UpdateTimer
+        from metrics import Metrics
+        from telegram_games_bot import STARTING_BALANCE, build_application, build_bot
+        from webserver import run_application
+        logging.getLogger('telegram').setLevel(logging.CRITICAL)
+        warnings.filterwarnings('ignore', module='telegram')
+        
+        ticket = quick_bets.parse_keno(["50", "3", "7", "12"], 10, 1000)
+        if ticket != (50, keno.numbers_to_mask([3, 7, 12])):
+            print(f"❌ Wrong Keno quick bet: {ticket}")
+            return False
+        if quick_bets.parse_crash(["100", "2.5x"], 10, 1000) != (100, 2.5):
+            print("❌ Wrong Crash quick bet")
+            return False
+        for parse, args in ((quick_bets.parse_keno, ["5", "1"]), (quick_bets.parse_keno, ["50", "3", "3"]),
+                            (quick_bets.parse_keno, ["50", "21"]), (quick_bets.parse_keno, ["50"] + ["1"] * 11),
+                            (quick_bets.parse_crash, ["100", "2.55"]), (quick_bets.parse_crash, ["100", "nan"]),
+                            (quick_bets.parse_crash, ["abc", "2"])):
+            try:
+                parse(args, 10, 1000)
+                print(f"❌ Accepted invalid quick bet {args}")
+                return False
+            except ValueError:
+                pass
+        
+        async def run(directory):
+            metrics = Metrics()
+            bot = build_bot(metrics, UNPACED_RATE, UNPACED_RATE, ledger_path=os.path.join(directory, 'wallet.db'))
+            api = FakeBotAPI()
+            application = build_application(bot, token=FAKE_TOKEN, request=api, get_updates_request=api)
+            timer = UpdateTimer()
+            timer.attach(application)
+            stop_event = asyncio.Event()
+            running = asyncio.ensure_future(run_application(application, stop_event=stop_event))
+            sent = []
+            try:
+                while not (application.updater and application.updater.running):
+                    await asyncio.sleep(0.01)
+                # The first quick bet replaces the Keno game waiting for its bet
+                for update_id, text in enumerate(["/keno", "/keno 50 3 7 12", "/keno 50 3 3", "/crash 100 2.5"]):
+                    waiter = timer.expect(update_id)
+                    api.push_update(message_update(update_id, 1, text))
+                    await waiter
+                    sent.append(api.calls['sendMessage'])
+                keno_balance = STARTING_BALANCE - 50 + int(metrics.paid.values.get(('keno',), 0))
+                return sent, bot.store.get_balance(1), bot.store.get_available_balance(1), keno_balance
+            finally:
+                stop_event.set()
+                await running
+                bot.store.ledger.close()
+        
+        with tempfile.TemporaryDirectory() as directory:
+            sent, balance, available, keno_balance = asyncio.run(run(directory))
+        # One message per command, the bad ticket costing nothing
+        if sent != [1, 2, 3, 4]:
+            print(f"❌ Expected one message per quick bet, got {sent}")
+            return False
+        if balance != keno_balance or available != keno_balance - 100:
+            print(f"❌ Wrong balance after quick bets: {balance} ({available} available), expected {keno_balance}")
+            return False
+        print("✅ Quick bets parsed in one pass and placed with one message each")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Quick bets test failed: {e}")
+        return False
+
+def test_autobet():
+    """Test multi-round autobets with stop rules and one settlement"""
+    print("\n🔁 Testing autobet...")
+    
+    try:
+        import asyncio
+        import logging
+        import tempfile
+        import warnings
+        import numpy as np
+        import autobet
+        import keno
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, message_update
+        from loadtest import UNPACED_RATE, UpdateTimer
+        from metrics import Metrics
+        from telegram_games_bot import KENO_PAYOUTS, STARTING_BALANCE, build_application, build_bot
+        from user_store import UserStateStore
+        from webserver import run_application
+        logging.getLogger('telegram').setLevel(logging.CRITICAL)
+        warnings.filterwarnings('ignore', module='telegram')
+        
+        rules, ticket = autobet.parse_keno(["100", "50", "3", "loss=500", "7", "12"], 10, 1000, 1000)
+        if rules != (100, 500, None) or ticket != (50, keno.numbers_to_mask([3, 7, 12])):
+            print(f"❌ Wrong autobet parsed: {rules}, {ticket}")
+            return False
+        for args in (["0", "50", "3"], ["1001", "50", "3"], ["10", "50", "3", "loss=-5"], ["10", "50", "3", "stake=5"],
+                     ["ten", "50", "3"], ["10", "5", "3"]):
+            try:
+                autobet.parse_keno(args, 10, 1000, 1000)
+                print(f"❌ Accepted invalid autobet {args}")
+                return False
+            except ValueError:
+                pass
+        
+        # Net after each round: -10, -20, 0, -10, +30
+        winnings = [0, 0, 30, 0, 50]
+        for rules, expected in ((autobet.AutobetRules(5, stop_loss=20), (2, 0, autobet.STOP_LOSS)),
+                                (autobet.AutobetRules(5, take_profit=10), (5, 80, autobet.TAKE_PROFIT)),
+                                (autobet.AutobetRules(5), (5, 80, autobet.ALL_ROUNDS))):
+            result = autobet.summarize(10, winnings, rules)
+            if (result.rounds, result.won, result.stopped) != expected or result.wagered != 10 * result.rounds:
+                print(f"❌ Wrong stop for {rules}: {result}")
+                return False
+        
+        # The vectorized rounds pay exactly what single rounds would
+        picks = keno.numbers_to_mask([1, 2, 3, 4, 5])
+        result = autobet.play_keno(picks, 10, autobet.AutobetRules(500), KENO_PAYOUTS, rng=np.random.default_rng(3))
+        draws = keno.draw_masks(500, rng=np.random.default_rng(3))
+        if result.payouts != [keno.payout(10, keno.count_matches(picks, int(draw)), KENO_PAYOUTS) for draw in draws]:
+            print("❌ Vectorized autobet disagrees with single-round payouts")
+            return False
+        print("✅ Autobets parsed, stopped by their rules and settled like single rounds")
+        
+        # Only the played rounds are charged; the rest of the hold comes back
+        store = UserStateStore(1000)
+        reservation = store.reserve(1, 500)
+        if store.settle(1, reservation, 100, 'keno', charge=200) != 900 or store.get_available_balance(1) != 900:
+            print(f"❌ Partial charge left {store.get_balance(1)} ({store.get_available_balance(1)} available)")
+            return False
+        
+        async def run(directory):
+            metrics = Metrics()
+            bot = build_bot(metrics, UNPACED_RATE, UNPACED_RATE, ledger_path=os.path.join(directory, 'wallet.db'))
+            api = FakeBotAPI()
+            application = build_application(bot, token=FAKE_TOKEN, request=api, get_updates_request=api)
+            timer = UpdateTimer()
+            timer.attach(application)
+            stop_event = asyncio.Event()
+            running = asyncio.ensure_future(run_application(application, stop_event=stop_event))
+            try:
+                while not (application.updater and application.updater.running):
+                    await asyncio.sleep(0.01)
+                for update_id, text in enumerate(["/autokeno 50 10 1 2 3 loss=100", "/autocrash 200 10 2",
+                                                  "/autocrash 40 10 2 profit=50"]):
+                    waiter = timer.expect(update_id)
+                    api.push_update(message_update(update_id, 1, text))
+                    await waiter
+                rounds = int(sum(metrics.settlements.values.values()))
+                net = int(sum(metrics.paid.values.values()) - sum(metrics.wagered.values.values()))
+                return (api.calls['sendMessage'], rounds, net, bot.store.get_available_balance(1),
+                        bot.store.get_game(1))
+            finally:
+                stop_event.set()
+                await running
+                bot.store.ledger.close()
+        
+        with tempfile.TemporaryDirectory() as directory:
+            sent, rounds, net, balance, game = asyncio.run(run(directory))
+        # One summary per autobet, and 2000 credits of stakes are more than the balance
+        if sent != 3 or not 2 <= rounds <= 90 or balance != STARTING_BALANCE + net:
+            print(f"❌ Unexpected autobets: {sent} messages, {rounds} rounds, balance {balance} (net {net})")
+            return False
+        # The last session records the stakes of the rounds played, not the 400 held
+        if game['bet_amount'] != 10 * game['rounds'] or game['reservation'] is not None:
+            print(f"❌ Autobet session kept the held stake: {game}")
+            return False
+        print(f"✅ {rounds} autobet rounds settled with one message per command, balance {balance}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Autobet test failed: {e}")
+        return False
+
+def test_callback_answers():
+    """Test that taps are answered once, alongside the edit, with alerts folded in"""
+    print("\n👆 Testing callback query answers...")
+    
+    try:
+        import asyncio
+        import logging
+        import time
+        import warnings
+        from telegram import Update
+        import answers
+        import callbacks
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+        from telegram_games_bot import KENO_MAX_PICKS, GameBot, build_application
+        from user_store import UserStateStore
+        logging.getLogger('telegram').setLevel(logging.CRITICAL)
+        warnings.filterwarnings('ignore', module='telegram')
+        
+        latency = 0.04
+        
+        async def run():
+            api = FakeBotAPI(latency=latency)
+            application = build_application(GameBot(store=UserStateStore(1000)), token=FAKE_TOKEN, request=api)
+            await application.initialize()
+            updates = [message_update(1, 7, "/keno"), message_update(2, 7, "50")]
+            # One pick more than allowed
+            for number in range(1, KENO_MAX_PICKS + 2):
+                updates.append(callback_update(len(updates) + 1, 7, callbacks.encode(callbacks.KENO_SELECT, number),
+                                               1002))
+            taps = []
+            for data in updates:
+                start = time.perf_counter()
+                await application.process_update(Update.de_json(data, application.bot))
+                if 'callback_query' in data:
+                    taps.append(time.perf_counter() - start)
+            await application.shutdown()
+            return api, taps
+        
+        api, taps = asyncio.run(run())
+        if api.calls['answerCallbackQuery'] != KENO_MAX_PICKS + 1 or api.calls['editMessageText'] != KENO_MAX_PICKS:
+            print(f"❌ Expected one answer per tap: {dict(api.calls)}")
+            return False
+        if api.alerts != [f"Maximum {KENO_MAX_PICKS} numbers allowed!"]:
+            print(f"❌ Alert not folded into the answer: {api.alerts}")
+            return False
+        # Answer and edit overlap: one round trip per tap instead of two
+        toggle = sorted(taps[:-1])[len(taps) // 2]
+        if toggle >= 1.5 * latency:
+            print(f"❌ Tap took {toggle * 1000:.0f} ms with {latency * 1000:.0f} ms per Bot API call")
+            return False
+        print(f"✅ Taps answered once in {toggle * 1000:.0f} ms with {latency * 1000:.0f} ms per call, alert folded in")
+        
+        # Alerts outside the router are kept until sent, and a rejected one is logged
+        async def detached():
+            api = FakeBotAPI()
+            application = build_application(GameBot(store=UserStateStore(1000)), token=FAKE_TOKEN, request=api)
+            await application.initialize()
+            query = Update.de_json(callback_update(1, 7, "1m", 1002), application.bot).callback_query
+            answers.alert(query, "First")
+            answers.alert(query, "Second")  # Telegram refuses a second answer
+            pending = len(answers._DETACHED)
+            await asyncio.gather(*answers._DETACHED)
+            await application.shutdown()
+            return api.alerts, pending, len(answers._DETACHED)
+        
+        failures = []
+        handler = logging.Handler()
+        handler.emit = failures.append
+        logging.getLogger('answers').addHandler(handler)
+        try:
+            alerts, pending, left = asyncio.run(detached())
+        finally:
+            logging.getLogger('answers').removeHandler(handler)
+        if alerts != ["First"] or pending != 2 or left or len(failures) != 1:
+            print(f"❌ Detached alerts not tracked: {alerts}, {pending} pending, {left} left, {len(failures)} logged")
+            return False
+        print("✅ Alerts outside the router are kept until sent and their failures logged")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Callback answers test failed: {e}")
+        return False
+
+def test_transport():
+    """Test the pooled Bot API transport against a local HTTP stub"""
+    print("\n🔌 Testing Bot API transport...")
+    
+    try:
+        import asyncio
+        from telegram import Bot
+        from fake_bot_api import FAKE_TOKEN, FakeBotAPI, serve
+        from metrics import Metrics
+        from telegram_games_bot import API_POOL_SIZE, build_front_bot, build_request
+        from transport import PooledRequest
+        
+        async def run():
+            api = FakeBotAPI(latency=0.02)
+            server = await serve(api)
+            metrics = Metrics()
+            request = PooledRequest(connection_pool_size=4, pool_timeout=None, metrics=metrics)
+            bot = Bot(FAKE_TOKEN, base_url=f'http://127.0.0.1:{server.port}/bot', request=request)
+            try:
+                async with bot:
+                    messages = await asyncio.gather(*(bot.send_message(chat_id, "Hi") for chat_id in range(20)))
+            finally:
+                await server.stop()
+            return api, request, metrics, messages
+        
+        api, request, metrics, messages = asyncio.run(run())
+        if [message.chat_id for message in messages] != list(range(20)) or api.calls['sendMessage'] != 20:
+            print(f"❌ Messages not delivered through the stub: {dict(api.calls)}")
+            return False
+        # 21 calls (getMe first) over four kept-alive connections, most of them waiting for one
+        if request.calls != 21 or request.connections != 4 or request.pool_wait <= 0:
+            print(f"❌ Pool not reused: {request.calls} calls, {request.connections} connections")
+            return False
+        text = metrics.render()
+        for line in ('telegram_games_bot_api_duration_seconds_count{pool="api",endpoint="sendMessage"} 20',
+                     'telegram_games_bot_api_pool_wait_seconds_count{pool="api"} 21'):
+            if line not in text:
+                print(f"❌ Missing metric: {line}")
+                return False
+        
+        pools = build_request(), build_request(get_updates=True)
+        if [pool.pool for pool in pools] != ['api', 'get_updates'] or pools[0]._client_kwargs['limits'].max_connections != API_POOL_SIZE:
+            print("❌ Configured pools not built")
+            return False
+        # The front process of the workers polls on its own pool too
+        front = build_front_bot(FAKE_TOKEN)
+        if [getattr(pool, 'pool', None) for pool in front._request] != ['get_updates', 'api']:
+            print(f"❌ Front bot not built on the configured pools: {front._request}")
+            return False
+        print(f"✅ 21 calls over {request.connections} kept-alive connections, "
+              f"{request.pool_wait / request.calls * 1000:.1f} ms mean pool wait")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Transport test failed: {e}")
+        return False
+
 def test_file_structure():
     """Test if all required files exist"""
     print("\n📁 Testing file structure...")
@@ -157,6 +1700,30 @@ def main():
         ("Imports", test_imports),
         ("Configuration", test_config),
         ("Game Logic", test_game_logic),
+        ("User Store", test_user_store),
+        ("Wallet Ledger", test_wallet_ledger),
+        ("Bet Reservations", test_bet_reservations),
+        ("Keno Engine", test_keno_engine),
+        ("RTP Simulator", test_simulator),
+        ("Keno Odds", test_keno_odds),
+        ("Crash Distributions", test_crash_distributions),
+        ("Webhook Server", test_webhook_server),
+        ("Metrics", test_metrics),
+        ("Outbound Edit Queue", test_outbox),
+        ("Edit Fingerprints", test_edit_fingerprints),
+        ("Shared Crash Rounds", test_crash_rounds),
+        ("Scheduled Keno Draws", test_keno_draws),
+        ("Callback Codec", test_callback_codec),
+        ("Screens", test_screens),
+        ("Worker Routing", test_worker_routing),
+        ("Persistence", test_persistence),
+        ("Session Eviction", test_session_eviction),
+        ("Load Harness", test_load_harness),
+        ("Concurrent Updates", test_concurrent_updates),
+        ("Quick Bets", test_quick_bets),
+        ("Autobet", test_autobet),
+        ("Callback Answers", test_callback_answers),
+        ("Bot API Transport", test_transport),
     ]
     
     results = []
@@ -0,0 +1,87 @@
+"""
+Bot API Transport for Telegram Games Bot
+========================================
+
+The HTTP connection pools the bot talks to Telegram through. Sending and
+editing messages (handlers, the outbound queue, the Crash ticker) use one
+pool, and long polling uses its own, so a `getUpdates` call that waits for
+updates never holds a connection a handler needs, and a burst of edits
+never delays the next poll.
+
+`PooledRequest` is PTB's `HTTPXRequest` with the keep-alive limits exposed
+and every call timed. PTB has no public way to set either, so it rebuilds
+the httpx client from `HTTPXRequest`'s private client arguments, which is
+why requirements.txt pins python-telegram-bot exactly. With metrics it reports the time each call spent in
+total per endpoint and the time it waited for a free connection of its
+pool. The wait is measured with httpcore's request tracing: it ends when
+the request starts connecting or, on a kept-alive connection, sending.
+"""
+
+import time
+from typing import Optional
+
+import httpx
+from telegram.request import HTTPXRequest
+
+# Events that mark a request leaving the pool queue with a connection
+_CONNECT_EVENT = 'connection.connect_tcp.started'
+_SEND_EVENTS = frozenset((_CONNECT_EVENT, 'http11.send_request_headers.started',
+                          'http2.send_request_headers.started'))
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest with tunable keep-alive, timing every call of its pool"""
+
+    def __init__(self, pool: str = 'api', connection_pool_size: int = 1, keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = 5.0, http_version: str = '1.1', read_timeout: float = 5.0,
+                 write_timeout: float = 5.0, connect_timeout: float = 5.0, pool_timeout: float = 1.0,
+                 metrics=None):
+        super().__init__(connection_pool_size=connection_pool_size, read_timeout=read_timeout,
+                         write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+                         http_version=http_version)
+        self.pool = pool
+        self.metrics = metrics
+        keepalive_connections = connection_pool_size if keepalive_connections is None else keepalive_connections
+        # HTTPXRequest takes neither limits nor event hooks, so they go into the
+        # private client arguments of PTB 20.3 (pinned in requirements.txt)
+        if not isinstance(getattr(self, '_client_kwargs', None), dict) or not hasattr(self, '_build_client'):
+            raise RuntimeError("PooledRequest needs the HTTPXRequest internals of python-telegram-bot 20.3")
+        self._client_kwargs['limits'] = httpx.Limits(max_connections=connection_pool_size,
+                                                     max_keepalive_connections=keepalive_connections,
+                                                     keepalive_expiry=keepalive_expiry)
+        self._client_kwargs['event_hooks'] = {'request': [self._trace_request]}
+        self._client = self._build_client()
+
+        # Counters
+        self.calls = 0
+        self.connections = 0  # connections opened (calls minus keep-alive reuse)
+        self.pool_wait = 0.0  # seconds spent waiting for a free connection
+
+    async def _trace_request(self, request: httpx.Request) -> None:
+        queued = time.perf_counter()
+        waiting = True
+
+        async def trace(event: str, info) -> None:
+            nonlocal waiting
+            if waiting and event in _SEND_EVENTS:
+                waiting = False
+                wait = time.perf_counter() - queued
+                self.pool_wait += wait
+                if self.metrics is not None:
+                    self.metrics.record_pool_wait(self.pool, wait)
+            if event == _CONNECT_EVENT:
+                self.connections += 1
+
+        request.extensions['trace'] = trace
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=HTTPXRequest.DEFAULT_NONE,
+                         write_timeout=HTTPXRequest.DEFAULT_NONE, connect_timeout=HTTPXRequest.DEFAULT_NONE,
+                         pool_timeout=HTTPXRequest.DEFAULT_NONE):
+        start = time.perf_counter()
+        self.calls += 1
+        try:
+            return await super().do_request(url, method, request_data, read_timeout, write_timeout,
+                                            connect_timeout, pool_timeout)
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_api_call(self.pool, url.rsplit('/', 1)[-1], time.perf_counter() - start)
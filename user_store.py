@@ -0,0 +1,421 @@
+"""
+Per-User State Store for Telegram Games Bot
+==========================================
+
+Balances and in-flight game sessions keyed by Telegram user id.
+
+Users are spread over a fixed number of shards by id, and every shard has
+its own lock, so players that land on different shards never contend with
+each other and one player's update can never touch another player's state.
+
+When a ledger is attached, a user's balance is loaded from it the first time
+the user is seen, and every change is recorded to it while the shard lock is
+still held, so ledger entries for one user are always queued in order.
+`await load(user_id)` does that first read in a thread, without the shard
+lock, so a returning user never blocks the event loop on SQLite; the bot
+calls it for every update before the handlers run.
+
+With `sessions=True` the ledger also keeps each user's game session (the
+session dict plus the bet it holds), saved on every change and read back
+the first time the user is seen after a restart, so a game in progress
+continues where it stopped.
+
+Bets go through reservations: `reserve` holds funds when a bet is accepted,
+and `settle` or `release` consumes the hold exactly once, so a round can
+never be paid twice or against funds that were already spent elsewhere.
+
+Users that stop playing do not stay in memory for good. Each shard keeps its
+users in least recently used order; with a `session_ttl`, a game session
+left without a move for that long is abandoned (its bet goes back to the
+balance) and the idle user is dropped, and with a `memory_budget` the least
+recently used users are dropped once the shards outgrow it. Dropped users
+are read back from the ledger when they return. Users with a bet owned by a
+Crash round or Keno draw stay until it is settled, and users whose last
+ledger write is not committed yet stay until it is (every write is
+numbered, see `WalletLedger.is_committed`), so a returning user is never
+read back with an old balance or session.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from wallet import WalletLedger
+
+# Memory of one user with a game in progress (state, session, reservations
+# and its shard entry), as measured with tracemalloc
+STATE_BYTES = 640
+# Users active this recently are never dropped, so a burst of new users
+# cannot push each other (or the user being looked up) out of memory
+_MIN_IDLE = 1.0
+
+
+class UserState:
+    """Balance and current game session of a single user"""
+
+    __slots__ = ('balance', 'held', 'reservations', 'next_reservation', 'game_data', 'seen', 'written')
+
+    def __init__(self, balance: int):
+        self.balance = balance
+        self.held = 0  # Sum of all open reservations
+        self.reservations: Dict[int, int] = {}  # reservation id -> amount
+        self.next_reservation = 1
+        self.game_data: Dict[str, Any] = {}
+        self.seen = 0.0  # Last access (only tracked when users are evicted)
+        self.written = 0  # Number of the user's last ledger write
+
+
+class _Shard:
+    """A slice of the user space guarded by one lock"""
+
+    __slots__ = ('lock', 'users', 'hits', 'misses', 'expired', 'evicted_idle', 'evicted_memory', 'uncommitted')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Least recently used first
+        self.users: 'OrderedDict[int, UserState]' = OrderedDict()
+
+        # Counters
+        self.hits = 0            # lookups of users in memory
+        self.misses = 0          # users loaded or created
+        self.expired = 0         # sessions abandoned after session_ttl
+        self.evicted_idle = 0    # users dropped after session_ttl
+        self.evicted_memory = 0  # users dropped for the memory budget
+        self.uncommitted = 0     # users kept because their last ledger write was not committed yet
+
+
+class UserStateStore:
+    """Sharded in-memory store of per-user balances and game sessions"""
+
+    def __init__(self, starting_balance: int, num_shards: int = 64, ledger: Optional[WalletLedger] = None,
+                 sessions: bool = False, session_ttl: Optional[float] = None, memory_budget: Optional[int] = None,
+                 clock=time.monotonic):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        if sessions and ledger is None:
+            raise ValueError("Persistent sessions need a ledger")
+        if (session_ttl is not None or memory_budget is not None) and ledger is None:
+            raise ValueError("Evicting users needs a ledger to read them back from")
+        if session_ttl is not None and session_ttl <= 0:
+            raise ValueError("session_ttl must be positive")
+
+        self.starting_balance = starting_balance
+        self.num_shards = num_shards
+        self.ledger = ledger
+        self.sessions = sessions
+        self.session_ttl = session_ttl
+        self.memory_budget = memory_budget  # bytes
+        # Most users a shard keeps (None for no limit)
+        self._capacity = max(memory_budget // (STATE_BYTES * num_shards), 1) if memory_budget is not None else None
+        self._evicting = session_ttl is not None or memory_budget is not None
+        self._clock = clock
+        self._shards = [_Shard() for _ in range(num_shards)]
+
+    def _shard(self, user_id: int) -> _Shard:
+        """Get the shard that owns user_id"""
+        return self._shards[user_id % self.num_shards]
+
+    def _state(self, shard: _Shard, user_id: int) -> UserState:
+        """Get or create the state of user_id (caller must hold shard.lock)"""
+        state = shard.users.get(user_id)
+        if state is not None:
+            shard.hits += 1
+            if self._evicting:
+                now = self._clock()
+                if state.game_data and self.session_ttl is not None and now - state.seen > self.session_ttl:
+                    self._end_session(user_id, state)
+                    shard.expired += 1
+                state.seen = now
+                shard.users.move_to_end(user_id)
+            return state
+
+        shard.misses += 1
+        balance, session = self._read(user_id) if self.ledger is not None else (None, None)
+        return self._add(shard, user_id, balance, session)
+
+    def _read(self, user_id: int) -> Tuple[Optional[int], Optional[str]]:
+        """Last committed balance and saved session of user_id (None for none)"""
+        balance = self.ledger.load_balance(user_id)
+        return balance, self.ledger.load_session(user_id) if self.sessions else None
+
+    def _add(self, shard: _Shard, user_id: int, balance: Optional[int], session: Optional[str]) -> UserState:
+        """Put a user read from the ledger (or a new one) in memory (caller must hold shard.lock)"""
+        state = shard.users[user_id] = UserState(self.starting_balance if balance is None else balance)
+        if session is not None:
+            self._restore_session(state, session)
+            # Saving it again makes the session ours, so the worker that saved
+            # it before can no longer delete it
+            self._save_session(user_id, state)
+        if self._evicting:
+            state.seen = self._clock()
+            self._evict(shard, state.seen)
+        return state
+
+    async def load(self, user_id: int) -> None:
+        """Read user_id from the ledger into memory, if it is not there, without blocking the event loop"""
+        if self.ledger is None:
+            return
+        shard = self._shard(user_id)
+        if user_id in shard.users:
+            return
+        dropped = shard.evicted_idle + shard.evicted_memory
+        balance, session = await asyncio.to_thread(self._read, user_id)
+        with shard.lock:
+            # A user of the shard dropped during the read may have been this
+            # one, with writes the read missed; the next lookup reads it again
+            if user_id not in shard.users and shard.evicted_idle + shard.evicted_memory == dropped:
+                shard.misses += 1
+                self._add(shard, user_id, balance, session)
+
+    def _evict(self, shard: _Shard, now: float) -> int:
+        """Drop the idle and, over the memory budget, least recently used users of a shard
+
+        Returns the number of users dropped (caller must hold shard.lock).
+        """
+        users = shard.users
+        ttl, capacity = self.session_ttl, self._capacity
+        dropped = 0
+        for _ in range(len(users)):
+            user_id, state = next(iter(users.items()))
+            idle = now - state.seen
+            if idle < _MIN_IDLE:
+                break
+            expired = ttl is not None and idle > ttl
+            if not expired and (capacity is None or len(users) <= capacity):
+                break
+            own = state.game_data.get('reservation')
+            if any(reservation_id != own for reservation_id in state.reservations):
+                # A round or draw still owns a bet of this user
+                users.move_to_end(user_id)
+                continue
+            # A session that is not saved would be lost, so it ends like an abandoned one
+            if state.game_data and (expired or not self.sessions):
+                self._end_session(user_id, state)
+                if expired:
+                    shard.expired += 1
+            if not self.ledger.is_committed(state.written):
+                # Read back now, the user would miss writes still on their way
+                # to the disk; a later sweep drops them once committed
+                users.move_to_end(user_id)
+                shard.uncommitted += 1
+                continue
+            del users[user_id]
+            if expired:
+                shard.evicted_idle += 1
+            else:
+                shard.evicted_memory += 1
+            dropped += 1
+        return dropped
+
+    def _end_session(self, user_id: int, state: UserState) -> bool:
+        """Clear the game session and give back its bet; True if it held one (caller must hold the shard lock)"""
+        reservation_id = state.game_data.get('reservation')
+        amount = state.reservations.pop(reservation_id, None) if reservation_id is not None else None
+        if amount is not None:
+            state.held -= amount
+        state.game_data = {}
+        if self.sessions:
+            self._save_session(user_id, state)
+        return amount is not None
+
+    def _restore_session(self, state: UserState, data: str) -> None:
+        """Load a saved game session into a new state"""
+        session = json.loads(data)
+        state.game_data = session['game']
+        # Only the session's own bet is held again; bets that belonged to
+        # rounds or draws did not survive the restart
+        reservation_id, amount = state.game_data.get('reservation'), session.get('hold')
+        if reservation_id is not None and amount is not None and amount <= state.balance:
+            state.reservations[reservation_id] = amount
+            state.held = amount
+            state.next_reservation = reservation_id + 1
+        else:
+            state.game_data['reservation'] = None
+
+    def _save_session(self, user_id: int, state: UserState) -> None:
+        """Queue the game session of user_id for the ledger (caller must hold the shard lock)"""
+        game_data = state.game_data
+        if not game_data:
+            state.written = self.ledger.save_session(user_id, None)
+            return
+        session: Dict[str, Any] = {'game': game_data}
+        amount = state.reservations.get(game_data.get('reservation'))
+        if amount is not None:
+            session['hold'] = amount
+        state.written = self.ledger.save_session(user_id, json.dumps(session, separators=(',', ':')))
+
+    def get_balance(self, user_id: int) -> int:
+        """Get current balance of user_id"""
+        shard = self._shard(user_id)
+        with shard.lock:
+            return self._state(shard, user_id).balance
+
+    def update_balance(self, user_id: int, amount: int, kind: str = 'adjust') -> int:
+        """Add amount to the balance of user_id (never below zero) and return the new balance"""
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            state.balance = max(state.balance + amount, 0)
+            if self.ledger is not None:
+                state.written = self.ledger.record(user_id, kind, amount, state.balance)
+            return state.balance
+
+    def get_available_balance(self, user_id: int) -> int:
+        """Get the balance of user_id that is not held by open reservations"""
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            return state.balance - state.held
+
+    def reserve(self, user_id: int, amount: int) -> Optional[int]:
+        """Hold amount for a bet and return the reservation id, or None if funds are short"""
+        if amount <= 0:
+            raise ValueError("Reservation amount must be positive")
+
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            if state.balance - state.held < amount:
+                return None
+            reservation_id = state.next_reservation
+            state.next_reservation += 1
+            state.reservations[reservation_id] = amount
+            state.held += amount
+            return reservation_id
+
+    def settle(self, user_id: int, reservation_id: int, payout: int, game: str = 'game',
+               charge: Optional[int] = None) -> Optional[int]:
+        """Charge a reservation, credit the payout and return the new balance
+
+        With charge only that much of the held amount is spent and the rest
+        is released (e.g. the stakes of autobet rounds that were not played).
+        Returns None if the reservation was already settled or released.
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            amount = state.reservations.pop(reservation_id, None)
+            if amount is None:
+                return None
+            state.held -= amount
+            if charge is not None:
+                amount = min(charge, amount)
+            state.balance -= amount
+            if self.ledger is not None:
+                state.written = self.ledger.record(user_id, f'{game}_bet', -amount, state.balance)
+            if payout > 0:
+                state.balance += payout
+                if self.ledger is not None:
+                    state.written = self.ledger.record(user_id, f'{game}_payout', payout, state.balance)
+            if self.sessions and reservation_id == state.game_data.get('reservation'):
+                self._save_session(user_id, state)
+            return state.balance
+
+    def settle_many(self, user_ids: Sequence[int], reservation_ids: Sequence[int], payouts: Sequence[int],
+                    game: str = 'game') -> List[Optional[int]]:
+        """Settle many reservations at once and return the new balances
+
+        Each shard lock is taken once for all of its users. As with `settle`,
+        the balance is None for reservations that were already closed.
+        """
+        by_shard: Dict[int, List[int]] = {}
+        for index, user_id in enumerate(user_ids):
+            by_shard.setdefault(user_id % self.num_shards, []).append(index)
+
+        ledger = self.ledger
+        bet_kind, payout_kind = f'{game}_bet', f'{game}_payout'
+        balances: List[Optional[int]] = [None] * len(user_ids)
+        for shard_index, indices in by_shard.items():
+            shard = self._shards[shard_index]
+            users = shard.users
+            with shard.lock:
+                # Same steps as settle, inlined for the hot loop
+                for index in indices:
+                    user_id = user_ids[index]
+                    state = users.get(user_id) or self._state(shard, user_id)
+                    amount = state.reservations.pop(reservation_ids[index], None)
+                    if amount is None:
+                        continue
+                    state.held -= amount
+                    state.balance -= amount
+                    if ledger is not None:
+                        state.written = ledger.record(user_id, bet_kind, -amount, state.balance)
+                    payout = payouts[index]
+                    if payout > 0:
+                        state.balance += payout
+                        if ledger is not None:
+                            state.written = ledger.record(user_id, payout_kind, payout, state.balance)
+                    balances[index] = state.balance
+        return balances
+
+    def release(self, user_id: int, reservation_id: int) -> bool:
+        """Return the funds of an open reservation, False if it is already closed"""
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            amount = state.reservations.pop(reservation_id, None)
+            if amount is None:
+                return False
+            state.held -= amount
+            if self.sessions and reservation_id == state.game_data.get('reservation'):
+                self._save_session(user_id, state)
+            return True
+
+    def start_game(self, user_id: int, **game_data: Any) -> Dict[str, Any]:
+        """Replace the game session of user_id and return it"""
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            state.game_data = game_data
+            if self.sessions:
+                self._save_session(user_id, state)
+            return game_data
+
+    def get_game(self, user_id: int) -> Dict[str, Any]:
+        """Get the current game session of user_id"""
+        shard = self._shard(user_id)
+        with shard.lock:
+            return self._state(shard, user_id).game_data
+
+    def end_game(self, user_id: int, game: Optional[str] = None) -> bool:
+        """End the game session of user_id, giving back its held bet; True if a bet was returned
+
+        With game, a session of any other game is left alone.
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            if not state.game_data or (game is not None and state.game_data.get('game') != game):
+                return False
+            return self._end_session(user_id, state)
+
+    def update_game(self, user_id: int, **changes: Any) -> Dict[str, Any]:
+        """Update fields of the game session of user_id and return it"""
+        shard = self._shard(user_id)
+        with shard.lock:
+            state = self._state(shard, user_id)
+            state.game_data.update(changes)
+            if self.sessions:
+                self._save_session(user_id, state)
+            return state.game_data
+
+    def sweep(self) -> int:
+        """Drop idle users (and users over the memory budget) from every shard; returns how many"""
+        if not self._evicting:
+            return 0
+        dropped = 0
+        for shard in self._shards:
+            with shard.lock:
+                dropped += self._evict(shard, self._clock())
+        return dropped
+
+    def stats(self) -> Dict[str, int]:
+        """Lookup and eviction counters summed over the shards"""
+        return {name: sum(getattr(shard, name) for shard in self._shards)
+                for name in ('hits', 'misses', 'expired', 'evicted_idle', 'evicted_memory', 'uncommitted')}
+
+    def __len__(self) -> int:
+        return sum(len(shard.users) for shard in self._shards)
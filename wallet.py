@@ -0,0 +1,286 @@
+"""
+Wallet Ledger for Telegram Games Bot
+====================================
+
+Durable record of every balance change, stored in SQLite running in WAL mode.
+The same database keeps each user's current game session, so a game in
+progress survives a restart.
+
+Handlers never wait on the disk: `record` only puts the entry on a queue. A
+writer thread collects entries for up to `flush_interval_ms` and commits the
+whole group in one transaction, so one fsync covers every bet and payout
+that arrived in that window. With `batching=False` each entry is committed
+on its own, which is what the benchmark compares against.
+
+Session writes travel the same queue; only the latest one per user in a
+group is written, in the transaction that commits the group's entries.
+`load_balance` and `load_session` read through a second connection, so a
+read never waits for a group commit and its fsync.
+
+Several processes may share one database (see cluster.py). Each session
+row records the `owner` that wrote it last, and a ledger only deletes
+sessions it owns, so a worker that still holds a user who has moved on
+cannot delete the session the user's new worker is playing.
+
+A group whose commit fails (the database is locked by another process, the
+disk is full) is rolled back, logged and retried every `retry_interval`
+seconds together with whatever was queued meanwhile, so entries are never
+dropped while the writer runs. `flush` returns False while commits fail.
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (user_id, kind, amount, balance_after, created_at)
+LedgerEntry = Tuple[int, str, int, int, float]
+
+
+class SessionWrite(NamedTuple):
+    """The new session of a user (None deletes it)"""
+    user_id: int
+    data: Optional[str]
+
+
+# Marks a wait for queued items that timed out
+_NOTHING_QUEUED = object()
+
+
+class _FlushWaiter:
+    """A flush call waiting for the writer to reach it"""
+
+    __slots__ = ('done', 'committed')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.committed = False
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    user_id INTEGER PRIMARY KEY,
+    balance INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    owner TEXT NOT NULL DEFAULT ''
+);
+"""
+
+
+class WalletLedger:
+    """SQLite-backed wallet ledger with group-committed writes"""
+
+    def __init__(self, path: str, flush_interval_ms: float = 5, batching: bool = True,
+                 retry_interval: float = 0.5, owner: str = ''):
+        self.path = path
+        self.owner = owner  # written with every session; only its owner deletes one
+        self.flush_interval = flush_interval_ms / 1000
+        self.batching = batching
+        self.retry_interval = retry_interval
+        self.commits = 0
+        self.entries_written = 0
+        self.write_errors = 0  # commits that failed and were rolled back
+        # Writes are numbered in queue order: `queued` is the number of the
+        # last one queued, `committed` of the last one committed
+        self.queued = 0
+        self.committed = 0
+
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._migrate()
+        self._lock = threading.Lock()
+        # Reads have a connection of their own: in WAL mode they see the last
+        # commit and never wait for a group commit (and its fsync) to finish
+        self._reader = self._connect()
+        self._read_lock = threading.Lock()
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._queue_lock = threading.Lock()  # keeps write numbers in queue order
+        self._writer: Optional[threading.Thread] = None
+
+        if batching:
+            self._writer = threading.Thread(target=self._run_writer, name="wallet-ledger", daemon=True)
+            self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection in WAL mode that fsyncs on every commit"""
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _migrate(self) -> None:
+        """Add the columns newer versions need to a database made by an older one"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if 'owner' not in columns:
+            try:
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+            except sqlite3.OperationalError:
+                pass  # Another worker added it first
+
+    def load_balance(self, user_id: int) -> Optional[int]:
+        """Get the last committed balance of user_id, or None for unknown users"""
+        with self._read_lock:
+            row = self._reader.execute("SELECT balance FROM balances WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_session(self, user_id: int) -> Optional[str]:
+        """Get the last committed game session of user_id, or None"""
+        with self._read_lock:
+            row = self._reader.execute("SELECT data FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def save_session(self, user_id: int, data: Optional[str]) -> int:
+        """Queue the new game session of user_id (None deletes it); returns the write's number"""
+        return self._submit(SessionWrite(user_id, data))
+
+    def record(self, user_id: int, kind: str, amount: int, balance: int) -> int:
+        """Queue a balance change (or write it right away when batching is off); returns the write's number"""
+        return self._submit((user_id, kind, amount, balance, time.time()))
+
+    def is_committed(self, number: int) -> bool:
+        """Whether the write with this number (and every earlier one) is committed"""
+        return number <= self.committed
+
+    def _submit(self, item) -> int:
+        with self._queue_lock:
+            self.queued += 1
+            if self.batching:
+                self._queue.put(item)
+            elif isinstance(item, SessionWrite):
+                self._write([], [item])
+            else:
+                self._write([item], [])
+            return self.queued
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every entry queued so far is committed
+
+        Returns False on timeout or when the commit failed (the entries stay
+        queued and are retried).
+        """
+        if not self.batching:
+            return True
+        waiter = _FlushWaiter()
+        self._queue.put(waiter)
+        return waiter.done.wait(timeout) and waiter.committed
+
+    def close(self) -> None:
+        """Commit pending entries, stop the writer and close the database"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._read_lock:
+            self._reader.close()
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, entries: List[LedgerEntry], sessions: List[SessionWrite]) -> None:
+        """Commit a group of entries and session writes in a single transaction (rolled back if it fails)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._write_group(entries, sessions)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self.commits += 1
+            self.entries_written += len(entries)
+            self.committed += len(entries) + len(sessions)
+
+    def _write_group(self, entries: List[LedgerEntry], sessions: List[SessionWrite]) -> None:
+        """Insert a group inside the open transaction (caller must hold self._lock)"""
+        if entries:
+            self._conn.executemany(
+                "INSERT INTO entries (user_id, kind, amount, balance, created_at) VALUES (?, ?, ?, ?, ?)",
+                entries
+            )
+            # Entries are queued in order, so the last one per user wins
+            self._conn.executemany(
+                "INSERT INTO balances (user_id, balance) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET balance = excluded.balance",
+                [(entry[0], entry[3]) for entry in entries]
+            )
+        if sessions:
+            latest: Dict[int, Optional[str]] = {}
+            for write in sessions:
+                latest[write.user_id] = write.data
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions (user_id, data, owner) VALUES (?, ?, ?)",
+                [(user_id, data, self.owner) for user_id, data in latest.items() if data is not None]
+            )
+            # A session another worker has taken over since is not ours to delete
+            self._conn.executemany(
+                "DELETE FROM sessions WHERE user_id = ? AND owner = ?",
+                [(user_id, self.owner) for user_id, data in latest.items() if data is None]
+            )
+
+    def _run_writer(self) -> None:
+        """Collect queued entries into groups and commit them, retrying groups that fail"""
+        running = True
+        # A group whose commit failed stays here and goes out with the next one
+        entries: List[LedgerEntry] = []
+        sessions: List[SessionWrite] = []
+        while running:
+            waiters: List[_FlushWaiter] = []
+            try:
+                # A failed group is retried after a pause even if nothing else arrives
+                item = self._queue.get(timeout=self.retry_interval if entries or sessions else None)
+            except queue.Empty:
+                item = _NOTHING_QUEUED
+            deadline = time.monotonic() + self.flush_interval
+
+            while item is not _NOTHING_QUEUED:
+                if item is None:
+                    running = False
+                elif isinstance(item, _FlushWaiter):
+                    waiters.append(item)
+                elif isinstance(item, SessionWrite):
+                    sessions.append(item)
+                else:
+                    entries.append(item)
+
+                remaining = deadline - time.monotonic()
+                if not running or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            committed = True
+            if entries or sessions:
+                try:
+                    self._write(entries, sessions)
+                except sqlite3.Error as e:
+                    committed = False
+                    self.write_errors += 1
+                    logger.error(f"Committing {len(entries)} wallet entries and {len(sessions)} session writes "
+                                 f"failed, retrying in {self.retry_interval}s: {e}")
+                else:
+                    entries, sessions = [], []
+            for waiter in waiters:
+                waiter.committed = committed
+                waiter.done.set()
+
+        if entries or sessions:
+            logger.error(f"Wallet ledger closed with {len(entries)} entries and {len(sessions)} session writes "
+                         f"that could not be committed")
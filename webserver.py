@@ -0,0 +1,232 @@
+"""
+HTTP Server for Telegram Games Bot
+==================================
+
+One asyncio HTTP/1.1 server on `PORT` that answers health checks, serves
+metrics and, in webhook mode, receives updates from Telegram.
+
+Webhook requests are checked against the secret token Telegram sends in the
+`X-Telegram-Bot-Api-Secret-Token` header, put on the application's update
+queue and acknowledged right away; handlers run after the response is sent.
+Connections are kept alive, so Telegram can reuse them for later updates.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# (status, content type, body)
+Response = Tuple[int, str, bytes]
+RouteHandler = Callable[[Dict[str, str], bytes], Awaitable[Response]]
+
+SECRET_TOKEN_HEADER = 'x-telegram-bot-api-secret-token'
+HEALTH_TEXT = b'Telegram Bot is running!'
+MAX_BODY_SIZE = 1024 * 1024
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class BotHTTPServer:
+    """Minimal keep-alive HTTP server with exact-path routing"""
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8080):
+        self.host = host
+        self.port = port
+        self.routes: Dict[Tuple[str, str], RouteHandler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    def add_route(self, method: str, path: str, handler: RouteHandler) -> None:
+        """Serve requests for method and path with handler"""
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self) -> None:
+        """Start listening"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """Stop listening and close open connections"""
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve requests on one connection until the client closes it"""
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                length = headers.get('content-length') or '0'
+                if not (length.isascii() and length.isdigit()):
+                    await self._respond(writer, (400, 'text/plain', b''), keep_alive=False)
+                    return
+                length = int(length)
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, (413, 'text/plain', b''), keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b''
+
+                path = target.split('?', 1)[0]
+                handler = self.routes.get((method.upper(), path))
+                if handler is not None:
+                    try:
+                        response = await handler(headers, body)
+                    except Exception:
+                        logger.exception(f"Error while serving {method} {path}")
+                        response = (500, 'text/plain', b'')
+                elif any(route_path == path for _, route_path in self.routes):
+                    response = (405, 'text/plain', b'')
+                else:
+                    response = (404, 'text/plain', b'')
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                await self._respond(writer, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        """Write a response"""
+        status, content_type, body = response
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+
+async def health_check(headers: Dict[str, str], body: bytes) -> Response:
+    """Answer health checks"""
+    return 200, 'text/plain', HEALTH_TEXT
+
+
+def update_route(handle: Callable[[Dict], None], secret_token: Optional[str]) -> RouteHandler:
+    """Build a route that passes the JSON of incoming webhook updates to handle"""
+
+    async def receive_update(headers: Dict[str, str], body: bytes) -> Response:
+        if secret_token and not hmac.compare_digest(headers.get(SECRET_TOKEN_HEADER, ''), secret_token):
+            return 403, 'text/plain', b''
+        try:
+            handle(json.loads(body))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            logger.warning("Ignoring malformed webhook update")
+            return 400, 'text/plain', b''
+        return 200, 'text/plain', b''
+
+    return receive_update
+
+
+def webhook_route(application: Application, secret_token: Optional[str]) -> RouteHandler:
+    """Build the route that queues incoming webhook updates"""
+
+    def queue_update(data: Dict) -> None:
+        # Acknowledge now; the application processes the queue on its own
+        application.update_queue.put_nowait(Update.de_json(data, application.bot))
+
+    return update_route(queue_update, secret_token)
+
+
+def stop_on_signals(stop_event: asyncio.Event) -> None:
+    """Set stop_event on SIGINT and SIGTERM"""
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Not supported on this platform; Ctrl+C still raises KeyboardInterrupt
+
+
+async def run_application(application: Application, port: Optional[int] = None, webhook_url: Optional[str] = None,
+                          webhook_path: str = '/telegram', secret_token: Optional[str] = None,
+                          stop_event: Optional[asyncio.Event] = None, metrics: Optional[Metrics] = None) -> None:
+    """Run the application on one event loop, fed by a webhook or by polling
+
+    The HTTP server is started when a port is given (always in webhook mode)
+    and serves health checks on `/` and `/health`, plus `/metrics` when
+    metrics are given.
+    """
+    stop_event = stop_event or asyncio.Event()
+    stop_on_signals(stop_event)
+
+    if webhook_url and not port:
+        raise ValueError("Webhook mode needs a port for the HTTP server")
+
+    server = None
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await application.start()
+
+        if port:
+            server = BotHTTPServer(port=port)
+            server.add_route('GET', '/', health_check)
+            server.add_route('GET', '/health', health_check)
+            if metrics is not None:
+                server.add_route('GET', '/metrics', metrics.scrape)
+            if webhook_url:
+                server.add_route('POST', webhook_path, webhook_route(application, secret_token))
+            await server.start()
+            print(f"🌐 HTTP server running on port {server.port}" + (" (webhook mode)" if webhook_url else ""))
+
+        # Register the webhook only once the server can take updates
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip('/') + webhook_path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+        await stop_event.wait()
+    finally:
+        if server is not None:
+            await server.stop()
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)